@@ -15,6 +15,7 @@ from telegram.ext import (
 )
 from config import ADMIN_BOT_TOKEN
 from database import DatabaseManager
+from async_database import AsyncDatabaseManager
 from ai_service import AIService
 
 # Настройка логирования
@@ -24,6 +25,7 @@ logger = setup_logging('admin_bot')
 class AdminBot:
     def __init__(self):
         self.db_manager = DatabaseManager()
+        self.db = AsyncDatabaseManager(self.db_manager)
         self.ai_service = AIService(self.db_manager)
         # Список ID администраторов
         self.admin_users = [1621867102]  # Ваш Telegram ID
@@ -45,6 +47,7 @@ class AdminBot:
             [InlineKeyboardButton("👥 Пользователи", callback_data="users")],
             [InlineKeyboardButton("❓ Популярные вопросы", callback_data="popular_questions")],
             [InlineKeyboardButton("📚 Переходы в канал", callback_data="channel_stats")],
+            [InlineKeyboardButton("💰 Расход токенов", callback_data="token_usage")],
             [InlineKeyboardButton("🔄 Обновить кэш", callback_data="refresh_cache")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -63,7 +66,7 @@ class AdminBot:
             await query.edit_message_text("❌ У вас нет доступа к админ-панели.")
             return
         
-        stats = self.ai_service.get_statistics()
+        stats = await self.db.get_statistics()
         
         if stats:
             stats_text = f"""
@@ -95,22 +98,12 @@ class AdminBot:
             return
         
         try:
-            import sqlite3
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT user_id, username, first_name, total_requests, last_activity
-                    FROM users 
-                    ORDER BY total_requests DESC 
-                    LIMIT 10
-                ''')
-                
-                users = cursor.fetchall()
-                
-                users_text = "👥 Топ-10 активных пользователей:\n\n"
-                for i, (user_id, username, first_name, requests, last_activity) in enumerate(users, 1):
-                    name = first_name or username or f"ID: {user_id}"
-                    users_text += f"{i}. {name} - {requests} запросов\n"
+            users = await self.db.get_top_users(10)
+            
+            users_text = "👥 Топ-10 активных пользователей:\n\n"
+            for i, (user_id, username, first_name, requests, last_activity) in enumerate(users, 1):
+                name = first_name or username or f"ID: {user_id}"
+                users_text += f"{i}. {name} - {requests} запросов\n"
                 
         except Exception as e:
             logger.error(f"Ошибка получения пользователей: {e}")
@@ -130,7 +123,7 @@ class AdminBot:
             await query.edit_message_text("❌ У вас нет доступа к админ-панели.")
             return
         
-        stats = self.ai_service.get_statistics()
+        stats = await self.db.get_statistics()
         popular_questions = stats.get('popular_questions', [])
         
         if popular_questions:
@@ -155,26 +148,15 @@ class AdminBot:
             return
         
         try:
-            import sqlite3
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT COUNT(*) as total_visits,
-                           COUNT(DISTINCT user_id) as unique_visitors
-                    FROM channel_visits 
-                    WHERE visited_at >= datetime('now', '-7 days')
-                ''')
-                
-                result = cursor.fetchone()
-                total_visits, unique_visitors = result
-                
-                channel_text = f"""
+            total_visits, unique_visitors = await self.db.get_channel_visit_stats(7)
+            
+            channel_text = f"""
 📚 Статистика переходов в канал за 7 дней:
 
 📊 Всего переходов: {total_visits}
 👥 Уникальных посетителей: {unique_visitors}
 📈 Среднее переходов на пользователя: {round(total_visits / max(unique_visitors, 1), 1)}
-                """
+            """
                 
         except Exception as e:
             logger.error(f"Ошибка получения статистики канала: {e}")
@@ -185,6 +167,45 @@ class AdminBot:
         
         await query.edit_message_text(channel_text, reply_markup=reply_markup)
     
+    async def token_usage_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик кнопки расхода токенов"""
+        query = update.callback_query
+        await query.answer()
+        
+        if not self.is_admin(query.from_user.id):
+            await query.edit_message_text("❌ У вас нет доступа к админ-панели.")
+            return
+        
+        try:
+            by_type = await self.db.get_token_usage(7, 'question_type')
+            by_key = await self.db.get_token_usage(7, 'api_key')
+            by_model = await self.db.get_token_usage(7, 'model')
+            
+            if by_type:
+                usage_text = "💰 Расход токенов за 7 дней по типам запросов:\n\n"
+                for row in by_type:
+                    usage_text += (f"• {row['question_type'] or 'без типа'}: {row['total_tokens']} "
+                                   f"({row['calls']} вызовов, ~{round(row['avg_tokens'])} на вызов, "
+                                   f"{round(row['avg_latency'], 1)} с)\n")
+                usage_text += "\n🔑 По ключам:\n"
+                for row in by_key:
+                    usage_text += f"• {row['api_key']}: {row['total_tokens']} ({row['calls']} вызовов)\n"
+                usage_text += "\n🧠 По моделям:\n"
+                for row in by_model:
+                    usage_text += (f"• {row['model'] or 'не указана'}: {row['total_tokens']} "
+                                   f"({row['calls']} вызовов, {round(row['avg_latency'], 1)} с)\n")
+            else:
+                usage_text = "💰 Данных о расходе токенов пока нет"
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения расхода токенов: {e}")
+            usage_text = "❌ Ошибка получения расхода токенов"
+        
+        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(usage_text, reply_markup=reply_markup)
+    
     async def refresh_cache_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик кнопки обновления кэша"""
         query = update.callback_query
@@ -216,6 +237,7 @@ class AdminBot:
             [InlineKeyboardButton("👥 Пользователи", callback_data="users")],
             [InlineKeyboardButton("❓ Популярные вопросы", callback_data="popular_questions")],
             [InlineKeyboardButton("📚 Переходы в канал", callback_data="channel_stats")],
+            [InlineKeyboardButton("💰 Расход токенов", callback_data="token_usage")],
             [InlineKeyboardButton("🔄 Обновить кэш", callback_data="refresh_cache")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -225,10 +247,14 @@ class AdminBot:
             reply_markup=reply_markup
         )
     
+    async def shutdown(self, application: Application):
+        """Освобождение ресурсов при остановке админ-бота"""
+        self.db.close()
+    
     def run(self):
         """Запуск админ-бота"""
         # Создаем приложение
-        application = Application.builder().token(ADMIN_BOT_TOKEN).build()
+        application = Application.builder().token(ADMIN_BOT_TOKEN).post_shutdown(self.shutdown).build()
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start_command))
@@ -236,6 +262,7 @@ class AdminBot:
         application.add_handler(CallbackQueryHandler(self.users_callback, pattern="users"))
         application.add_handler(CallbackQueryHandler(self.popular_questions_callback, pattern="popular_questions"))
         application.add_handler(CallbackQueryHandler(self.channel_stats_callback, pattern="channel_stats"))
+        application.add_handler(CallbackQueryHandler(self.token_usage_callback, pattern="token_usage"))
         application.add_handler(CallbackQueryHandler(self.refresh_cache_callback, pattern="refresh_cache"))
         application.add_handler(CallbackQueryHandler(self.back_to_menu_callback, pattern="back_to_menu"))
         
@@ -246,7 +273,7 @@ class AdminBot:
     async def run_async(self):
         """Асинхронный запуск админ-бота"""
         # Создаем приложение
-        application = Application.builder().token(ADMIN_BOT_TOKEN).build()
+        application = Application.builder().token(ADMIN_BOT_TOKEN).post_shutdown(self.shutdown).build()
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start_command))
@@ -254,6 +281,7 @@ class AdminBot:
         application.add_handler(CallbackQueryHandler(self.users_callback, pattern="users"))
         application.add_handler(CallbackQueryHandler(self.popular_questions_callback, pattern="popular_questions"))
         application.add_handler(CallbackQueryHandler(self.channel_stats_callback, pattern="channel_stats"))
+        application.add_handler(CallbackQueryHandler(self.token_usage_callback, pattern="token_usage"))
         application.add_handler(CallbackQueryHandler(self.refresh_cache_callback, pattern="refresh_cache"))
         application.add_handler(CallbackQueryHandler(self.back_to_menu_callback, pattern="back_to_menu"))
         
@@ -2,56 +2,390 @@
 Сервис для работы с Mistral API
 """
 
+import asyncio
 import requests
+import httpx
 import json
-import hashlib
 import logging
 import time
 import random
-from typing import Optional, Dict, Any
-from config import MISTRAL_API_KEYS, MISTRAL_API_URL
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, AsyncIterator, Awaitable, Callable, Tuple
+from config import (
+    MISTRAL_API_KEYS,
+    MISTRAL_API_URL,
+    MISTRAL_MODEL,
+    MISTRAL_CONNECT_TIMEOUT,
+    MISTRAL_READ_TIMEOUT,
+    MISTRAL_MAX_CONNECTIONS,
+    KEY_COOLDOWN_SECONDS,
+    KEY_CIRCUIT_FAILURES,
+    KEY_CIRCUIT_OPEN_SECONDS,
+    KEY_LATENCY_WINDOW,
+    CLASSIFIER_MODEL_PATH,
+    CLASSIFIER_RELEVANCE_CONFIDENCE,
+    CLASSIFIER_TYPE_CONFIDENCE,
+    COMPACT_PROMPT_MAX_QUESTION_TOKENS
+)
 from prompts import (
     MAIN_SYSTEM_PROMPT, 
+    MAIN_SYSTEM_PROMPT_COMPACT,
     RELEVANCE_CHECK_PROMPT, 
+    RELEVANCE_BATCH_PROMPT,
     QUESTION_TYPE_PROMPTS,
     FAQ_CACHE,
-    ERROR_PROMPT
+    ERROR_PROMPT,
+    STREAM_INTERRUPTED_NOTICE
 )
 from database import DatabaseManager
+from telemetry import TelemetryBuffer
+from answer_cache import AnswerCache
+from relevance_cache import RelevanceCache
+from text_normalizer import normalize_question, question_key
+from single_flight import SingleFlight
+from semantic_cache import SemanticCache
+from faq_index import FaqIndex
+from speculation import SpeculationBudget
+from token_budget import AnswerTokenBudget, estimate_tokens
+from conversation_store import ConversationStore, is_follow_up
+from model_router import ModelRoute, ModelRouter
+from hedging import HedgePolicy
+from relevance_batcher import BatchRequestFailed, RelevanceBatcher, parse_batch_verdicts
+from local_classifier import QuestionClassifier
+from keyword_matcher import KeywordMatcher, match_keywords, classify_question_type
 
 logger = logging.getLogger(__name__)
 
+# Пользователь, для которого выполняется текущий запрос к ИИ (учет токенов).
+# Задачи asyncio наследуют значение, поэтому общий запрос single-flight
+# или пакетной проверки релевантности учитывается на того, кто его начал.
+current_user_id: ContextVar[Optional[int]] = ContextVar('current_user_id', default=None)
+
+# Фразы FAQ_CACHE, которые ищутся в тексте вопроса за один проход
+FAQ_PHRASES = KeywordMatcher({phrase: [phrase] for phrase in FAQ_CACHE})
+
+class KeyHealth:
+    """Состояние одного API ключа: задержки, ошибки, паузы и circuit breaker"""
+    
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0  # ответы 4xx: ошибка в запросе, а не в ключе
+        self.throttled = 0
+        self.in_flight = 0
+        self.error_rate = 0.0  # экспоненциальное среднее доли ошибок
+        self.latency_ewma = 0.0
+        self.latencies = deque(maxlen=KEY_LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.circuit_open_until = 0.0
+    
+    def state(self, now: float) -> str:
+        """Текущее состояние ключа"""
+        if self.circuit_open_until > now:
+            return 'open'
+        if self.cooldown_until > now:
+            return 'cooldown'
+        if self.consecutive_failures >= KEY_CIRCUIT_FAILURES:
+            return 'half-open'  # пауза circuit breaker истекла, пробуем один запрос
+        return 'ok'
+    
+    def score(self) -> float:
+        """Оценка ключа: чем меньше, тем лучше"""
+        latency = self.latency_ewma or 1.0  # новый ключ считаем средним
+        return latency * (1 + 4 * self.error_rate) * (1 + self.in_flight)
+    
+    def percentile(self, percent: float) -> float:
+        """Перцентиль задержки по последним запросам"""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * percent / 100), len(ordered) - 1)
+        return ordered[index]
+
+class ApiKeyPool:
+    """
+    Пул API ключей Mistral с учетом их здоровья.
+    
+    Для каждого ключа учитываются задержка, доля ошибок и ответы 429:
+    - после 429 ключ отдыхает Retry-After секунд (или KEY_COOLDOWN_SECONDS)
+    - после KEY_CIRCUIT_FAILURES ошибок подряд (5xx, таймауты, сбои
+      соединения) цепь размыкается на KEY_CIRCUIT_OPEN_SECONDS, затем
+      пропускается один пробный запрос
+    - прочие ответы 4xx вызваны самим запросом и здоровье ключа не меняют
+    - из доступных ключей выбирается ключ с лучшей оценкой
+    """
+    
+    def __init__(self, api_keys: List[str]):
+        self._keys = {key: KeyHealth(key) for key in api_keys}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def acquire(self, exclude: Optional[set] = None) -> Optional[str]:
+        """Выбор самого здорового доступного ключа (None - доступных нет)"""
+        now = time.time()
+        with self._lock:
+            candidates = [
+                health for key, health in self._keys.items()
+                if not (exclude and key in exclude) and health.state(now) in ('ok', 'half-open')
+            ]
+            if not candidates:
+                return None
+            # Небольшой случайный разброс, чтобы равные ключи нагружались равномерно
+            health = min(candidates, key=lambda item: item.score() * random.uniform(0.9, 1.1))
+            if health.state(now) == 'half-open':
+                # Пробный запрос: до его результата ключ снова недоступен
+                health.circuit_open_until = now + KEY_CIRCUIT_OPEN_SECONDS
+            health.in_flight += 1
+            return health.api_key
+    
+    def release(self, api_key: str):
+        """Освобождение ключа без учета результата (запрос отменен)"""
+        with self._lock:
+            health = self._keys[api_key]
+            health.in_flight = max(health.in_flight - 1, 0)
+    
+    def report_success(self, api_key: str, latency: float):
+        """Учет успешного ответа"""
+        with self._lock:
+            health = self._keys[api_key]
+            health.in_flight = max(health.in_flight - 1, 0)
+            health.requests += 1
+            health.latencies.append(latency)
+            health.latency_ewma = latency if not health.latency_ewma else 0.8 * health.latency_ewma + 0.2 * latency
+            health.error_rate *= 0.8
+            health.consecutive_failures = 0
+            health.circuit_open_until = 0.0
+    
+    def report_failure(self, api_key: str, latency: float, status_code: Optional[int] = None,
+                       retry_after: Optional[float] = None):
+        """
+        Учет ошибки: 429 - пауза ключа, повторные 5xx и сбои без ответа
+        (status_code=None) - размыкание цепи. Остальные 4xx (400, 422...)
+        означают, что ключ ответил, а отклонен сам запрос.
+        """
+        now = time.time()
+        with self._lock:
+            health = self._keys[api_key]
+            health.in_flight = max(health.in_flight - 1, 0)
+            health.requests += 1
+            
+            if status_code == 429:
+                health.throttled += 1
+                health.cooldown_until = now + (retry_after if retry_after else KEY_COOLDOWN_SECONDS)
+                return
+            
+            if status_code is not None and status_code < 500:
+                health.rejected += 1
+                # Ключ работает: пробный запрос после размыкания цепи тоже считается удачным
+                health.consecutive_failures = 0
+                health.circuit_open_until = 0.0
+                return
+            
+            health.errors += 1
+            health.latencies.append(latency)
+            health.error_rate = 0.8 * health.error_rate + 0.2
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= KEY_CIRCUIT_FAILURES:
+                health.circuit_open_until = now + KEY_CIRCUIT_OPEN_SECONDS
+                logger.warning(f"Ключ {api_key[:10]}... отключен на {KEY_CIRCUIT_OPEN_SECONDS} с после {health.consecutive_failures} ошибок подряд")
+    
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """Статистика по ключам (ключи замаскированы)"""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'key': f"{key[:6]}...",
+                    'state': health.state(now),
+                    'requests': health.requests,
+                    'errors': health.errors,
+                    'rejected': health.rejected,
+                    'throttled': health.throttled,
+                    'error_rate': round(health.error_rate, 3),
+                    'in_flight': health.in_flight,
+                    'latency_p50': round(health.percentile(50), 3),
+                    'latency_p95': round(health.percentile(95), 3),
+                    'cooldown_left': round(max(health.cooldown_until, health.circuit_open_until) - now, 1)
+                    if health.state(now) in ('cooldown', 'open') else 0
+                }
+                for key, health in self._keys.items()
+            ]
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбор заголовка Retry-After (только число секунд)"""
+    try:
+        return max(float(value), 0) if value else None
+    except ValueError:
+        return None
+
+class StreamInterrupted(Exception):
+    """Поток ответа оборвался после первых фрагментов; text - уже полученная часть ответа"""
+    
+    def __init__(self, text: str = ''):
+        super().__init__('поток ответа оборвался')
+        self.text = text
+
+async def iter_sse_content(response: httpx.Response, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+    """
+    Фрагменты текста из потокового ответа Mistral API (server-sent events).
+    
+    Блок usage последнего события (расход токенов) копируется в usage.
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        event = json.loads(data)
+        if usage is not None and event.get('usage'):
+            usage.update(event['usage'])
+        choices = event.get('choices') or []
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                yield content
+
 class AIService:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, telemetry: Optional[TelemetryBuffer] = None):
         # Фильтруем только валидные API ключи
         self.api_keys = [key for key in MISTRAL_API_KEYS if key and key not in ['YOUR_MISTRAL_API_KEY_1_HERE', 'YOUR_MISTRAL_API_KEY_2_HERE', 'YOUR_MISTRAL_API_KEY_3_HERE', '']]
         self.api_url = MISTRAL_API_URL
         self.db_manager = db_manager
-        self.current_key_index = 0
+        # Логи запросов пишем через буфер телеметрии, если он передан
+        self.request_log = telemetry or db_manager
+        self.key_pool = ApiKeyPool(self.api_keys)
+        # Системные промпты (полный и сокращенный) для каждого типа вопроса собираются один раз
+        self.system_prompts = {
+            (question_type, compact): self._assemble_system_prompt(question_type, compact)
+            for question_type in QUESTION_TYPE_PROMPTS
+            for compact in (False, True)
+        }
+        # max_tokens ответа по длине прошлых ответов того же типа
+        self.answer_budget = AnswerTokenBudget()
+        self.answer_budget.preload(db_manager, QUESTION_TYPE_PROMPTS)
+        # Модель, лимит токенов и температура ответа по типу вопроса
+        self.router = ModelRouter()
+        # Кэш ответов в памяти перед faq_cache, прогретый популярными ответами
+        self.answer_cache = AnswerCache(db_manager, writer=self.request_log)
+        self.answer_cache.preload()
+        # Ответы ИИ на похожие вопросы (сравнение по TF-IDF векторам)
+        self.semantic_cache = SemanticCache(db_manager)
+        self.semantic_cache.preload()
+        # Ранжированный поиск по вопросам FAQ и сохраненным вопросам faq_cache
+        self.faq_index = FaqIndex()
+        self._load_faq_index()
+        # Вердикты проверки релевантности через ИИ (повторные вопросы - без запроса)
+        self.relevance_cache = RelevanceCache(db_manager, writer=self.request_log)
+        self.relevance_cache.purge()
+        # Локальная модель, обученная на таблице requests (train_classifier.py)
+        self.classifier = QuestionClassifier.load(CLASSIFIER_MODEL_PATH)
+        if self.classifier:
+            logger.info(f"Загружен локальный классификатор: {self.classifier.metadata.get('trained_at')}")
+        # Проверки релевантности от одновременных вопросов - одним запросом
+        self.relevance_batcher = RelevanceBatcher(self._check_relevance_batch_async,
+                                                  self._check_relevance_single_async,
+                                                  self._check_relevance_fallback)
+        # Генерация ответа параллельно с проверкой релевантности через ИИ
+        self.speculation = SpeculationBudget()
+        # Последние реплики пользователей для уточняющих вопросов
+        self.conversations = ConversationStore()
+        # Копии медленных запросов на другой ключ (хвост задержек Mistral)
+        self.hedging = HedgePolicy()
+        # Объединение одинаковых вопросов, которые обрабатываются одновременно
+        self.single_flight = SingleFlight()
+        # HTTP-клиенты с пулом keep-alive соединений, по одному на API ключ
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
         
         # Если нет API ключей, используем режим FAQ
         if not self.api_keys:
             logger.warning("API ключи Mistral не настроены, используется только FAQ кэш")
         
-    def _get_next_api_key(self) -> Optional[str]:
-        """Получение следующего доступного API ключа"""
-        if not self.api_keys:
-            return None
-        
-        # Ротация ключей для равномерной нагрузки
-        key = self.api_keys[self.current_key_index]
-        self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-        return key
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики всех компонентов сервиса одним словарем (для периодического лога)"""
+        return {
+            'answer_cache': self.get_cache_stats(),
+            'semantic_cache': self.get_semantic_cache_stats(),
+            'relevance_cache': self.get_relevance_stats(),
+            'relevance_batch': self.get_relevance_batch_stats(),
+            'routing': self.get_routing_stats(),
+            'conversations': self.get_conversation_stats(),
+            'answer_budget': self.get_answer_budget_stats(),
+            'hedging': self.get_hedge_stats(),
+            'speculation': self.get_speculation_stats(),
+            'single_flight': self.get_single_flight_stats(),
+            'keys': self.get_key_stats()
+        }
+    
+    def get_key_stats(self) -> List[Dict[str, Any]]:
+        """Статистика здоровья API ключей"""
+        return self.key_pool.get_stats()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Счетчики кэша ответов"""
+        return self.answer_cache.get_stats()
+    
+    def get_semantic_cache_stats(self) -> Dict[str, Any]:
+        """Счетчики семантического кэша"""
+        return self.semantic_cache.get_stats()
+    
+    def get_relevance_stats(self) -> Dict[str, Any]:
+        """Счетчики кэша вердиктов релевантности"""
+        return self.relevance_cache.get_stats()
+    
+    def get_relevance_batch_stats(self) -> Dict[str, int]:
+        """Счетчики пакетной проверки релевантности"""
+        return self.relevance_batcher.get_stats()
     
-    def _make_request(self, messages: list, max_tokens: int = 1000) -> Optional[str]:
-        """Отправка запроса к Mistral API с ротацией ключей"""
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """Решения маршрутизации и задержки уровней моделей"""
+        return self.router.get_stats()
+    
+    def get_conversation_stats(self) -> Dict[str, Any]:
+        """Счетчики хранилища диалогов"""
+        return self.conversations.get_stats()
+    
+    def get_answer_budget_stats(self) -> Dict[str, Any]:
+        """Лимиты токенов ответов по типам вопросов"""
+        return self.answer_budget.get_stats()
+    
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """Счетчики дублированных запросов"""
+        return self.hedging.get_stats()
+    
+    def get_speculation_stats(self) -> Dict[str, Any]:
+        """Счетчики спекулятивной генерации ответов"""
+        return self.speculation.get_stats()
+    
+    def get_single_flight_stats(self) -> Dict[str, int]:
+        """Сколько вопросов получили ответ уже идущего запроса"""
+        return self.single_flight.get_stats()
+    
+    def _make_request(self, messages: list, max_tokens: int = 1000, kind: Optional[str] = None,
+                      route: Optional[ModelRoute] = None) -> Optional[str]:
+        """
+        Отправка запроса к Mistral API с ротацией ключей.
+        
+        kind - вид запроса для учета токенов, route - выбранная модель ответа.
+        """
         if not self.api_keys:
             logger.error("Нет доступных API ключей Mistral")
             return None
             
-        # Пробуем все ключи по очереди
+        # Пробуем ключи от самого здорового, каждый не больше одного раза
+        tried_keys = set()
         for attempt in range(len(self.api_keys)):
-            api_key = self._get_next_api_key()
+            api_key = self.key_pool.acquire(exclude=tried_keys)
+            if api_key is None:
+                break
+            tried_keys.add(api_key)
+            started = time.time()
             
             try:
                 headers = {
@@ -59,235 +393,813 @@ class AIService:
                     'Content-Type': 'application/json'
                 }
                 
-                data = {
-                    'model': 'mistral-small-latest',
-                    'messages': messages,
-                    'max_tokens': max_tokens,
-                    'temperature': 0.7
-                }
+                data = self._build_payload(messages, max_tokens, route)
                 
-                response = requests.post(self.api_url, headers=headers, json=data, timeout=30)
+                response = requests.post(self.api_url, headers=headers, json=data,
+                                         timeout=(MISTRAL_CONNECT_TIMEOUT, MISTRAL_READ_TIMEOUT))
                 
                 if response.status_code == 200:
                     result = response.json()
-                    return result['choices'][0]['message']['content']
+                    content = result['choices'][0]['message']['content']
+                    latency = time.time() - started
+                    self.key_pool.report_success(api_key, latency)
+                    self._record_usage(api_key, kind, result.get('usage'), latency, max_tokens, route)
+                    return content
                 elif response.status_code == 429:  # Rate limit
                     logger.warning(f"Rate limit для ключа {api_key[:10]}...")
+                    self.key_pool.report_failure(api_key, time.time() - started, 429,
+                                                 parse_retry_after(response.headers.get('Retry-After')))
                     continue  # Пробуем следующий ключ
                 else:
                     logger.error(f"Ошибка API Mistral: {response.status_code} - {response.text}")
+                    self.key_pool.report_failure(api_key, time.time() - started, response.status_code)
                     continue
                     
             except Exception as e:
                 logger.error(f"Ошибка запроса к Mistral API с ключом {api_key[:10]}...: {e}")
+                self.key_pool.report_failure(api_key, time.time() - started)
                 continue
         
         logger.error("Все API ключи недоступны")
         return None
     
-    def _check_relevance(self, question: str) -> bool:
-        """Проверка релевантности вопроса - более гибкая логика"""
+    def _record_usage(self, api_key: str, kind: Optional[str], usage: Optional[Dict[str, int]], latency: float,
+                      max_tokens: int, route: Optional[ModelRoute] = None):
+        """Учет расхода токенов по блоку usage ответа Mistral API и задержки уровня модели"""
+        if route is not None:
+            self.router.record(route.tier, latency)
+        if not usage:
+            return
         try:
-            question_lower = question.lower().strip()
-            
-            # Вежливые фразы всегда релевантны
-            polite_phrases = ['спасибо', 'благодарю', 'привет', 'здравствуйте', 'до свидания', 'пока']
-            if any(phrase in question_lower for phrase in polite_phrases):
-                return True
-            
-            # Расширенный список ключевых слов для торгов по банкротству
-            trade_keywords = [
-                # Основные термины
-                'торг', 'банкрот', 'несостоятельность', 'конкурс',
-                # Имущество и недвижимость
-                'залог', 'имуществ', 'недвижим', 'квартир', 'дом', 'участок', 'земл',
-                # Процедуры и документы
-                'документ', 'участие', 'лот', 'ставка', 'аукцион', 'продаж',
-                # Финансы
-                'долг', 'кредит', 'обязательств', 'требовани', 'денег', 'стоимость',
-                # Юридические аспекты
-                'суд', 'закон', 'право', 'статья', 'фз', 'кодекс',
-                # Участники
-                'управляющ', 'кредитор', 'должник', 'участник',
-                # Общие экономические термины
-                'собственность', 'приобретение', 'покупка', 'инвестиц',
-                # Документы и процедуры
-                'акт', 'хранен', 'ответственн', 'передач', 'приемк'
-            ]
-            
-            # Проверяем наличие ключевых слов
-            has_trade_keywords = any(keyword in question_lower for keyword in trade_keywords)
+            completion_tokens = usage.get('completion_tokens') or 0
+            self.request_log.log_token_usage(
+                current_user_id.get(), f"{api_key[:6]}...", kind,
+                usage.get('prompt_tokens') or 0, completion_tokens, latency,
+                route.model if route else MISTRAL_MODEL
+            )
+            if kind in QUESTION_TYPE_PROMPTS and completion_tokens:
+                self.answer_budget.record(kind, completion_tokens, max_tokens)
+        except Exception as e:
+            logger.error(f"Ошибка учета расхода токенов: {e}")
+    
+    def _build_payload(self, messages: list, max_tokens: int, route: Optional[ModelRoute] = None) -> Dict[str, Any]:
+        """Тело запроса к Mistral API (модель и температура - из route, если он задан)"""
+        return {
+            'model': route.model if route else MISTRAL_MODEL,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': route.temperature if route else 0.7
+        }
+    
+    def _get_http_client(self, api_key: str) -> httpx.AsyncClient:
+        """Асинхронный HTTP-клиент с пулом соединений для API ключа"""
+        client = self._http_clients.get(api_key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                headers={
+                    'Authorization': f'Bearer {api_key}',
+                    'Content-Type': 'application/json'
+                },
+                timeout=httpx.Timeout(MISTRAL_READ_TIMEOUT, connect=MISTRAL_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=MISTRAL_MAX_CONNECTIONS,
+                    max_keepalive_connections=MISTRAL_MAX_CONNECTIONS
+                )
+            )
+            self._http_clients[api_key] = client
+        return client
+    
+    async def _make_request_async(self, messages: list, max_tokens: int = 1000,
+                                  kind: Optional[str] = None, route: Optional[ModelRoute] = None) -> Optional[str]:
+        """
+        Асинхронная отправка запроса к Mistral API с ротацией ключей.
+        
+        kind - вид запроса (тип вопроса, проверка релевантности); для таких
+        запросов при включенном HEDGE_REQUESTS возможна копия на другом ключе.
+        route - выбранная модель ответа.
+        """
+        if not self.api_keys:
+            logger.error("Нет доступных API ключей Mistral")
+            return None
+        
+        if kind is not None and len(self.api_keys) > 1:
+            content = await self._hedged_request_async(messages, max_tokens, kind, route)
+        else:
+            content = await self._request_with_keys_async(messages, max_tokens, set(), kind, route)
+        if content is None:
+            logger.error("Все API ключи недоступны")
+        return content
+    
+    async def _hedged_request_async(self, messages: list, max_tokens: int, kind: str,
+                                    route: Optional[ModelRoute] = None) -> Optional[str]:
+        """
+        Запрос с копией на другом ключе, если ответа нет дольше обычного для kind.
+        
+        Копии используют общий набор опробованных ключей, поэтому не попадают
+        на один ключ. Побеждает первый ответ, оставшаяся копия отменяется.
+        """
+        started = time.time()
+        tried_keys = set()
+        primary = asyncio.ensure_future(self._request_with_keys_async(messages, max_tokens, tried_keys,
+                                                                     kind, route))
+        pending = {primary}
+        hedge = None
+        winner = None
+        content = None
+        try:
+            delay = self.hedging.delay(kind)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and len(tried_keys) < len(self.api_keys) and self.hedging.try_hedge():
+                    logger.info(f"Нет ответа за {delay:.1f} с, дублируем запрос ({kind}) на другой ключ")
+                    hedge = asyncio.ensure_future(self._request_with_keys_async(messages, max_tokens,
+                                                                                tried_keys, kind, route))
+                    pending.add(hedge)
             
-            # Если есть ключевые слова - считаем релевантным
-            if has_trade_keywords:
-                return True
+            while pending and content is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if content is None and task.result():
+                        content, winner = task.result(), task
+        finally:
+            for task in pending:
+                task.cancel()
+            self.hedging.record(kind, time.time() - started if content else None,
+                                hedged=hedge is not None, hedge_won=winner is not None and winner is hedge)
+        return content
+    
+    async def _request_with_keys_async(self, messages: list, max_tokens: int, tried_keys: set,
+                                       kind: Optional[str] = None, route: Optional[ModelRoute] = None) -> Optional[str]:
+        """Запрос с перебором еще не опробованных ключей (None - ни один не ответил)"""
+        # Пробуем ключи от самого здорового, каждый не больше одного раза
+        for attempt in range(len(self.api_keys)):
+            api_key = self.key_pool.acquire(exclude=tried_keys)
+            if api_key is None:
+                break
+            tried_keys.add(api_key)
+            started = time.time()
             
-            # Если нет ключевых слов, но есть API ключи - используем ИИ для проверки
-            if self.api_keys:
-                messages = [
-                    {"role": "user", "content": RELEVANCE_CHECK_PROMPT.format(question=question)}
-                ]
+            try:
+                client = self._get_http_client(api_key)
+                response = await client.post(self.api_url, json=self._build_payload(messages, max_tokens, route))
                 
-                response = self._make_request(messages, max_tokens=10)
-                return response and response.strip().upper() == "ДА"
+                if response.status_code == 200:
+                    result = response.json()
+                    content = result['choices'][0]['message']['content']
+                    latency = time.time() - started
+                    self.key_pool.report_success(api_key, latency)
+                    self._record_usage(api_key, kind, result.get('usage'), latency, max_tokens, route)
+                    return content
+                elif response.status_code == 429:  # Rate limit
+                    logger.warning(f"Rate limit для ключа {api_key[:10]}...")
+                    self.key_pool.report_failure(api_key, time.time() - started, 429,
+                                                 parse_retry_after(response.headers.get('Retry-After')))
+                    continue  # Пробуем следующий ключ
+                else:
+                    logger.error(f"Ошибка API Mistral: {response.status_code} - {response.text}")
+                    self.key_pool.report_failure(api_key, time.time() - started, response.status_code)
+                    continue
+                    
+            except asyncio.CancelledError:
+                # Запрос отменен - ключ не виноват, просто освобождаем его
+                self.key_pool.release(api_key)
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка запроса к Mistral API с ключом {api_key[:10]}...: {e!r}")
+                self.key_pool.report_failure(api_key, time.time() - started)
+                continue
+        
+        return None
+    
+    async def _stream_request_async(self, messages: list, max_tokens: int = 1000, kind: Optional[str] = None,
+                                    route: Optional[ModelRoute] = None) -> AsyncIterator[str]:
+        """
+        Потоковый запрос к Mistral API: фрагменты ответа по мере генерации.
+        
+        Следующий ключ пробуется, только пока не получено ни одного фрагмента;
+        обрыв потока после этого вызывает StreamInterrupted: полученный текст
+        неполон и не должен сойти за ответ. Задержка ключа учитывается
+        до первого фрагмента.
+        """
+        if not self.api_keys:
+            logger.error("Нет доступных API ключей Mistral")
+            return
+        
+        tried_keys = set()
+        for attempt in range(len(self.api_keys)):
+            api_key = self.key_pool.acquire(exclude=tried_keys)
+            if api_key is None:
+                break
+            tried_keys.add(api_key)
+            started = time.time()
+            first_chunk_latency = None
+            usage = {}
             
-            # Если нет API ключей и нет ключевых слов - считаем нерелевантным
+            try:
+                client = self._get_http_client(api_key)
+                payload = self._build_payload(messages, max_tokens, route)
+                payload['stream'] = True
+                async with client.stream('POST', self.api_url, json=payload) as response:
+                    if response.status_code == 429:  # Rate limit
+                        logger.warning(f"Rate limit для ключа {api_key[:10]}...")
+                        self.key_pool.report_failure(api_key, time.time() - started, 429,
+                                                     parse_retry_after(response.headers.get('Retry-After')))
+                        continue  # Пробуем следующий ключ
+                    if response.status_code != 200:
+                        await response.aread()
+                        logger.error(f"Ошибка API Mistral: {response.status_code} - {response.text}")
+                        self.key_pool.report_failure(api_key, time.time() - started, response.status_code)
+                        continue
+                    
+                    async for content in iter_sse_content(response, usage):
+                        if first_chunk_latency is None:
+                            first_chunk_latency = time.time() - started
+                        yield content
+                
+                self.key_pool.report_success(api_key, first_chunk_latency or time.time() - started)
+                self._record_usage(api_key, kind, usage, time.time() - started, max_tokens, route)
+                return
+                
+            except (asyncio.CancelledError, GeneratorExit):
+                # Запрос отменен или ответ больше не нужен - ключ не виноват
+                self.key_pool.release(api_key)
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка потокового запроса к Mistral API с ключом {api_key[:10]}...: {e!r}")
+                self.key_pool.report_failure(api_key, time.time() - started)
+                if first_chunk_latency is not None:
+                    raise StreamInterrupted() from e
+                continue
+        
+        logger.error("Все API ключи недоступны")
+    
+    async def _stream_answer_async(self, messages: list, on_delta: Callable[[str], Awaitable[None]],
+                                   max_tokens: int = 1000, kind: Optional[str] = None,
+                                   route: Optional[ModelRoute] = None) -> Optional[str]:
+        """
+        Потоковая генерация ответа: on_delta получает весь накопленный текст.
+        
+        При обрыве потока StreamInterrupted передается дальше с уже
+        полученным текстом.
+        """
+        parts = []
+        stream = self._stream_request_async(messages, max_tokens, kind, route)
+        try:
+            async for content in stream:
+                parts.append(content)
+                await on_delta(''.join(parts))
+        except StreamInterrupted as e:
+            e.text = ''.join(parts)
+            raise
+        finally:
+            await stream.aclose()
+        return ''.join(parts) or None
+    
+    async def aclose(self):
+        """Закрытие HTTP-клиентов и сброс накопленной статистики кэша"""
+        for client in self._http_clients.values():
+            await client.aclose()
+        self._http_clients.clear()
+        self.answer_cache.flush_usage()
+    
+    def _check_relevance_keywords(self, question: str) -> Optional[bool]:
+        """
+        Проверка релевантности по ключевым словам.
+        
+        Возвращает True/False, если решение принято без ИИ,
+        и None, если нужна проверка через Mistral API.
+        """
+        categories = match_keywords(question)
+        
+        # Вежливые фразы и вопросы с ключевыми словами торгов - релевантны
+        if 'polite' in categories or 'trade' in categories:
+            return True
+        
+        # Если нет ключевых слов, но есть API ключи - нужна проверка ИИ
+        if self.api_keys:
+            return None
+        
+        # Если нет API ключей и нет ключевых слов - считаем нерелевантным
+        return False
+    
+    def _check_relevance_offline(self, question: str) -> Optional[bool]:
+        """Проверка релевантности в памяти: ключевые слова, затем уверенный ответ локальной модели"""
+        verdict = self._check_relevance_keywords(question)
+        if verdict is not None:
+            return verdict
+        
+        if self.classifier:
+            prediction = self.classifier.predict_relevance(question)
+            if prediction and prediction[1] >= CLASSIFIER_RELEVANCE_CONFIDENCE:
+                return prediction[0]
+        return None
+    
+    def _check_relevance_local(self, question: str) -> Optional[bool]:
+        """
+        Проверка релевантности без запроса к ИИ: ключевые слова,
+        уверенный ответ локальной модели, затем сохраненный вердикт ИИ.
+        """
+        verdict = self._check_relevance_offline(question)
+        if verdict is not None:
+            return verdict
+        return self.relevance_cache.get(question)
+    
+    async def _check_relevance_local_async(self, question: str) -> Optional[bool]:
+        """Проверка релевантности без запроса к ИИ; сохраненный вердикт читается вне event loop"""
+        verdict = self._check_relevance_offline(question)
+        if verdict is not None:
+            return verdict
+        return await self.relevance_cache.get_async(question)
+    
+    def _relevance_messages(self, question: str) -> List[Dict[str, str]]:
+        """Сообщения для проверки релевантности через ИИ"""
+        return [
+            {"role": "user", "content": RELEVANCE_CHECK_PROMPT.format(question=question)}
+        ]
+    
+    def _relevance_verdict(self, question: str, response: Optional[str]) -> bool:
+        """Разбор ответа ИИ; вердикт запоминается, только если ИИ ответил"""
+        if not response:
             return False
+        verdict = response.strip().upper() == "ДА"
+        self.relevance_cache.put(question, verdict)
+        return verdict
+    
+    def _check_relevance(self, question: str) -> bool:
+        """Проверка релевантности вопроса - более гибкая логика"""
+        try:
+            verdict = self._check_relevance_local(question)
+            if verdict is not None:
+                return verdict
+            
+            response = self._make_request(self._relevance_messages(question), max_tokens=10, kind='relevance')
+            return self._relevance_verdict(question, response)
             
         except Exception as e:
             logger.error(f"Ошибка проверки релевантности: {e}")
             return True  # В случае ошибки считаем релевантным
     
-    def _get_question_type(self, question: str) -> str:
-        """Определение типа вопроса"""
-        question_lower = question.lower()
-        
-        if any(word in question_lower for word in ['документ', 'справка', 'пакет', 'заявка']):
-            return 'documents'
-        elif any(word in question_lower for word in ['стратегия', 'выбор', 'лота', 'ставка']):
-            return 'strategy'
-        elif any(word in question_lower for word in ['закон', 'статья', 'фз', 'право', 'суд']):
-            return 'legal'
-        elif any(word in question_lower for word in ['недвижимость', 'имущество', 'квартира', 'дом']):
-            return 'property'
-        else:
-            return 'general'
+    async def _check_relevance_async(self, question: str) -> bool:
+        """Асинхронная проверка релевантности вопроса"""
+        try:
+            verdict = await self._check_relevance_local_async(question)
+            if verdict is not None:
+                return verdict
+        except Exception as e:
+            logger.error(f"Ошибка проверки релевантности: {e}")
+            return True  # В случае ошибки считаем релевантным
+        
+        return await self._check_relevance_llm_async(question)
+    
+    async def _check_relevance_llm_async(self, question: str) -> bool:
+        """Проверка релевантности вопроса через ИИ (в пакете с одновременными вопросами)"""
+        return await self.relevance_batcher.check(question)
+    
+    async def _check_relevance_single_async(self, question: str) -> bool:
+        """Проверка релевантности одного вопроса отдельным запросом"""
+        try:
+            response = await self._make_request_async(self._relevance_messages(question), max_tokens=10,
+                                                      kind='relevance')
+            return self._relevance_verdict(question, response)
+        except Exception as e:
+            logger.error(f"Ошибка проверки релевантности: {e}")
+            return True  # В случае ошибки считаем релевантным
+    
+    def _check_relevance_fallback(self, question: str) -> bool:
+        """Вердикт без ИИ, когда пакетная проверка не удалась: ключевые слова и локальная модель"""
+        verdict = self._check_relevance_offline(question)
+        return True if verdict is None else verdict  # Без уверенного вердикта считаем релевантным
+    
+    async def _check_relevance_batch_async(self, questions: List[str]) -> Optional[List[bool]]:
+        """
+        Проверка релевантности нескольких вопросов одним запросом.
+        
+        None - ответ не разобран; BatchRequestFailed - ИИ не ответил.
+        """
+        # Перенос строки внутри вопроса сбил бы нумерацию
+        numbered = '\n'.join(f'{number}. "{" ".join(question.split())}"'
+                              for number, question in enumerate(questions, 1))
+        messages = [{"role": "user", "content": RELEVANCE_BATCH_PROMPT.format(questions=numbered)}]
+        response = await self._make_request_async(messages, max_tokens=8 * len(questions) + 10,
+                                                  kind='relevance_batch')
+        if response is None:
+            raise BatchRequestFailed()
+        verdicts = parse_batch_verdicts(response, len(questions))
+        if verdicts is not None:
+            for question, verdict in zip(questions, verdicts):
+                self.relevance_cache.put(question, verdict)
+        return verdicts
+    
+    def _classify_question(self, question: str) -> Tuple[str, float]:
+        """
+        Тип вопроса и уверенность в нем: 1.0 - по ключевым словам,
+        уверенность локальной модели - по ней, 0.0 - тип по умолчанию.
+        """
+        question_type = classify_question_type(match_keywords(question))
+        if question_type != 'general':
+            return question_type, 1.0
+        if self.classifier:
+            prediction = self.classifier.predict_question_type(question)
+            if prediction and prediction[1] >= CLASSIFIER_TYPE_CONFIDENCE:
+                return prediction
+        return question_type, 0.0
+    
+    def _route_answer(self, question: str, question_type: str, confidence: float) -> ModelRoute:
+        """Модель, лимит токенов и температура для ответа на вопрос"""
+        return self.router.route(question_type, confidence, estimate_tokens(question),
+                                 self.answer_budget.max_tokens(question_type),
+                                 self.answer_budget.min_tokens_for(question_type))
+    
+    def _load_faq_index(self):
+        """Заполнение индекса FAQ: статические вопросы и самые востребованные из faq_cache"""
+        # Статические вопросы закреплены: ответы из faq_cache их не вытесняют
+        for phrase, answer in FAQ_CACHE.items():
+            self.faq_index.add(f'faq:{phrase}', phrase, answer, pinned=True)
+        # От менее популярных к более популярным: при вытеснении уходят первые
+        limit = max(self.faq_index.max_size - self.faq_index.pinned, 0)
+        for question_hash, question, answer in reversed(self.db_manager.get_faq_entries(limit)):
+            self.faq_index.add(question_hash, question, answer)
+        logger.info(f"Индекс FAQ: {len(self.faq_index)} вопросов")
+    
+    def _question_hash(self, question: str) -> str:
+        """Ключ вопроса в faq_cache (не зависит от регистра, пунктуации и пробелов)"""
+        return question_key(question)
+    
+    def _check_answer_cache(self, question: str) -> Optional[str]:
+        """Готовый ответ ИИ на этот же или достаточно похожий вопрос"""
+        try:
+            cached_answer = self.answer_cache.get(self._question_hash(question))
+            if cached_answer:
+                return cached_answer
+            return self.semantic_cache.get(question)
+        except Exception as e:
+            logger.error(f"Ошибка проверки кэша ответов: {e}")
+            return None
+    
+    async def _check_answer_cache_async(self, question: str) -> Optional[str]:
+        """Готовый ответ ИИ на этот же или похожий вопрос (faq_cache читается вне event loop)"""
+        try:
+            cached_answer = await self.answer_cache.get_async(self._question_hash(question))
+            if cached_answer:
+                return cached_answer
+            return self.semantic_cache.get(question)
+        except Exception as e:
+            logger.error(f"Ошибка проверки кэша ответов: {e}")
+            return None
+    
+    def _remember_answer(self, question: str, answer: str):
+        """Сохранение ответа ИИ для точных и похожих повторов вопроса"""
+        try:
+            question_hash = self._question_hash(question)
+            self.answer_cache.put(question_hash, question, answer)
+            self.semantic_cache.add(question_hash, question, answer)
+            self.faq_index.add(question_hash, question, answer)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения ответа в кэш: {e}")
     
     def _check_faq_cache(self, question: str) -> Optional[str]:
         """Проверка кэша FAQ"""
         try:
             # Создаем хэш вопроса для поиска в кэше
-            question_hash = hashlib.md5(question.lower().strip().encode()).hexdigest()
+            question_hash = self._question_hash(question)
             
-            # Проверяем в базе данных
-            cached_answer = self.db_manager.get_cached_faq(question_hash)
+            # Проверяем в кэше ответов (память, затем база данных)
+            cached_answer = self.answer_cache.get(question_hash)
             if cached_answer:
                 return cached_answer
             
-            # Проверяем в локальном кэше
-            question_lower = question.lower().strip()
-            
-            # Сначала ищем точное совпадение
-            for faq_question, faq_answer in FAQ_CACHE.items():
-                if faq_question in question_lower:
-                    # Кэшируем в базе данных
-                    self.db_manager.cache_faq_answer(question_hash, question, faq_answer)
-                    return faq_answer
-            
-            # Затем ищем по ключевым словам
-            for faq_question, faq_answer in FAQ_CACHE.items():
-                faq_words = faq_question.split()
-                if len(faq_words) >= 2:  # Только для вопросов из 2+ слов
-                    if any(word in question_lower for word in faq_words):
-                        # Кэшируем в базе данных
-                        self.db_manager.cache_faq_answer(question_hash, question, faq_answer)
-                        return faq_answer
+            return self._match_faq(question)
             
+        except Exception as e:
+            logger.error(f"Ошибка проверки кэша FAQ: {e}")
             return None
-            
+    
+    async def _check_faq_cache_async(self, question: str) -> Optional[str]:
+        """Проверка кэша FAQ без блокировки event loop"""
+        try:
+            question_hash = self._question_hash(question)
+            cached_answer = await self.answer_cache.get_async(question_hash)
+            if cached_answer:
+                return cached_answer
+            return self._match_faq(question)
         except Exception as e:
             logger.error(f"Ошибка проверки кэша FAQ: {e}")
             return None
     
+    def _match_faq(self, question: str) -> Optional[str]:
+        """Ответ FAQ по фразам, входящим в вопрос, или по самому близкому вопросу"""
+        # Сначала ищем фразы FAQ, входящие в вопрос. Ответ не кэшируется
+        # под ключом всего вопроса: фраза ("здравствуйте") может быть лишь
+        # частью вопроса, и ответ на нее не должен подменять ответ на вопрос
+        found_phrases = FAQ_PHRASES.match(question)
+        for faq_question, faq_answer in FAQ_CACHE.items():
+            if faq_question in found_phrases:
+                return faq_answer
+        
+        # Затем ищем самый близкий вопрос FAQ по ключевым словам (BM25).
+        # Такой ответ не кэшируется: неточное совпадение не должно
+        # закрепляться за вопросом навсегда
+        return self.faq_index.best(question)
+    
+    IRRELEVANT_ANSWER = "Извините, я специализируюсь только на вопросах, связанных с торгами по банкротству. Задайте, пожалуйста, вопрос по этой теме."
+    FALLBACK_ANSWER = "Я готов помочь вам с вопросами по торгам по банкротству. Можете задать более конкретный вопрос?"
+    
+    def _answer(self, user_id: int, question: str, answer: str, is_relevant: bool,
+                question_type: str, start_time: float) -> Dict[str, Any]:
+        """Логирование запроса, запоминание реплики диалога и формирование результата"""
+        response_time = time.time() - start_time
+        self.request_log.log_request(user_id, question, answer, is_relevant, question_type, response_time)
+        if is_relevant and question_type not in ('error', 'fallback', 'truncated'):
+            self.conversations.add(user_id, question, answer)
+        return {
+            'answer': answer,
+            'is_relevant': is_relevant,
+            'question_type': question_type,
+            'response_time': response_time
+        }
+    
+    def _interrupted_answer(self, error: StreamInterrupted) -> tuple:
+        """
+        Результат для оборванного потока: полученная часть с предупреждением
+        (тип 'truncated' - такой ответ не кэшируется и не считается полным)
+        или None, если ничего не пришло, - тогда отвечает FAQ.
+        """
+        if error.text:
+            return error.text + STREAM_INTERRUPTED_NOTICE.rstrip(), True, 'truncated'
+        return None
+    
+    def _check_polite_cache(self, question: str) -> Optional[str]:
+        """Ответ из кэша для простых вежливых фраз"""
+        if 'polite' in match_keywords(question):
+            return self._check_faq_cache(question)
+        return None
+    
+    async def _check_polite_cache_async(self, question: str) -> Optional[str]:
+        """Ответ из кэша для простых вежливых фраз (асинхронно)"""
+        if 'polite' in match_keywords(question):
+            return await self._check_faq_cache_async(question)
+        return None
+    
+    @staticmethod
+    def _assemble_system_prompt(question_type: str, compact: bool) -> str:
+        """Системный промпт для типа вопроса: основной (или сокращенный) и указание по типу"""
+        base_prompt = MAIN_SYSTEM_PROMPT_COMPACT if compact else MAIN_SYSTEM_PROMPT
+        return base_prompt.strip() + "\n\n" + QUESTION_TYPE_PROMPTS[question_type].strip()
+    
+    def _build_answer_messages(self, question: str, question_type: str,
+                               history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+        """
+        Формирование промпта для ответа: короткие вопросы получают сокращенный
+        системный промпт, уточняющие - предыдущие реплики диалога (history).
+        """
+        compact = estimate_tokens(question) <= COMPACT_PROMPT_MAX_QUESTION_TOKENS
+        system_prompt = self.system_prompts.get((question_type, compact))
+        if system_prompt is None:
+            system_prompt = MAIN_SYSTEM_PROMPT_COMPACT if compact else MAIN_SYSTEM_PROMPT
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            *(history or []),
+            {"role": "user", "content": question}
+        ]
+    
+    def _follow_up_history(self, question: str, user_id: int) -> List[Dict[str, str]]:
+        """История диалога, если вопрос похож на уточнение к предыдущему"""
+        try:
+            if is_follow_up(question):
+                return self.conversations.history(user_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения истории диалога: {e}")
+        return []
+    
+    def _fallback_answer(self, question: str, user_id: int, start_time: float) -> Dict[str, Any]:
+        """Ответ из кэша FAQ или общий ответ, если ИИ недоступен"""
+        cached_answer = self._check_faq_cache(question)
+        if cached_answer:
+            return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
+        
+        # Если ничего не найдено, возвращаем общий ответ
+        return self._answer(user_id, question, self.FALLBACK_ANSWER, True, 'fallback', start_time)
+    
+    async def _fallback_answer_async(self, question: str, user_id: int, start_time: float) -> Dict[str, Any]:
+        """Ответ из кэша FAQ или общий ответ, если ИИ недоступен (асинхронно)"""
+        cached_answer = await self._check_faq_cache_async(question)
+        if cached_answer:
+            return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
+        return self._answer(user_id, question, self.FALLBACK_ANSWER, True, 'fallback', start_time)
+    
     def generate_answer(self, question: str, user_id: int) -> Dict[str, Any]:
         """Генерация ответа на вопрос"""
         start_time = time.time()
+        current_user_id.set(user_id)
         
         try:
             # Сначала проверяем простые вежливые фразы в кэше
-            question_lower = question.lower().strip()
-            polite_phrases = ['спасибо', 'благодарю', 'привет', 'здравствуйте', 'до свидания', 'пока']
+            cached_answer = self._check_polite_cache(question)
+            if cached_answer:
+                return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
             
-            if any(phrase in question_lower for phrase in polite_phrases):
-                cached_answer = self._check_faq_cache(question)
-                if cached_answer:
-                    response_time = time.time() - start_time
-                    self.db_manager.log_request(user_id, question, cached_answer, True, 'cached', response_time)
-                    return {
-                        'answer': cached_answer,
-                        'is_relevant': True,
-                        'question_type': 'cached',
-                        'response_time': response_time
-                    }
+            # Уточняющий вопрос отвечается с учетом диалога и не делится с другими пользователями
+            history = self._follow_up_history(question, user_id)
             
-            # Проверяем релевантность
-            is_relevant = self._check_relevance(question)
+            # Ответ на этот же или похожий вопрос уже был
+            cached_answer = None if history else self._check_answer_cache(question)
+            if cached_answer:
+                return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
             
-            if not is_relevant:
-                irrelevant_answer = "Извините, я специализируюсь только на вопросах, связанных с торгами по банкротству. Задайте, пожалуйста, вопрос по этой теме."
-                response_time = time.time() - start_time
-                self.db_manager.log_request(user_id, question, irrelevant_answer, False, 'irrelevant', response_time)
-                return {
-                    'answer': irrelevant_answer,
-                    'is_relevant': False,
-                    'question_type': 'irrelevant',
-                    'response_time': response_time
-                }
+            # Уточняющий вопрос проверяется так же: он может быть и не по теме
+            if not self._check_relevance(question):
+                return self._answer(user_id, question, self.IRRELEVANT_ANSWER, False, 'irrelevant', start_time)
             
             # Если есть API ключи, используем ИИ
             if self.api_keys:
-                # Определяем тип вопроса
-                question_type = self._get_question_type(question)
-                
-                # Формируем промпт
-                system_prompt = MAIN_SYSTEM_PROMPT
-                if question_type in QUESTION_TYPE_PROMPTS:
-                    system_prompt += "\n\n" + QUESTION_TYPE_PROMPTS[question_type]
-                
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ]
-                
-                # Отправляем запрос к API
-                answer = self._make_request(messages)
+                question_type, confidence = self._classify_question(question)
+                route = self._route_answer(question, question_type, confidence)
+                answer = self._make_request(self._build_answer_messages(question, question_type, history),
+                                            route.max_tokens, kind=question_type, route=route)
                 
                 if answer:
-                    response_time = time.time() - start_time
-                    self.db_manager.log_request(user_id, question, answer, True, question_type, response_time)
-                    return {
-                        'answer': answer,
-                        'is_relevant': True,
-                        'question_type': question_type,
-                        'response_time': response_time
-                    }
+                    if not history:
+                        self._remember_answer(question, answer)
+                    return self._answer(user_id, question, answer, True, question_type, start_time)
             
             # Fallback: проверяем кэш FAQ для сложных вопросов
-            cached_answer = self._check_faq_cache(question)
+            return self._fallback_answer(question, user_id, start_time)
+            
+        except Exception as e:
+            logger.error(f"Ошибка генерации ответа: {e}")
+            return self._answer(user_id, question, ERROR_PROMPT, False, 'error', start_time)
+    
+    async def _resolve_answer_async(self, question: str, question_type: str, route: ModelRoute,
+                                    on_delta: Optional[Callable[[str], Awaitable[None]]]) -> Optional[tuple]:
+        """
+        Проверка релевантности и запрос ответа к ИИ (общая часть для одинаковых вопросов).
+        
+        Возвращает (ответ, релевантен, тип вопроса) или None, если ИИ не ответил.
+        """
+        # Проверяем релевантность
+        try:
+            verdict = await self._check_relevance_local_async(question)
+        except Exception as e:
+            logger.error(f"Ошибка проверки релевантности: {e}")
+            verdict = True  # В случае ошибки считаем релевантным
+        
+        if verdict is None:
+            if self.speculation.allow():
+                return await self._resolve_speculative_async(question, question_type, route, on_delta)
+            verdict = await self._check_relevance_llm_async(question)
+        
+        if not verdict:
+            return self.IRRELEVANT_ANSWER, False, 'irrelevant'
+        
+        try:
+            answer = await self._request_answer_async(question, question_type, route, on_delta)
+        except StreamInterrupted as e:
+            return self._interrupted_answer(e)
+        if answer:
+            self._remember_answer(question, answer)
+            return answer, True, question_type
+        return None
+    
+    async def _resolve_follow_up_async(self, question: str, question_type: str, route: ModelRoute,
+                                       history: List[Dict[str, str]],
+                                       on_delta: Optional[Callable[[str], Awaitable[None]]]) -> Optional[tuple]:
+        """
+        Ответ на уточняющий вопрос с историей диалога.
+        
+        Релевантность проверяется как у обычного вопроса (ключевые слова,
+        локальная модель, ИИ): похожий на уточнение вопрос может быть и
+        не по теме ("а как приготовить борщ?"). Ответ не попадает в кэши:
+        без контекста он неверен для других пользователей.
+        """
+        if not await self._check_relevance_async(question):
+            return self.IRRELEVANT_ANSWER, False, 'irrelevant'
+        
+        try:
+            answer = await self._request_answer_async(question, question_type, route, on_delta, history)
+        except StreamInterrupted as e:
+            return self._interrupted_answer(e)
+        if answer:
+            return answer, True, question_type
+        return None
+    
+    async def _request_answer_async(self, question: str, question_type: str, route: ModelRoute,
+                                    on_delta: Optional[Callable[[str], Awaitable[None]]],
+                                    history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+        """Запрос ответа к модели из route (потоком, если передан on_delta)"""
+        if not self.api_keys:
+            return None
+        messages = self._build_answer_messages(question, question_type, history)
+        if on_delta is None:
+            return await self._make_request_async(messages, route.max_tokens, kind=question_type, route=route)
+        return await self._stream_answer_async(messages, on_delta, route.max_tokens, kind=question_type, route=route)
+    
+    async def _resolve_speculative_async(self, question: str, question_type: str, route: ModelRoute,
+                                         on_delta: Optional[Callable[[str], Awaitable[None]]]) -> Optional[tuple]:
+        """
+        Генерация ответа одновременно с проверкой релевантности через ИИ.
+        
+        Пока вердикта нет, получаемый текст не показывается пользователю,
+        а только запоминается. Если вопрос нерелевантен, генерация отменяется,
+        а ее оценочная стоимость списывается с бюджета спекуляции.
+        """
+        stream = {'text': '', 'released': False}
+        
+        async def hold_delta(text: str):
+            stream['text'] = text
+            if stream['released']:
+                await on_delta(text)
+        
+        answer_task = asyncio.ensure_future(
+            self._request_answer_async(question, question_type, route, hold_delta if on_delta else None)
+        )
+        try:
+            is_relevant = await self._check_relevance_llm_async(question)
+        except BaseException:
+            answer_task.cancel()
+            raise
+        
+        if not is_relevant:
+            answer_task.cancel()
+            await asyncio.gather(answer_task, return_exceptions=True)
+            prompt = self._build_answer_messages(question, question_type)
+            self.speculation.record_loss(
+                sum(estimate_tokens(message['content']) for message in prompt) + estimate_tokens(stream['text'])
+            )
+            return self.IRRELEVANT_ANSWER, False, 'irrelevant'
+        
+        self.speculation.record_win()
+        stream['released'] = True
+        if on_delta and stream['text']:
+            await on_delta(stream['text'])
+        try:
+            answer = await answer_task
+        except StreamInterrupted as e:
+            return self._interrupted_answer(e)
+        if answer:
+            self._remember_answer(question, answer)
+            return answer, True, question_type
+        return None
+    
+    async def generate_answer_async(self, question: str, user_id: int,
+                                    on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Асинхронная генерация ответа на вопрос.
+        
+        Не блокирует event loop на время запроса к Mistral API, поэтому
+        вопросы разных пользователей обрабатываются параллельно. Отмена
+        задачи (asyncio.CancelledError) не логируется и прерывает HTTP-запрос,
+        если его результата не ждут другие пользователи.
+        
+        Если передан on_delta, ответ ИИ запрашивается потоком и on_delta
+        вызывается с накопленным текстом по мере генерации.
+        
+        Если такой же вопрос (с точностью до регистра и пунктуации) уже
+        обрабатывается для другого пользователя, запрос к ИИ не повторяется:
+        ответ общий, а запись в логе запросов своя у каждого пользователя.
+        """
+        start_time = time.time()
+        current_user_id.set(user_id)
+        
+        try:
+            # Сначала проверяем простые вежливые фразы в кэше
+            cached_answer = await self._check_polite_cache_async(question)
             if cached_answer:
-                response_time = time.time() - start_time
-                self.db_manager.log_request(user_id, question, cached_answer, True, 'cached', response_time)
-                return {
-                    'answer': cached_answer,
-                    'is_relevant': True,
-                    'question_type': 'cached',
-                    'response_time': response_time
-                }
+                return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
             
-            # Если ничего не найдено, возвращаем общий ответ
-            fallback_answer = "Я готов помочь вам с вопросами по торгам по банкротству. Можете задать более конкретный вопрос?"
-            response_time = time.time() - start_time
-            self.db_manager.log_request(user_id, question, fallback_answer, True, 'fallback', response_time)
+            # Уточняющий вопрос отвечается с учетом диалога и не делится с другими пользователями
+            history = self._follow_up_history(question, user_id)
+            
+            # Ответ на этот же или похожий вопрос уже был
+            cached_answer = None if history else await self._check_answer_cache_async(question)
+            if cached_answer:
+                return self._answer(user_id, question, cached_answer, True, 'cached', start_time)
             
-            return {
-                'answer': fallback_answer,
-                'is_relevant': True,
-                'question_type': 'fallback',
-                'response_time': response_time
-            }
+            question_type, confidence = self._classify_question(question)
+            route = self._route_answer(question, question_type, confidence)
+            if history:
+                resolved = await self._resolve_follow_up_async(question, question_type, route, history, on_delta)
+            else:
+                # Одинаковые одновременные вопросы обрабатываются одним запросом к ИИ.
+                # Ключ сохраняет отрицания, предлоги и порядок слов: "с залогом"
+                # и "без залога" - разные вопросы
+                flight_key = (normalize_question(question), question_type)
+                resolved = await self.single_flight.run(
+                    flight_key,
+                    lambda emit: self._resolve_answer_async(question, question_type, route,
+                                                            emit if on_delta else None),
+                    on_delta
+                )
+            if resolved:
+                answer, is_relevant, answer_type = resolved
+                return self._answer(user_id, question, answer, is_relevant, answer_type, start_time)
+            
+            # Fallback: проверяем кэш FAQ для сложных вопросов
+            return await self._fallback_answer_async(question, user_id, start_time)
             
         except Exception as e:
             logger.error(f"Ошибка генерации ответа: {e}")
-            response_time = time.time() - start_time
-            error_answer = ERROR_PROMPT
-            self.db_manager.log_request(user_id, question, error_answer, False, 'error', response_time)
-            
-            return {
-                'answer': error_answer,
-                'is_relevant': False,
-                'question_type': 'error',
-                'response_time': response_time
-            }
+            return self._answer(user_id, question, ERROR_PROMPT, False, 'error', start_time)
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получение статистики использования ИИ"""
@@ -0,0 +1,170 @@
+"""
+Кэш ответов в памяти (LRU + TTL) перед таблицей faq_cache
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple, Union
+from config import CACHE_SIZE, CACHE_TTL, CACHE_USAGE_FLUSH_SIZE, CACHE_USAGE_FLUSH_INTERVAL
+from database import DatabaseManager
+from telemetry import TelemetryBuffer
+
+logger = logging.getLogger(__name__)
+
+class AnswerCache:
+    """
+    Двухуровневый кэш ответов: LRU в памяти процесса и faq_cache в SQLite.
+
+    Попадание в память не обращается к БД. Промах в асинхронном коде
+    (get_async) читает faq_cache в потоке, не блокируя event loop. Записи
+    идут через writer - буфер телеметрии (write-behind) или сам
+    DatabaseManager: новый ответ сразу попадает в память и ставится
+    в очередь записи, а usage_count и last_used накапливаются и
+    отправляются пакетом раз в CACHE_USAGE_FLUSH_SIZE обращений или
+    CACHE_USAGE_FLUSH_INTERVAL секунд.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 writer: Optional[Union[DatabaseManager, TelemetryBuffer]] = None):
+        self.db_manager = db_manager
+        self.writer = writer or db_manager
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # question_hash -> (ответ, время истечения)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # question_hash -> (обращений, время последнего обращения)
+        self._pending_usage: Dict[str, Tuple[int, str]] = {}
+        self._pending_count = 0
+        self._last_flush = time.time()
+
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def preload(self) -> int:
+        """Прогрев кэша самыми востребованными ответами из faq_cache"""
+        rows = self.db_manager.get_hot_faq(self.max_size)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            # Загружаем от менее популярных к более популярным: последние - самые свежие в LRU
+            for question_hash, answer in reversed(rows):
+                self._entries[question_hash] = (answer, expires_at)
+            self._evict()
+        if rows:
+            logger.info(f"Кэш ответов прогрет: {len(rows)} записей")
+        return len(rows)
+
+    def get(self, question_hash: str) -> Optional[str]:
+        """Поиск ответа: сначала в памяти, затем в faq_cache"""
+        answer = self._get_memory(question_hash)
+        if answer is None:
+            answer = self._found_in_db(question_hash, self.db_manager.get_cached_faq(question_hash, touch=False))
+        self._maybe_flush_usage()
+        return answer
+
+    async def get_async(self, question_hash: str) -> Optional[str]:
+        """Поиск ответа без блокировки event loop: faq_cache читается в потоке"""
+        answer = self._get_memory(question_hash)
+        if answer is None:
+            answer = self._found_in_db(question_hash, await asyncio.to_thread(
+                self.db_manager.get_cached_faq, question_hash, False))
+        self._maybe_flush_usage()
+        return answer
+
+    def _get_memory(self, question_hash: str) -> Optional[str]:
+        """Поиск ответа в памяти (устаревшая запись удаляется)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(question_hash)
+            if entry is None:
+                return None
+            answer, expires_at = entry
+            if expires_at <= now:
+                del self._entries[question_hash]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(question_hash)
+            self.hits += 1
+            self._record_usage(question_hash)
+            return answer
+
+    def _found_in_db(self, question_hash: str, answer: Optional[str]) -> Optional[str]:
+        """Учет результата чтения faq_cache и сохранение найденного ответа в памяти"""
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.db_hits += 1
+                self._store(question_hash, answer)
+                self._record_usage(question_hash)
+        return answer
+
+    def put(self, question_hash: str, question: str, answer: str):
+        """Сохранение ответа в память и в faq_cache (через writer)"""
+        with self._lock:
+            self._store(question_hash, answer)
+        self.writer.cache_faq_answer(question_hash, question, answer)
+
+    def _store(self, question_hash: str, answer: str):
+        """Добавление записи в LRU (вызывается под блокировкой)"""
+        self._entries[question_hash] = (answer, time.time() + self.ttl)
+        self._entries.move_to_end(question_hash)
+        self._evict()
+
+    def _evict(self):
+        """Вытеснение самых давно использованных записей сверх max_size"""
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _record_usage(self, question_hash: str):
+        """Учет обращения для отложенной записи в БД (вызывается под блокировкой)"""
+        count, _ = self._pending_usage.get(question_hash, (0, None))
+        self._pending_usage[question_hash] = (
+            count + 1, datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        )
+        self._pending_count += 1
+
+    def _maybe_flush_usage(self):
+        """Сброс счетчиков, если накопилось достаточно или прошло время"""
+        if (self._pending_count >= CACHE_USAGE_FLUSH_SIZE or
+                (self._pending_usage and time.time() - self._last_flush >= CACHE_USAGE_FLUSH_INTERVAL)):
+            self.flush_usage()
+
+    def flush_usage(self):
+        """Пакетная запись usage_count и last_used в faq_cache"""
+        with self._lock:
+            usage, self._pending_usage = self._pending_usage, {}
+            self._pending_count = 0
+            self._last_flush = time.time()
+        if usage:
+            self.writer.record_faq_usage(usage)
+
+    def clear(self):
+        """Очистка кэша в памяти (faq_cache не затрагивается)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
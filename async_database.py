@@ -0,0 +1,111 @@
+"""
+Асинхронный фасад над DatabaseManager для обработчиков Telegram
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+from config import DB_READER_THREADS
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabaseManager:
+    """
+    Неблокирующий доступ к базе данных из event loop.
+
+    Все записи выполняются последовательно в одном выделенном потоке записи,
+    поэтому процессы конкурируют за блокировку SQLite, а потоки одного
+    процесса - нет. Чтения идут через небольшой пул потоков: в режиме WAL
+    они не блокируются записью. Каждый поток работает со своим
+    долгоживущим соединением DatabaseManager, а повторы при блокировке БД
+    выполняет сам DatabaseManager.
+    """
+
+    def __init__(self, db_manager: Optional[DatabaseManager] = None, reader_threads: int = DB_READER_THREADS):
+        self.db_manager = db_manager or DatabaseManager()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=reader_threads, thread_name_prefix='db-reader')
+
+    async def _write(self, func, *args, **kwargs):
+        """Выполнение записи в потоке записи"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args, **kwargs))
+
+    async def _read(self, func, *args, **kwargs):
+        """Выполнение чтения в пуле потоков чтения"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args, **kwargs))
+
+    async def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        """Добавление нового пользователя"""
+        return await self._write(self.db_manager.add_user, user_id, username, first_name, last_name)
+
+    async def log_request(self, user_id: int, question: str, answer: str, is_relevant: bool,
+                          question_type: str = None, response_time: float = None):
+        """Логирование запроса и ответа"""
+        return await self._write(self.db_manager.log_request, user_id, question, answer,
+                                 is_relevant, question_type, response_time)
+
+    async def log_channel_visit(self, user_id: int):
+        """Логирование перехода в канал"""
+        return await self._write(self.db_manager.log_channel_visit, user_id)
+
+    async def rollup_statistics(self) -> int:
+        """Досчет дневных агрегатов статистики"""
+        return await self._write(self.db_manager.rollup_statistics)
+
+    async def get_statistics(self, days: int = 7) -> Dict:
+        """Получение статистики за указанное количество дней (с досчетом закрытых дней)"""
+        await self.rollup_statistics()
+        return await self._read(self.db_manager.get_statistics, days)
+
+    async def get_token_usage(self, days: int = 7, group_by: str = 'question_type', limit: int = 20) -> List[Dict]:
+        """Расход токенов за N дней по группам (с досчетом закрытых дней)"""
+        await self.rollup_statistics()
+        return await self._read(self.db_manager.get_token_usage, days, group_by, limit)
+
+    async def get_top_users(self, limit: int = 10) -> List[Tuple]:
+        """Получение самых активных пользователей"""
+        return await self._read(self.db_manager.get_top_users, limit)
+
+    async def get_channel_visit_stats(self, days: int = 7) -> Tuple[int, int]:
+        """Получение статистики переходов в канал"""
+        return await self._read(self.db_manager.get_channel_visit_stats, days)
+
+    async def cache_faq_answer(self, question_hash: str, question: str, answer: str):
+        """Кэширование ответа FAQ"""
+        return await self._write(self.db_manager.cache_faq_answer, question_hash, question, answer)
+
+    async def get_cached_faq(self, question_hash: str) -> Optional[str]:
+        """Получение кэшированного ответа FAQ (обновляет last_used, поэтому через поток записи)"""
+        return await self._write(self.db_manager.get_cached_faq, question_hash)
+
+    async def schedule_auto_message(self, user_id: int, message_type: str, delay_hours: int):
+        """Планирование автосообщения"""
+        return await self._write(self.db_manager.schedule_auto_message, user_id, message_type, delay_hours)
+
+    async def get_pending_auto_messages(self) -> List[Tuple]:
+        """Получение запланированных автосообщений, которые нужно отправить"""
+        return await self._read(self.db_manager.get_pending_auto_messages)
+
+    async def mark_auto_message_sent(self, message_id: int):
+        """Отметка автосообщения как отправленного"""
+        return await self._write(self.db_manager.mark_auto_message_sent, message_id)
+
+    async def has_auto_message_scheduled(self, user_id: int, message_type: str) -> bool:
+        """Проверка, запланировано ли уже автосообщение данного типа для пользователя"""
+        return await self._read(self.db_manager.has_auto_message_scheduled, user_id, message_type)
+
+    async def has_recent_auto_messages(self, user_id: int, days: int = 14) -> bool:
+        """Проверка, отправлялись ли автосообщения пользователю в последние N дней"""
+        return await self._read(self.db_manager.has_recent_auto_messages, user_id, days)
+
+    def close(self):
+        """Завершение потоков и закрытие соединений"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db_manager.close()
+        logger.info("Асинхронный доступ к БД остановлен")
@@ -8,7 +8,7 @@ from datetime import datetime
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import TelegramError
 from config import TELEGRAM_BOT_TOKEN, SPECIALIST_CONTACTS
-from database import DatabaseManager
+from async_database import AsyncDatabaseManager
 from log_config import setup_logging
 
 logger = setup_logging('auto_messenger')
@@ -16,7 +16,7 @@ logger = setup_logging('auto_messenger')
 class AutoMessenger:
     def __init__(self):
         self.bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        self.db_manager = DatabaseManager()
+        self.db = AsyncDatabaseManager()
         
     def get_auto_message_text(self, message_type: str) -> tuple:
         """Получение текста автосообщения по типу"""
@@ -96,7 +96,7 @@ class AutoMessenger:
     async def process_pending_messages(self):
         """Обработка запланированных автосообщений"""
         try:
-            pending_messages = self.db_manager.get_pending_auto_messages()
+            pending_messages = await self.db.get_pending_auto_messages()
             
             for message_id, user_id, message_type, scheduled_time in pending_messages:
                 logger.info(f"Обработка автосообщения {message_id} для пользователя {user_id}")
@@ -104,7 +104,7 @@ class AutoMessenger:
                 success = await self.send_auto_message(user_id, message_type)
                 
                 # Отмечаем сообщение как отправленное независимо от результата
-                self.db_manager.mark_auto_message_sent(message_id)
+                await self.db.mark_auto_message_sent(message_id)
                 
                 if success:
                     logger.info(f"Автосообщение {message_id} успешно отправлено")
@@ -124,6 +124,8 @@ class AutoMessenger:
         while True:
             try:
                 await self.process_pending_messages()
+                # Заодно досчитываем дневную статистику за закрытые дни
+                await self.db.rollup_statistics()
                 # Проверяем каждые 5 минут
                 await asyncio.sleep(300)
             except Exception as e:
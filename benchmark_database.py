@@ -0,0 +1,85 @@
+"""
+Бенчмарк накладных расходов базы данных на одно сообщение пользователя
+
+Воспроизводит последовательность вызовов DatabaseManager, которую делает
+TradingBot.handle_message на каждое сообщение, и сравнивает:
+- "до": новое соединение sqlite3.connect() и commit на каждый вызов
+- "после": долгоживущие соединения ConnectionManager (WAL, прагмы, кэш выражений)
+
+Запуск: python benchmark_database.py [количество_сообщений]
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import DatabaseManager
+
+class PerCallConnections:
+    """Старое поведение: отдельное соединение на каждый вызов"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    @contextmanager
+    def connection(self):
+        with sqlite3.connect(self.db_path) as conn:
+            yield conn
+
+    def pop_lock_error(self):
+        return None
+
+    def close_all(self):
+        pass
+
+def simulate_message(db: DatabaseManager, user_id: int):
+    """Вызовы БД, которые делает обработка одного сообщения"""
+    question = "Какие документы нужны для участия в торгах?"
+    db.has_recent_auto_messages(user_id, days=14)
+    db.has_auto_message_scheduled(user_id, '1hour')
+    db.has_auto_message_scheduled(user_id, '3days')
+    db.get_cached_faq("bench_question_hash")
+    db.log_request(user_id, question, "Ответ", True, 'documents', 0.5)
+
+def run(db: DatabaseManager, messages: int) -> float:
+    """Среднее время обработки сообщения в миллисекундах"""
+    db.add_user(1, "bench", "Bench", "User")
+    db.cache_faq_answer("bench_question_hash", "вопрос", "ответ")
+    for i in range(10):  # прогрев
+        simulate_message(db, 1 + i % 50)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        simulate_message(db, 1 + i % 50)
+    return (time.perf_counter() - start) * 1000 / messages
+
+def main():
+    """Главная функция бенчмарка"""
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_db = DatabaseManager(os.path.join(tmp_dir, 'legacy.db'))
+        legacy_db.close()
+        with sqlite3.connect(legacy_db.db_path) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')  # режим журнала по умолчанию
+        legacy_db._connections = PerCallConnections(legacy_db.db_path)
+
+        pooled_db = DatabaseManager(os.path.join(tmp_dir, 'pooled.db'))
+
+        before = run(legacy_db, messages)
+        after = run(pooled_db, messages)
+        pooled_db.close()
+
+    print(f"📊 Накладные расходы БД на сообщение ({messages} сообщений):")
+    print(f"   - До (соединение на вызов): {before:.3f} мс")
+    print(f"   - После (ConnectionManager): {after:.3f} мс")
+    print(f"   - Ускорение: x{before / max(after, 1e-9):.1f}")
+
+if __name__ == "__main__":
+    main()
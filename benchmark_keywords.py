@@ -0,0 +1,99 @@
+"""
+Микро-бенчмарк поиска ключевых слов по залогированным вопросам
+
+Сравнивает прежнюю схему (отдельные проверки any(keyword in text) для
+вежливых фраз, ключевых слов торгов, типа вопроса и упоминания специалистов)
+с одним проходом KeywordMatcher и проверяет, что результаты совпадают.
+
+Вопросы берутся из таблицы requests; если она пуста - из встроенного набора.
+
+Запуск: python benchmark_keywords.py [путь_к_БД] [повторов]
+"""
+
+import os
+import sys
+import sqlite3
+import time
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import DATABASE_PATH
+from keyword_matcher import KEYWORD_MATCHER, classify_question_type
+from prompts import POLITE_PHRASES, TRADE_KEYWORDS, QUESTION_TYPE_KEYWORDS, SPECIALIST_KEYWORDS
+
+SAMPLE_QUESTIONS = [
+    "Привет!",
+    "Какие документы нужны для участия в торгах по банкротству?",
+    "Что такое залог и чем он отличается от задатка?",
+    "Как выбрать стратегию ставок на аукционе?",
+    "Где посмотреть статью 110 ФЗ-127 о продаже имущества должника?",
+    "Стоит ли покупать квартиру с обременением?",
+    "Какая погода завтра в Москве?",
+    "Как стать финансовым управляющим?",
+    "Спасибо большое за помощь",
+    "Расскажите про акт ответственного хранения автомобиля",
+]
+
+def load_questions(db_path: str):
+    """Вопросы из таблицы requests"""
+    if not os.path.exists(db_path):
+        return []
+    try:
+        with sqlite3.connect(db_path) as conn:
+            return [row[0] for row in conn.execute('SELECT question FROM requests WHERE question IS NOT NULL')]
+    except sqlite3.Error:
+        return []
+
+def legacy_classify(text: str):
+    """Прежняя схема: отдельный проход any() на каждую категорию"""
+    text_lower = text.lower()
+    categories = set()
+    if any(phrase in text_lower for phrase in POLITE_PHRASES):
+        categories.add('polite')
+    if any(keyword in text_lower for keyword in TRADE_KEYWORDS):
+        categories.add('trade')
+    for question_type, keywords in QUESTION_TYPE_KEYWORDS.items():
+        if any(keyword in text_lower for keyword in keywords):
+            categories.add(question_type)
+    if any(keyword in text_lower for keyword in SPECIALIST_KEYWORDS):
+        categories.add('specialist')
+    return frozenset(categories)
+
+def measure(func, questions, repeats: int) -> float:
+    """Среднее время на вопрос в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for question in questions:
+            func(question)
+    return (time.perf_counter() - start) * 1_000_000 / (repeats * len(questions))
+
+def main():
+    """Главная функция бенчмарка"""
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    questions = load_questions(db_path)
+    source = f"таблица requests ({db_path})"
+    if not questions:
+        questions = SAMPLE_QUESTIONS
+        source = "встроенный набор"
+
+    mismatches = [q for q in questions if legacy_classify(q) != KEYWORD_MATCHER.match(q)]
+    legacy_time = measure(legacy_classify, questions, repeats)
+    matcher_time = measure(KEYWORD_MATCHER.match, questions, repeats)
+
+    types = {}
+    for question in questions:
+        question_type = classify_question_type(KEYWORD_MATCHER.match(question))
+        types[question_type] = types.get(question_type, 0) + 1
+
+    print(f"📊 Поиск ключевых слов: {len(questions)} вопросов, источник - {source}")
+    print(f"   - Прежняя схема (any по категориям): {legacy_time:.1f} мкс/вопрос")
+    print(f"   - KeywordMatcher (один проход): {matcher_time:.1f} мкс/вопрос")
+    print(f"   - Ускорение: x{legacy_time / max(matcher_time, 1e-9):.1f}")
+    print(f"   - Расхождений с прежней схемой: {len(mismatches)}")
+    print(f"   - Типы вопросов: {types}")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@
 
 import logging
 import asyncio
+from typing import Any, Dict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, 
@@ -13,7 +14,16 @@ from telegram.ext import (
     filters, 
     ContextTypes
 )
-from config import TELEGRAM_BOT_TOKEN, SPECIALIST_CONTACTS, TRAINING_CONTACTS, MAX_MESSAGE_LENGTH
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    SPECIALIST_CONTACTS,
+    TRAINING_CONTACTS,
+    MAX_MESSAGE_LENGTH,
+    MAX_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_SNAPSHOT_INTERVAL,
+    KEY_STATS_LOG_INTERVAL,
+    STREAM_ANSWERS
+)
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +33,11 @@ load_dotenv()
 # Получаем ID канала из переменных окружения (как в рабочем боте)
 KNOWLEDGE_CHANNEL_ID = os.getenv("GROUP_ID_KNOWLEDGE")
 from database import DatabaseManager
+from async_database import AsyncDatabaseManager
+from telemetry import TelemetryBuffer
+from rate_limiter import RateLimiter
+from keyword_matcher import KEYWORD_MATCHER
+from streaming_reply import StreamingReply
 from ai_service import AIService
 
 # Настройка логирования
@@ -32,17 +47,24 @@ logger = setup_logging('main_bot')
 class TradingBot:
     def __init__(self):
         self.db_manager = DatabaseManager()
-        self.ai_service = AIService(self.db_manager)
+        self.db = AsyncDatabaseManager(self.db_manager)
+        self.telemetry = TelemetryBuffer(self.db_manager)
+        self.rate_limiter = RateLimiter(self.db_manager)
+        self.rate_limiter.load_snapshot()
+        self._background_tasks = []
+        self.ai_service = AIService(self.db_manager, self.telemetry)
         
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        self.db_manager.add_user(
+        await self.db.add_user(
             user.id, 
             user.username, 
             user.first_name, 
             user.last_name
         )
+        # Новый старт - новый диалог: уточнения не относятся к прежним вопросам
+        self.ai_service.conversations.clear(user.id)
         
         keyboard = [
             [InlineKeyboardButton("🤖 Ответы на вопросы", callback_data="ask_question")],
@@ -81,9 +103,9 @@ class TradingBot:
 /stats - статистика (только для админов)
 
 Ограничения:
-• Максимум 10 вопросов в минуту
+• Максимум {} вопросов в минуту
 • Ответы только по теме торгов по банкротству
-        """
+        """.format(MAX_REQUESTS_PER_MINUTE)
         await update.message.reply_text(help_text)
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -93,7 +115,7 @@ class TradingBot:
         # Здесь можно добавить проверку на админа
         # Пока что доступно всем для тестирования
         
-        stats = self.ai_service.get_statistics()
+        stats = await self.db.get_statistics()
         
         if stats:
             stats_text = f"""
@@ -135,7 +157,7 @@ class TradingBot:
             
         elif query.data == "knowledge_base":
             # Логируем переход в канал
-            self.db_manager.log_channel_visit(user_id)
+            self.telemetry.log_channel_visit(user_id)
             
             # Перенаправляем пользователя в канал (как в другом боте)
             try:
@@ -206,18 +228,15 @@ class TradingBot:
         user_id = update.effective_user.id
         message_text = update.message.text
         
-        # Проверяем лимиты пользователя
-        if not self.db_manager.check_user_limits(user_id):
+        # Проверяем лимиты пользователя (проверка и списание запроса атомарны)
+        if not await self.rate_limiter.acquire(user_id):
             await update.message.reply_text(
                 "⏰ Слишком много запросов! Подождите минуту и попробуйте снова."
             )
             return
         
-        # Увеличиваем счетчик запросов
-        self.db_manager.increment_user_requests(user_id)
-        
         # Планируем автосообщения только при первом вопросе пользователя
-        self._schedule_follow_up_messages(user_id)
+        await self._schedule_follow_up_messages(user_id)
         
         # Проверяем длину сообщения
         if len(message_text) > MAX_MESSAGE_LENGTH:
@@ -228,34 +247,24 @@ class TradingBot:
         
         # Отправляем сообщение о том, что бот думает
         thinking_message = await update.message.reply_text("🤔 Думаю над ответом...")
+        # Ответ появляется на месте сообщения "думаю" (длинный - продолжается в новых сообщениях)
+        reply = StreamingReply(thinking_message, update.message.reply_text)
         
         try:
-            # Получаем ответ от ИИ
-            result = self.ai_service.generate_answer(message_text, user_id)
-            
-            # Удаляем сообщение "думаю"
-            await thinking_message.delete()
+            # Получаем ответ от ИИ, показывая текст по мере генерации
+            result = await self.ai_service.generate_answer_async(
+                message_text, user_id, on_delta=reply.update if STREAM_ANSWERS else None
+            )
             
-            # Отправляем ответ
+            # Показываем окончательный ответ
             answer = result['answer']
-            
-            # Если ответ слишком длинный, разбиваем на части
-            if len(answer) > MAX_MESSAGE_LENGTH:
-                parts = [answer[i:i+MAX_MESSAGE_LENGTH] for i in range(0, len(answer), MAX_MESSAGE_LENGTH)]
-                for i, part in enumerate(parts):
-                    if i == 0:
-                        await update.message.reply_text(part)
-                    else:
-                        await update.message.reply_text(part)
-            else:
-                await update.message.reply_text(answer)
+            await reply.finish(answer)
             
             # Показываем кнопки в зависимости от контекста
             keyboard = []
             
             # Если в ответе упоминаются специалисты, добавляем кнопку связи
-            specialist_keywords = ['специалист', 'эксперт', 'консультац', 'помощь', 'анализ', 'наши специалисты', 'наши эксперты']
-            if any(keyword in answer.lower() for keyword in specialist_keywords):
+            if 'specialist' in KEYWORD_MATCHER.match(answer):
                 keyboard.append([InlineKeyboardButton("👨‍💼 Связаться со специалистом", callback_data="contact_specialist")])
             
             # Всегда добавляем кнопку главного меню
@@ -288,7 +297,7 @@ class TradingBot:
             reply_markup=reply_markup
         )
     
-    def _schedule_follow_up_messages(self, user_id: int):
+    async def _schedule_follow_up_messages(self, user_id: int):
         """Планирование автосообщений для пользователя"""
         try:
             # Исключаем админа из автосообщений
@@ -297,31 +306,130 @@ class TradingBot:
                 return
             
             # Проверяем, не отправлялись ли уже автосообщения в последние 14 дней
-            if self.db_manager.has_recent_auto_messages(user_id, days=14):
+            if await self.db.has_recent_auto_messages(user_id, days=14):
                 logger.info(f"Пользователю {user_id} уже отправлялись автосообщения в последние 14 дней")
                 return
             
             # Проверяем, не планировались ли уже автосообщения для этого пользователя
-            if (self.db_manager.has_auto_message_scheduled(user_id, '1hour') or 
-                self.db_manager.has_auto_message_scheduled(user_id, '3days')):
+            if (await self.db.has_auto_message_scheduled(user_id, '1hour') or 
+                await self.db.has_auto_message_scheduled(user_id, '3days')):
                 logger.info(f"Автосообщения для пользователя {user_id} уже запланированы")
                 return
             
             # Планируем сообщение через час
-            self.db_manager.schedule_auto_message(user_id, '1hour', 1)
+            await self.db.schedule_auto_message(user_id, '1hour', 1)
             logger.info(f"Запланировано автосообщение через час для пользователя {user_id}")
             
             # Планируем сообщение через 3 дня
-            self.db_manager.schedule_auto_message(user_id, '3days', 72)  # 72 часа = 3 дня
+            await self.db.schedule_auto_message(user_id, '3days', 72)  # 72 часа = 3 дня
             logger.info(f"Запланировано автосообщение через 3 дня для пользователя {user_id}")
                 
         except Exception as e:
             logger.error(f"Ошибка планирования автосообщений: {e}")
     
+    async def post_init(self, application: Application):
+        """Запуск фоновых задач после инициализации бота"""
+        if RATE_LIMIT_SNAPSHOT_INTERVAL and not self.rate_limiter.shared:
+            self._background_tasks.append(
+                asyncio.create_task(self.rate_limiter.run_snapshots(RATE_LIMIT_SNAPSHOT_INTERVAL))
+            )
+        if KEY_STATS_LOG_INTERVAL:
+            self._background_tasks.append(asyncio.create_task(self._log_service_stats()))
+    
+    async def _log_service_stats(self):
+        """Периодическая запись статистики API ключей и кэшей в лог"""
+        while True:
+            await asyncio.sleep(KEY_STATS_LOG_INTERVAL)
+            try:
+                self._log_stats_snapshot(self.ai_service.get_stats())
+            except Exception as e:
+                # Ошибка одного снимка не должна останавливать фоновую задачу
+                logger.error(f"Ошибка записи статистики сервиса: {e}")
+    
+    @staticmethod
+    def _log_stats_snapshot(service_stats: Dict[str, Any]):
+        """Запись снимка статистики AIService.get_stats() в лог"""
+        cache_stats = service_stats['answer_cache']
+        logger.info(
+            f"Кэш ответов: {cache_stats['size']}/{cache_stats['max_size']}, "
+            f"попаданий {cache_stats['hits']} (из БД {cache_stats['db_hits']}), "
+            f"промахов {cache_stats['misses']}, вытеснений {cache_stats['evictions']}, "
+            f"hit rate {cache_stats['hit_rate']}"
+        )
+        semantic_stats = service_stats['semantic_cache']
+        logger.info(
+            f"Семантический кэш: {semantic_stats['size']}/{semantic_stats['max_size']}, "
+            f"попаданий {semantic_stats['hits']}, промахов {semantic_stats['misses']}, "
+            f"hit rate {semantic_stats['hit_rate']}"
+        )
+        relevance_stats = service_stats['relevance_cache']
+        logger.info(
+            f"Кэш релевантности: {relevance_stats['size']}/{relevance_stats['max_size']}, "
+            f"попаданий {relevance_stats['hits']} (из БД {relevance_stats['db_hits']}), "
+            f"промахов {relevance_stats['misses']}, hit rate {relevance_stats['hit_rate']}"
+        )
+        batch_stats = service_stats['relevance_batch']
+        logger.info(
+            f"Пакетная проверка релевантности: пакетов {batch_stats['batches']} "
+            f"({batch_stats['batched_questions']} вопросов), одиночных {batch_stats['single']}, "
+            f"откатов к одиночным {batch_stats['fallbacks']}, "
+            f"к локальным вердиктам {batch_stats['local_fallbacks']}"
+        )
+        routing_stats = service_stats['routing']
+        if routing_stats['enabled']:
+            logger.info(
+                f"Маршрутизация моделей: решения {routing_stats['decisions']}, "
+                f"задержки уровней {routing_stats['tiers']}"
+            )
+        conversation_stats = service_stats['conversations']
+        logger.info(
+            f"Диалоги: {conversation_stats['users']} пользователей, {conversation_stats['turns']} реплик, "
+            f"сжато {conversation_stats['summarized']}, отброшено по лимиту {conversation_stats['dropped']}"
+        )
+        budget_stats = service_stats['answer_budget']
+        logger.info(
+            f"Лимиты токенов ответов: {budget_stats['limits'] or 'по умолчанию'}, "
+            f"обрезанных ответов {budget_stats['truncated']}"
+        )
+        hedge_stats = service_stats['hedging']
+        if hedge_stats['enabled']:
+            logger.info(
+                f"Дублирование запросов: {hedge_stats['hedged']} из {hedge_stats['requests']} "
+                f"({hedge_stats['hedge_rate']}), копия ответила первой {hedge_stats['hedge_wins']}, "
+                f"пропущено из-за лимита {hedge_stats['skipped']}"
+            )
+        speculation_stats = service_stats['speculation']
+        if speculation_stats['enabled']:
+            logger.info(
+                f"Спекулятивные ответы: использовано {speculation_stats['wins']}, "
+                f"отброшено {speculation_stats['losses']} (~{speculation_stats['wasted_tokens']} токенов), "
+                f"пропущено из-за бюджета {speculation_stats['skipped']}"
+            )
+        flight_stats = service_stats['single_flight']
+        logger.info(
+            f"Объединение запросов: запусков {flight_stats['calls']}, "
+            f"ответов из уже идущих {flight_stats['shared']}"
+        )
+        for stats in service_stats['keys']:
+            logger.info(
+                f"Ключ {stats['key']}: {stats['state']}, запросов {stats['requests']}, "
+                f"ошибок {stats['errors']}, отклонено (4xx) {stats['rejected']}, 429: {stats['throttled']}, "
+                f"p50 {stats['latency_p50']} с, p95 {stats['latency_p95']} с"
+            )
+    
+    async def shutdown(self, application: Application):
+        """Освобождение ресурсов при остановке бота"""
+        for task in self._background_tasks:
+            task.cancel()
+        self.rate_limiter.save_snapshot()
+        await self.ai_service.aclose()
+        self.telemetry.close()
+        self.db.close()
+    
     def run(self):
         """Запуск бота"""
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).post_init(self.post_init).post_shutdown(self.shutdown).build()
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start_command))
@@ -339,7 +447,7 @@ class TradingBot:
     async def run_async(self):
         """Асинхронный запуск бота"""
         # Создаем приложение
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).post_init(self.post_init).post_shutdown(self.shutdown).build()
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start_command))
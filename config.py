@@ -19,6 +19,32 @@ MISTRAL_API_KEYS = [
     os.getenv('MISTRAL_API_KEY_3', 'YOUR_MISTRAL_API_KEY_3_HERE'),
 ]
 MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+MISTRAL_MODEL = 'mistral-small-latest'
+MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'false').lower() == 'true'  # Выбор модели по типу вопроса
+# Уровни моделей для ответов (потолок max_tokens и температура каждого уровня)
+MODEL_TIERS = {
+    'fast': {'model': 'ministral-8b-latest', 'max_tokens': 400, 'temperature': 0.5},
+    'default': {'model': MISTRAL_MODEL, 'max_tokens': 1000, 'temperature': 0.7},
+    'large': {'model': 'mistral-large-latest', 'max_tokens': 1000, 'temperature': 0.3},
+}
+MODEL_DEFAULT_TIER = 'default'
+MODEL_LARGE_TYPES = ['legal', 'strategy']  # Типы вопросов для уровня 'large'
+MODEL_FAST_MAX_QUESTION_TOKENS = 8  # Короткие вопросы общего типа - в уровень 'fast'
+MODEL_ROUTING_CONFIDENCE = 0.8  # Минимальная уверенность в типе вопроса для уровня 'large'
+MISTRAL_CONNECT_TIMEOUT = 5  # Таймаут установки соединения в секундах
+MISTRAL_READ_TIMEOUT = 30  # Таймаут ожидания ответа в секундах
+MISTRAL_MAX_CONNECTIONS = 20  # Пул keep-alive соединений на один API ключ
+KEY_COOLDOWN_SECONDS = 30  # Пауза ключа после 429 без заголовка Retry-After
+KEY_CIRCUIT_FAILURES = 3  # Ошибок подряд до отключения ключа
+KEY_CIRCUIT_OPEN_SECONDS = 60  # На сколько отключается ключ
+KEY_LATENCY_WINDOW = 200  # Последних запросов для расчета p50/p95 по ключу
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'  # Дублировать медленные запросы на другой ключ
+HEDGE_PERCENTILE = 90  # Копия отправляется, если ответа нет дольше этого перцентиля задержек
+HEDGE_MIN_DELAY = 0.5  # Но не раньше чем через N секунд
+HEDGE_MIN_SAMPLES = 20  # Замеров задержки по виду запроса до начала дублирования
+HEDGE_LATENCY_WINDOW = 200  # Последних запросов для расчета перцентиля и доли копий
+HEDGE_MAX_RATIO = 0.1  # Не больше 10% запросов дублируются
+KEY_STATS_LOG_INTERVAL = 300  # Запись статистики ключей и кэша в лог раз в N секунд (0 - отключено)
 
 # Канал базы знаний
 KNOWLEDGE_CHANNEL_ID = os.getenv('KNOWLEDGE_CHANNEL_ID', 'YOUR_CHANNEL_ID_HERE')
@@ -38,9 +64,26 @@ TRAINING_CONTACTS = {
 # Настройки безопасности
 MAX_REQUESTS_PER_MINUTE = 10  # Максимум запросов в минуту от одного пользователя
 MAX_MESSAGE_LENGTH = 4000  # Максимальная длина сообщения
+RATE_LIMIT_WINDOW = 60  # Окно лимита запросов в секундах
+RATE_LIMIT_MAX_USERS = 100000  # Максимум пользователей в памяти лимитера
+RATE_LIMIT_SNAPSHOT_INTERVAL = 60  # Снимок лимитов в БД раз в N секунд (0 - отключено)
+RATE_LIMIT_SHARED = os.getenv('RATE_LIMIT_SHARED', 'false').lower() == 'true'  # Общая квота для нескольких процессов
 
 # Настройки базы данных
 DATABASE_PATH = 'trading_bot.db'
+DB_BUSY_TIMEOUT_MS = 5000  # Ожидание блокировки БД другим процессом
+DB_CACHE_SIZE_KB = 8192  # Кэш страниц SQLite на соединение (8MB)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # Отображение файла БД в память (64MB)
+DB_STATEMENT_CACHE_SIZE = 128  # Кэш подготовленных выражений на соединение
+DB_LOCK_RETRIES = 3  # Повторы операции, если БД заблокирована другим процессом
+DB_LOCK_RETRY_DELAY = 0.1  # Начальная задержка между повторами в секундах
+DB_READER_THREADS = 4  # Потоки чтения асинхронного фасада БД
+STATISTICS_ROLLUP_GRACE_MINUTES = 5  # День закрывается в агрегатах спустя N минут после полуночи (UTC)
+
+# Настройки буферизованной записи телеметрии
+TELEMETRY_BATCH_SIZE = 50  # Сброс буфера при накоплении N строк
+TELEMETRY_FLUSH_INTERVAL_MS = 500  # ...или не реже чем раз в T миллисекунд
+TELEMETRY_MAX_BUFFER = 10000  # Предел буфера, если БД долго недоступна
 
 # Настройки логирования
 LOG_DIR = 'logs'
@@ -52,3 +95,49 @@ LOG_RETENTION_DAYS = 30
 # Настройки кэширования
 CACHE_SIZE = 100  # Количество кэшированных ответов
 CACHE_TTL = 3600  # Время жизни кэша в секундах (1 час)
+CACHE_USAGE_FLUSH_SIZE = 50  # Сброс счетчиков использования FAQ в БД каждые N обращений
+CACHE_USAGE_FLUSH_INTERVAL = 60  # ...или не реже чем раз в N секунд
+SEMANTIC_CACHE_SIZE = 2000  # Отвеченных вопросов в семантическом кэше
+SEMANTIC_CACHE_THRESHOLD = 0.25  # Минимальная косинусная близость кандидата (смысл проверяется по словам)
+SEMANTIC_CACHE_TOP_K = 3  # Сколько похожих вопросов возвращает поиск
+FAQ_INDEX_SIZE = 5000  # Вопросов FAQ в индексе для поиска по ключевым словам
+FAQ_MIN_SCORE = 0.6  # Минимальная доля совпавшего веса вопроса (BM25) для ответа из FAQ
+RELEVANCE_CACHE_SIZE = 5000  # Вердиктов релевантности в памяти процесса
+RELEVANCE_CACHE_TTL = 7 * 24 * 3600  # Время жизни вердикта релевантности (7 дней)
+RELEVANCE_BATCH_WINDOW = 0.03  # Сколько секунд собирать вопросы в пакет проверки (0 - без пакетов)
+RELEVANCE_BATCH_SIZE = 10  # Максимум вопросов в одном пакетном запросе
+PREWARM_TOP_N = 100  # Популярных вопросов для предварительной генерации ответов (prewarm_cache.py)
+PREWARM_DAYS = 7  # За сколько дней считать популярность вопросов
+PREWARM_CONCURRENCY = 4  # Одновременных запросов к Mistral API при прогреве
+PREWARM_TOKEN_BUDGET = 200000  # Максимум токенов (промпт + ответ) на один запуск прогрева
+PREWARM_KEY_RPM = 20  # Запросов в минуту на один API ключ при прогреве
+
+# Локальный классификатор вопросов (обучается скриптом train_classifier.py)
+CLASSIFIER_MODEL_PATH = 'question_classifier.json'
+CLASSIFIER_RELEVANCE_CONFIDENCE = 0.95  # Ниже этой уверенности релевантность проверяет ИИ
+CLASSIFIER_TYPE_CONFIDENCE = 0.8  # Минимальная уверенность для типа вопроса
+
+# Потоковые ответы (текст появляется по мере генерации)
+STREAM_ANSWERS = os.getenv('STREAM_ANSWERS', 'true').lower() == 'true'
+STREAM_EDIT_INTERVAL = 1.0  # Не чаще одной правки сообщения в N секунд
+
+# Спекулятивная генерация ответа одновременно с проверкой релевантности через ИИ
+SPECULATIVE_ANSWERS = os.getenv('SPECULATIVE_ANSWERS', 'false').lower() == 'true'
+SPECULATIVE_TOKEN_BUDGET = 50000  # Максимум токенов на отброшенные ответы за окно
+SPECULATIVE_BUDGET_WINDOW = 3600  # Окно бюджета в секундах
+
+# Бюджет токенов ответа (max_tokens подбирается по длине прошлых ответов того же типа)
+ANSWER_MAX_TOKENS = 1000  # Потолок и значение, пока нет истории ответов
+ANSWER_MIN_TOKENS = 200  # Нижняя граница лимита
+ANSWER_TOKENS_PERCENTILE = 98  # Перцентиль длины прошлых ответов...
+ANSWER_TOKENS_HEADROOM = 1.25  # ...с запасом 25%
+ANSWER_TOKENS_MIN_SAMPLES = 30  # Ответов типа до первой подстройки лимита
+ANSWER_TOKENS_WINDOW = 500  # Последних ответов каждого типа в расчете
+COMPACT_PROMPT_MAX_QUESTION_TOKENS = 6  # Короткие вопросы получают сокращенный системный промпт
+
+# История диалога для уточняющих вопросов
+CONVERSATION_MAX_TURNS = 6  # Последних реплик на пользователя
+CONVERSATION_MAX_TOKENS = 800  # Предел истории в промпте (старые реплики сжимаются или отбрасываются)
+CONVERSATION_IDLE_TTL = 30 * 60  # Диалог без активности забывается через 30 минут
+CONVERSATION_MAX_USERS = 10000  # Максимум хранимых диалогов
+CONVERSATION_SUMMARY_CHARS = 200  # Длина сжатого ответа в истории
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+История диалога с пользователем для уточняющих вопросов
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List
+from config import (
+    CONVERSATION_MAX_TURNS,
+    CONVERSATION_MAX_TOKENS,
+    CONVERSATION_IDLE_TTL,
+    CONVERSATION_MAX_USERS,
+    CONVERSATION_SUMMARY_CHARS
+)
+from text_normalizer import content_words, normalize_question
+from token_budget import estimate_tokens
+
+# Слова, которые отсылают к предыдущей реплике ("а какие документы для этого?")
+_REFERENCE_WORDS = frozenset('''
+    это этого этому этим этом эта эту этой эти этих этими этот
+    тот того тому тем том та ту той те тех
+    он она оно они его ее её него нее неё ему ей им ими их них нем ней
+    там тогда туда оттуда
+'''.split())
+_FOLLOW_UP_STARTS = ('а ', 'и ', 'еще ', 'ещё ', 'тогда ', 'а если', 'а что', 'а как')
+FOLLOW_UP_MAX_WORDS = 6
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s')
+
+def is_follow_up(question: str) -> bool:
+    """Похож ли вопрос на уточнение к предыдущему (короткий, с отсылкой к сказанному)"""
+    text = normalize_question(question)
+    if len(content_words(question)) > FOLLOW_UP_MAX_WORDS:
+        return False
+    return text.startswith(_FOLLOW_UP_STARTS) or any(word in _REFERENCE_WORDS for word in text.split())
+
+def summarize_answer(answer: str, max_chars: int = CONVERSATION_SUMMARY_CHARS) -> str:
+    """Сжатие ответа до первого предложения (не длиннее max_chars)"""
+    first_sentence = _SENTENCE_END_RE.split(answer.strip(), maxsplit=1)[0]
+    if len(first_sentence) <= max_chars:
+        return first_sentence
+    return first_sentence[:max_chars].rsplit(' ', 1)[0] + '...'
+
+class Turn:
+    """Реплика пользователя и ответ бота"""
+
+    __slots__ = ('question', 'answer', 'summary', 'tokens', 'summary_tokens')
+
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+        self.summary = summarize_answer(answer)
+        self.tokens = estimate_tokens(question) + estimate_tokens(answer)
+        self.summary_tokens = estimate_tokens(question) + estimate_tokens(self.summary)
+
+class Conversation:
+    """Кольцевой буфер последних реплик одного пользователя"""
+
+    __slots__ = ('turns', 'last_active')
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.last_active = time.time()
+
+class ConversationStore:
+    """
+    Последние реплики пользователей в памяти процесса.
+
+    На пользователя хранится не больше max_turns реплик. Диалог без
+    активности дольше idle_ttl секунд забывается, при превышении max_users
+    вытесняются самые давние диалоги. История для запроса к ИИ собирается
+    от новых реплик к старым и не превышает max_tokens: реплика, которая
+    не помещается целиком, берется с ответом, сжатым до первого предложения,
+    а не поместившиеся и так - отбрасываются.
+    """
+
+    def __init__(self, max_turns: int = CONVERSATION_MAX_TURNS, max_tokens: int = CONVERSATION_MAX_TOKENS,
+                 idle_ttl: float = CONVERSATION_IDLE_TTL, max_users: int = CONVERSATION_MAX_USERS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+
+        # user_id -> диалог, от давно неактивных к недавним
+        self._conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.summarized = 0
+        self.dropped = 0
+
+    def add(self, user_id: int, question: str, answer: str):
+        """Запоминание реплики и ответа"""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                conversation = self._conversations[user_id] = Conversation(self.max_turns)
+            conversation.turns.append(Turn(question, answer))
+            conversation.last_active = now
+            self._conversations.move_to_end(user_id)
+            while len(self._conversations) > self.max_users:
+                self._conversations.popitem(last=False)
+
+    def history(self, user_id: int) -> List[Dict[str, str]]:
+        """Предыдущие реплики в формате сообщений Mistral API, не больше max_tokens"""
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return []
+
+            selected = []
+            budget = self.max_tokens
+            for turn in reversed(conversation.turns):
+                if turn.tokens <= budget:
+                    selected.append((turn.question, turn.answer))
+                    budget -= turn.tokens
+                elif turn.summary_tokens <= budget:
+                    selected.append((turn.question, turn.summary))
+                    budget -= turn.summary_tokens
+                    self.summarized += 1
+                else:
+                    self.dropped += 1
+                    break
+
+        messages = []
+        for question, answer in reversed(selected):
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def clear(self, user_id: int):
+        """Забыть диалог пользователя (например, по команде /start)"""
+        with self._lock:
+            self._conversations.pop(user_id, None)
+
+    def _evict_idle(self, now: float):
+        """Удаление неактивных диалогов (вызывается под блокировкой)"""
+        while self._conversations:
+            user_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_active < self.idle_ttl:
+                break
+            del self._conversations[user_id]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики хранилища диалогов"""
+        with self._lock:
+            return {
+                'users': len(self._conversations),
+                'turns': sum(len(conversation.turns) for conversation in self._conversations.values()),
+                'summarized': self.summarized,
+                'dropped': self.dropped
+            }
@@ -5,118 +5,392 @@
 import sqlite3
 import json
 import logging
+import random
+import threading
+import time
+from functools import wraps
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from config import DATABASE_PATH
+from config import (
+    DATABASE_PATH,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_LOCK_RETRIES,
+    DB_LOCK_RETRY_DELAY,
+    DB_MMAP_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+    STATISTICS_ROLLUP_GRACE_MINUTES
+)
+from text_normalizer import question_fingerprint, question_key
 
 logger = logging.getLogger(__name__)
 
+def is_locked_error(error: Exception) -> bool:
+    """Проверка, что ошибка вызвана блокировкой БД другим процессом"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+def retry_on_locked(method):
+    """
+    Повтор метода DatabaseManager при блокировке БД.
+
+    Методы DatabaseManager сами перехватывают исключения, поэтому блокировка
+    фиксируется менеджером соединений, а повтор выполняется здесь
+    с экспоненциальной задержкой и случайным разбросом.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(DB_LOCK_RETRIES + 1):
+            result = method(self, *args, **kwargs)
+            if self._connections.pop_lock_error() is None:
+                return result
+            if attempt < DB_LOCK_RETRIES:
+                delay = DB_LOCK_RETRY_DELAY * (2 ** attempt)
+                logger.warning(f"БД заблокирована, повтор {method.__name__} через {delay:.2f} с")
+                time.sleep(delay * random.uniform(0.5, 1.5))
+        logger.error(f"БД заблокирована, {method.__name__} не выполнен после {DB_LOCK_RETRIES} повторов")
+        return result
+    return wrapper
+
+# Миграции схемы: (версия, описание, SQL-выражения).
+# Версия применённой схемы хранится в PRAGMA user_version.
+# Новые изменения схемы добавляются только новой миграцией в конец списка.
+SCHEMA_MIGRATIONS = [
+    (1, 'Базовые таблицы', [
+        # Таблица пользователей
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_requests INTEGER DEFAULT 0
+        )
+        ''',
+        # Таблица запросов и ответов
+        '''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question TEXT,
+            answer TEXT,
+            is_relevant BOOLEAN,
+            question_type TEXT,
+            response_time REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        # Таблица переходов в канал
+        '''
+        CREATE TABLE IF NOT EXISTS channel_visits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            visited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        # Таблица кэша FAQ
+        '''
+        CREATE TABLE IF NOT EXISTS faq_cache (
+            question_hash TEXT PRIMARY KEY,
+            question TEXT,
+            answer TEXT,
+            usage_count INTEGER DEFAULT 1,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Таблица статистики
+        '''
+        CREATE TABLE IF NOT EXISTS statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE,
+            total_requests INTEGER DEFAULT 0,
+            relevant_requests INTEGER DEFAULT 0,
+            channel_visits INTEGER DEFAULT 0,
+            unique_users INTEGER DEFAULT 0
+        )
+        ''',
+        # Таблица ограничений пользователей
+        '''
+        CREATE TABLE IF NOT EXISTS user_limits (
+            user_id INTEGER PRIMARY KEY,
+            requests_count INTEGER DEFAULT 0,
+            last_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        # Таблица для отслеживания автосообщений
+        '''
+        CREATE TABLE IF NOT EXISTS auto_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message_type TEXT,  -- '1hour' или '3days'
+            scheduled_time TIMESTAMP,
+            sent BOOLEAN DEFAULT FALSE,
+            sent_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+    ]),
+    (2, 'Индексы для статистики и автосообщений', [
+        # get_statistics: выборка запросов и переходов за период
+        'CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_channel_visits_visited_at ON channel_visits (visited_at)',
+        # get_pending_auto_messages: неотправленные сообщения по времени
+        'CREATE INDEX IF NOT EXISTS idx_auto_messages_pending ON auto_messages (sent, scheduled_time)',
+        # has_auto_message_scheduled / has_recent_auto_messages: сообщения пользователя
+        'CREATE INDEX IF NOT EXISTS idx_auto_messages_user ON auto_messages (user_id, sent, message_type)',
+    ]),
+    (3, 'Дневные агрегаты статистики', [
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_date ON statistics (date)',
+        'ALTER TABLE statistics ADD COLUMN response_time_sum REAL DEFAULT 0',
+        '''
+        CREATE TABLE IF NOT EXISTS statistics_question_types (
+            date DATE,
+            question_type TEXT,
+            requests INTEGER DEFAULT 0,
+            response_time_sum REAL DEFAULT 0,
+            PRIMARY KEY (date, question_type)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS statistics_questions (
+            date DATE,
+            question TEXT,
+            requests INTEGER DEFAULT 0,
+            PRIMARY KEY (date, question)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS statistics_users (
+            date DATE,
+            user_id INTEGER,
+            PRIMARY KEY (date, user_id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (4, 'Состояние скользящего окна лимитов', [
+        'ALTER TABLE user_limits ADD COLUMN window_id INTEGER DEFAULT 0',
+        'ALTER TABLE user_limits ADD COLUMN previous_count INTEGER DEFAULT 0',
+    ]),
+    (5, 'Индекс популярности кэша FAQ', [
+        'CREATE INDEX IF NOT EXISTS idx_faq_cache_usage ON faq_cache (usage_count)',
+    ]),
+    (6, 'Кэш вердиктов релевантности', [
+        '''
+        CREATE TABLE IF NOT EXISTS relevance_cache (
+            question_key TEXT PRIMARY KEY,
+            is_relevant BOOLEAN,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_relevance_cache_checked_at ON relevance_cache (checked_at)',
+    ]),
+    # question_fingerprint и question_key регистрируются на каждом соединении
+    (7, 'Отпечатки вопросов', [
+        'ALTER TABLE requests ADD COLUMN fingerprint TEXT',
+        'ALTER TABLE faq_cache ADD COLUMN fingerprint TEXT',
+        'UPDATE requests SET fingerprint = question_fingerprint(question) WHERE question IS NOT NULL',
+        '''
+        UPDATE OR IGNORE faq_cache
+        SET fingerprint = question_fingerprint(question), question_hash = question_key(question)
+        WHERE question IS NOT NULL
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_requests_fingerprint ON requests (fingerprint)',
+        'CREATE INDEX IF NOT EXISTS idx_faq_cache_fingerprint ON faq_cache (fingerprint)',
+        # Популярные вопросы группируются по отпечатку, а не по исходному тексту
+        'DROP TABLE IF EXISTS statistics_questions',
+        '''
+        CREATE TABLE statistics_questions (
+            date DATE,
+            fingerprint TEXT,
+            question TEXT,
+            requests INTEGER DEFAULT 0,
+            PRIMARY KEY (date, fingerprint)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO statistics_questions (date, fingerprint, question, requests)
+        SELECT s.date, COALESCE(r.fingerprint, r.question, ''), MIN(r.question), COUNT(*)
+        FROM statistics s
+        JOIN requests r ON r.created_at >= s.date AND r.created_at < date(s.date, '+1 day')
+        GROUP BY s.date, COALESCE(r.fingerprint, r.question, '')
+        ''',
+    ]),
+    (8, 'Учет токенов Mistral API', [
+        # Одна строка на вызов API; всего токенов = prompt_tokens + completion_tokens
+        '''
+        CREATE TABLE IF NOT EXISTS token_usage (
+            id INTEGER PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            api_key TEXT,
+            question_type TEXT,
+            user_id INTEGER,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            latency_ms INTEGER,
+            model TEXT DEFAULT ''
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_token_usage_created_at ON token_usage (created_at)',
+        '''
+        CREATE TABLE IF NOT EXISTS statistics_token_usage (
+            date DATE,
+            api_key TEXT,
+            question_type TEXT,
+            user_id INTEGER,
+            model TEXT,
+            calls INTEGER DEFAULT 0,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            latency_ms_sum INTEGER DEFAULT 0,
+            PRIMARY KEY (date, api_key, question_type, user_id, model)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+class ConnectionManager:
+    """
+    Менеджер долгоживущих соединений с SQLite.
+
+    Каждый поток получает собственное соединение, которое открывается один раз
+    и настраивается прагмами (WAL, synchronous=NORMAL, кэш страниц, mmap).
+    Соединения переиспользуются между вызовами, поэтому кэш подготовленных
+    выражений sqlite3 (cached_statements) тоже работает между запросами.
+    """
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        """Открытие и настройка нового соединения"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False  # закрываем из основного потока в close_all()
+        )
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        cursor.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        cursor.close()
+        # Нормализация вопросов для миграций и запросов
+        conn.create_function('question_fingerprint', 1, question_fingerprint, deterministic=True)
+        conn.create_function('question_key', 1, lambda question: question_key(question) if question is not None else None,
+                             deterministic=True)
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создается при первом обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Соединение текущего потока в рамках одной транзакции"""
+        conn = self.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if is_locked_error(e):
+                self._local.lock_error = e
+            raise
+
+    def pop_lock_error(self) -> Optional[Exception]:
+        """Последняя ошибка блокировки в текущем потоке (со сбросом)"""
+        error = getattr(self._local, 'lock_error', None)
+        self._local.lock_error = None
+        return error
+
+    def close_all(self):
+        """Закрытие всех открытых соединений (при остановке процесса)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Ошибка закрытия соединения с БД: {e}")
+        self._local = threading.local()
+
 class DatabaseManager:
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        self._connections = ConnectionManager(db_path)
         self.init_database()
+
+    def connection(self):
+        """Соединение текущего потока в рамках транзакции"""
+        return self._connections.connection()
+
+    def close(self):
+        """Закрытие соединений с базой данных"""
+        self._connections.close_all()
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применение недостающих миграций схемы"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Таблица пользователей
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        last_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        total_requests INTEGER DEFAULT 0
-                    )
-                ''')
-                
-                # Таблица запросов и ответов
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS requests (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        question TEXT,
-                        answer TEXT,
-                        is_relevant BOOLEAN,
-                        question_type TEXT,
-                        response_time REAL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                # Таблица переходов в канал
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS channel_visits (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        visited_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                # Таблица кэша FAQ
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS faq_cache (
-                        question_hash TEXT PRIMARY KEY,
-                        question TEXT,
-                        answer TEXT,
-                        usage_count INTEGER DEFAULT 1,
-                        last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # Таблица статистики
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS statistics (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        date DATE,
-                        total_requests INTEGER DEFAULT 0,
-                        relevant_requests INTEGER DEFAULT 0,
-                        channel_visits INTEGER DEFAULT 0,
-                        unique_users INTEGER DEFAULT 0
-                    )
-                ''')
-                
-                # Таблица ограничений пользователей
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS user_limits (
-                        user_id INTEGER PRIMARY KEY,
-                        requests_count INTEGER DEFAULT 0,
-                        last_reset TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                # Таблица для отслеживания автосообщений
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS auto_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        message_type TEXT,  -- '1hour' или '3days'
-                        scheduled_time TIMESTAMP,
-                        sent BOOLEAN DEFAULT FALSE,
-                        sent_at TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (user_id)
-                    )
-                ''')
-                
-                conn.commit()
-                logger.info("База данных инициализирована успешно")
+            with self.connection() as conn:
+                current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+            
+            # Схема актуальна - ничего не создаем
+            if current_version >= SCHEMA_VERSION:
+                return
+            
+            for version, description, statements in SCHEMA_MIGRATIONS:
+                if version > current_version:
+                    self._apply_migration(version, description, statements)
+            
+            logger.info(f"База данных инициализирована успешно (версия схемы {SCHEMA_VERSION})")
                 
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
     
+    def _apply_migration(self, version: int, description: str, statements: List[str]):
+        """Применение одной миграции в отдельной транзакции"""
+        with self.connection() as conn:
+            # BEGIN IMMEDIATE сразу берет блокировку записи, поэтому другой
+            # процесс, стартовавший одновременно, дождется окончания миграции
+            conn.execute('BEGIN IMMEDIATE')
+            current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if current_version >= version:
+                return
+            
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            logger.info(f"Применена миграция схемы {version}: {description}")
+    
+    @retry_on_locked
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Добавление нового пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_activity)
@@ -126,16 +400,18 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка добавления пользователя: {e}")
     
+    @retry_on_locked
     def log_request(self, user_id: int, question: str, answer: str, is_relevant: bool, 
                    question_type: str = None, response_time: float = None):
         """Логирование запроса и ответа"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT INTO requests (user_id, question, answer, is_relevant, question_type, response_time)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_id, question, answer, is_relevant, question_type, response_time))
+                    INSERT INTO requests (user_id, question, answer, is_relevant, question_type, response_time, fingerprint)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, question, answer, is_relevant, question_type, response_time,
+                      question_fingerprint(question)))
                 
                 # Обновляем счетчик запросов пользователя
                 cursor.execute('''
@@ -147,10 +423,11 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка логирования запроса: {e}")
     
+    @retry_on_locked
     def log_channel_visit(self, user_id: int):
         """Логирование перехода в канал"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO channel_visits (user_id) VALUES (?)
@@ -159,150 +436,543 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка логирования перехода в канал: {e}")
     
-    def check_user_limits(self, user_id: int) -> bool:
-        """Проверка лимитов пользователя"""
+    @retry_on_locked
+    def log_token_usage(self, user_id: Optional[int], api_key: str, question_type: Optional[str],
+                        prompt_tokens: int, completion_tokens: int, latency: float, model: str = ''):
+        """Логирование расхода токенов одного вызова API"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
-                
-                # Проверяем, нужно ли сбросить счетчик (прошла минута)
                 cursor.execute('''
-                    SELECT requests_count, last_reset FROM user_limits WHERE user_id = ?
-                ''', (user_id,))
-                
-                result = cursor.fetchone()
-                if result:
-                    requests_count, last_reset = result
-                    last_reset = datetime.fromisoformat(last_reset)
-                    
-                    # Если прошла минута, сбрасываем счетчик
-                    if datetime.now() - last_reset > timedelta(minutes=1):
-                        cursor.execute('''
-                            UPDATE user_limits SET requests_count = 0, last_reset = CURRENT_TIMESTAMP
-                            WHERE user_id = ?
-                        ''', (user_id,))
-                        conn.commit()
-                        return True
-                    else:
-                        return requests_count < 10  # MAX_REQUESTS_PER_MINUTE
-                else:
-                    # Создаем новую запись
-                    cursor.execute('''
-                        INSERT INTO user_limits (user_id, requests_count) VALUES (?, 0)
-                    ''', (user_id,))
-                    conn.commit()
-                    return True
-                    
+                    INSERT INTO token_usage (api_key, question_type, user_id, prompt_tokens, completion_tokens,
+                                             latency_ms, model)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (api_key, question_type or '', user_id or 0, prompt_tokens, completion_tokens,
+                      int(latency * 1000), model))
+                conn.commit()
         except Exception as e:
-            logger.error(f"Ошибка проверки лимитов пользователя: {e}")
-            return True  # В случае ошибки разрешаем запрос
+            logger.error(f"Ошибка логирования расхода токенов: {e}")
     
-    def increment_user_requests(self, user_id: int):
-        """Увеличение счетчика запросов пользователя"""
+    @retry_on_locked
+    def rollup_statistics(self) -> int:
+        """
+        Инкрементальный расчет дневных агрегатов в таблицах statistics*.
+        
+        Обрабатываются только завершенные дни (UTC), которые еще не посчитаны,
+        с запасом STATISTICS_ROLLUP_GRACE_MINUTES на запаздывающую телеметрию.
+        Возвращает количество посчитанных дней.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT OR REPLACE INTO user_limits (user_id, requests_count, last_reset)
-                    VALUES (?, COALESCE((SELECT requests_count FROM user_limits WHERE user_id = ?), 0) + 1, CURRENT_TIMESTAMP)
-                ''', (user_id, user_id))
-                conn.commit()
+                    SELECT MAX(date), date(datetime('now', '-{} minutes')) FROM statistics
+                '''.format(STATISTICS_ROLLUP_GRACE_MINUTES))
+                last_date, closed_before = cursor.fetchone()
+                
+                if last_date:
+                    first_day = datetime.strptime(last_date, '%Y-%m-%d').date() + timedelta(days=1)
+                else:
+                    # Первый запуск - начинаем с самого раннего события
+                    cursor.execute('''
+                        SELECT MIN(first_day) FROM (
+                            SELECT date(MIN(created_at)) as first_day FROM requests
+                            UNION ALL
+                            SELECT date(MIN(visited_at)) FROM channel_visits
+                            UNION ALL
+                            SELECT date(MIN(created_at)) FROM token_usage
+                        )
+                    ''')
+                    earliest = cursor.fetchone()[0]
+                    if not earliest:
+                        return 0
+                    first_day = datetime.strptime(earliest, '%Y-%m-%d').date()
+            
+            end_day = datetime.strptime(closed_before, '%Y-%m-%d').date()
+            day = first_day
+            while day < end_day:
+                self._rollup_day(day)
+                day += timedelta(days=1)
+            
+            rolled_days = max((end_day - first_day).days, 0)
+            if rolled_days:
+                logger.info(f"Статистика: посчитано дней - {rolled_days}, по {end_day - timedelta(days=1)}")
+            return rolled_days
+            
         except Exception as e:
-            logger.error(f"Ошибка увеличения счетчика запросов: {e}")
+            logger.error(f"Ошибка расчета дневной статистики: {e}")
+            return 0
+    
+    def _rollup_day(self, day):
+        """Расчет агрегатов одного дня в отдельной транзакции"""
+        day_start = day.isoformat()
+        day_end = (day + timedelta(days=1)).isoformat()
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            params = (day_start, day_end)
+            
+            cursor.execute('''
+                SELECT 
+                    COUNT(*),
+                    COUNT(CASE WHEN is_relevant = 1 THEN 1 END),
+                    COUNT(DISTINCT user_id),
+                    COALESCE(SUM(response_time), 0)
+                FROM requests
+                WHERE created_at >= ? AND created_at < ?
+            ''', params)
+            total_requests, relevant_requests, unique_users, response_time_sum = cursor.fetchone()
+            
+            cursor.execute('''
+                SELECT COUNT(*) FROM channel_visits
+                WHERE visited_at >= ? AND visited_at < ?
+            ''', params)
+            channel_visits = cursor.fetchone()[0]
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO statistics
+                    (date, total_requests, relevant_requests, channel_visits, unique_users, response_time_sum)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (day_start, total_requests, relevant_requests, channel_visits, unique_users, response_time_sum))
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO statistics_question_types (date, question_type, requests, response_time_sum)
+                SELECT ?, COALESCE(question_type, ''), COUNT(*), COALESCE(SUM(response_time), 0)
+                FROM requests
+                WHERE created_at >= ? AND created_at < ?
+                GROUP BY COALESCE(question_type, '')
+            ''', (day_start, day_start, day_end))
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO statistics_questions (date, fingerprint, question, requests)
+                SELECT ?, COALESCE(fingerprint, question, ''), MIN(question), COUNT(*)
+                FROM requests
+                WHERE created_at >= ? AND created_at < ?
+                GROUP BY COALESCE(fingerprint, question, '')
+            ''', (day_start, day_start, day_end))
+            
+            cursor.execute('''
+                INSERT OR IGNORE INTO statistics_users (date, user_id)
+                SELECT DISTINCT ?, user_id
+                FROM requests
+                WHERE created_at >= ? AND created_at < ?
+            ''', (day_start, day_start, day_end))
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO statistics_token_usage
+                    (date, api_key, question_type, user_id, model, calls, prompt_tokens, completion_tokens,
+                     latency_ms_sum)
+                SELECT ?, api_key, question_type, user_id, model, COUNT(*),
+                       SUM(prompt_tokens), SUM(completion_tokens), SUM(latency_ms)
+                FROM token_usage
+                WHERE created_at >= ? AND created_at < ?
+                GROUP BY api_key, question_type, user_id, model
+            ''', (day_start, day_start, day_end))
     
+    @retry_on_locked
     def get_statistics(self, days: int = 7) -> Dict:
-        """Получение статистики за указанное количество дней"""
+        """
+        Получение статистики за указанное количество дней.
+        
+        Завершенные дни читаются из дневных агрегатов (O(days)), по сырым
+        таблицам считается только хвост после последнего посчитанного дня.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 
+                # Границы окна: агрегаты за [window_start, live_from), сырые данные с live_from
+                cursor.execute('''
+                    SELECT 
+                        date('now', '-{} days'),
+                        MAX(date('now', '-{} days'), COALESCE(date(MAX(date), '+1 day'), ''))
+                    FROM statistics
+                '''.format(days, days))
+                window_start, live_from = cursor.fetchone()
+                rollup_params = (window_start, live_from)
+                
                 # Общая статистика
+                cursor.execute('''
+                    SELECT 
+                        COALESCE(SUM(total_requests), 0),
+                        COALESCE(SUM(relevant_requests), 0),
+                        COALESCE(SUM(channel_visits), 0),
+                        COALESCE(SUM(response_time_sum), 0)
+                    FROM statistics
+                    WHERE date >= ? AND date < ?
+                ''', rollup_params)
+                rolled = cursor.fetchone()
+                
                 cursor.execute('''
                     SELECT 
                         COUNT(*) as total_requests,
                         COUNT(CASE WHEN is_relevant = 1 THEN 1 END) as relevant_requests,
-                        COUNT(DISTINCT user_id) as unique_users
+                        COALESCE(SUM(response_time), 0)
                     FROM requests 
-                    WHERE created_at >= datetime('now', '-{} days')
-                '''.format(days))
-                
-                stats = cursor.fetchone()
+                    WHERE created_at >= ?
+                ''', (live_from,))
+                live = cursor.fetchone()
                 
                 # Переходы в канал
                 cursor.execute('''
                     SELECT COUNT(*) FROM channel_visits 
-                    WHERE visited_at >= datetime('now', '-{} days')
-                '''.format(days))
+                    WHERE visited_at >= ?
+                ''', (live_from,))
                 
-                channel_visits = cursor.fetchone()[0]
+                channel_visits = rolled[2] + cursor.fetchone()[0]
                 
-                # Популярные вопросы
+                # Уникальные пользователи не суммируются по дням - объединяем множества
                 cursor.execute('''
-                    SELECT question, COUNT(*) as count
-                    FROM requests 
-                    WHERE created_at >= datetime('now', '-{} days')
-                    GROUP BY question
+                    SELECT COUNT(*) FROM (
+                        SELECT user_id FROM statistics_users WHERE date >= ? AND date < ?
+                        UNION
+                        SELECT user_id FROM requests WHERE created_at >= ?
+                    )
+                ''', rollup_params + (live_from,))
+                unique_users = cursor.fetchone()[0]
+                
+                # Популярные вопросы (варианты написания одного вопроса - вместе)
+                cursor.execute('''
+                    SELECT MIN(question), SUM(count) as count
+                    FROM (
+                        SELECT fingerprint, question, requests as count FROM statistics_questions
+                        WHERE date >= ? AND date < ?
+                        UNION ALL
+                        SELECT COALESCE(fingerprint, question, ''), MIN(question), COUNT(*) FROM requests
+                        WHERE created_at >= ?
+                        GROUP BY COALESCE(fingerprint, question, '')
+                    )
+                    GROUP BY fingerprint
                     ORDER BY count DESC
                     LIMIT 10
-                '''.format(days))
+                ''', rollup_params + (live_from,))
                 
                 popular_questions = cursor.fetchall()
                 
+                # Разбивка по типам вопросов
+                cursor.execute('''
+                    SELECT question_type, SUM(requests), SUM(response_time_sum)
+                    FROM (
+                        SELECT question_type, requests, response_time_sum FROM statistics_question_types
+                        WHERE date >= ? AND date < ?
+                        UNION ALL
+                        SELECT COALESCE(question_type, ''), COUNT(*), COALESCE(SUM(response_time), 0) FROM requests
+                        WHERE created_at >= ?
+                        GROUP BY COALESCE(question_type, '')
+                    )
+                    GROUP BY question_type
+                    ORDER BY 2 DESC
+                ''', rollup_params + (live_from,))
+                
+                question_types = {
+                    question_type: {
+                        'requests': count,
+                        'avg_response_time': response_time_sum / count if count else 0
+                    }
+                    for question_type, count, response_time_sum in cursor.fetchall()
+                }
+                
+                total_requests = rolled[0] + live[0]
+                response_time_sum = rolled[3] + live[2]
+                
                 return {
-                    'total_requests': stats[0],
-                    'relevant_requests': stats[1],
-                    'unique_users': stats[2],
+                    'total_requests': total_requests,
+                    'relevant_requests': rolled[1] + live[1],
+                    'unique_users': unique_users,
                     'channel_visits': channel_visits,
-                    'popular_questions': popular_questions
+                    'popular_questions': popular_questions,
+                    'question_types': question_types,
+                    'avg_response_time': response_time_sum / total_requests if total_requests else 0
                 }
                 
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
             return {}
     
+    @retry_on_locked
+    def get_token_usage(self, days: int = 7, group_by: str = 'question_type', limit: int = 20) -> List[Dict]:
+        """
+        Расход токенов за N дней в разрезе group_by (api_key, question_type, user_id или model),
+        самые затратные группы первыми. Как и в get_statistics, закрытые дни
+        читаются из statistics_token_usage, а хвост - из token_usage.
+        """
+        if group_by not in ('api_key', 'question_type', 'user_id', 'model'):
+            raise ValueError(f"Неизвестная группировка расхода токенов: {group_by}")
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT 
+                        date('now', '-{} days'),
+                        MAX(date('now', '-{} days'), COALESCE(date(MAX(date), '+1 day'), ''))
+                    FROM statistics
+                '''.format(days, days))
+                window_start, live_from = cursor.fetchone()
+                
+                cursor.execute('''
+                    SELECT grp, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(latency_ms_sum)
+                    FROM (
+                        SELECT {0} as grp, calls, prompt_tokens, completion_tokens, latency_ms_sum
+                        FROM statistics_token_usage
+                        WHERE date >= ? AND date < ?
+                        UNION ALL
+                        SELECT {0}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(latency_ms)
+                        FROM token_usage
+                        WHERE created_at >= ?
+                        GROUP BY {0}
+                    )
+                    GROUP BY grp
+                    ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC
+                    LIMIT ?
+                '''.format(group_by), (window_start, live_from, live_from, limit))
+                
+                return [
+                    {
+                        group_by: group,
+                        'calls': calls,
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': completion_tokens,
+                        'total_tokens': prompt_tokens + completion_tokens,
+                        'avg_tokens': (prompt_tokens + completion_tokens) / calls if calls else 0,
+                        'avg_latency': latency_ms_sum / calls / 1000 if calls else 0
+                    }
+                    for group, calls, prompt_tokens, completion_tokens, latency_ms_sum in cursor.fetchall()
+                ]
+                
+        except Exception as e:
+            logger.error(f"Ошибка получения расхода токенов: {e}")
+            return []
+    
+    @retry_on_locked
+    def get_top_users(self, limit: int = 10) -> List[Tuple]:
+        """Получение самых активных пользователей"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT user_id, username, first_name, total_requests, last_activity
+                    FROM users 
+                    ORDER BY total_requests DESC 
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения пользователей: {e}")
+            return []
+    
+    @retry_on_locked
+    def get_channel_visit_stats(self, days: int = 7) -> Tuple[int, int]:
+        """Получение числа переходов в канал и уникальных посетителей за N дней"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*) as total_visits,
+                           COUNT(DISTINCT user_id) as unique_visitors
+                    FROM channel_visits 
+                    WHERE visited_at >= datetime('now', '-{} days')
+                '''.format(days))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики канала: {e}")
+            return 0, 0
+    
+    @retry_on_locked
+    def get_labeled_requests(self, limit: int = 100000) -> List[Tuple]:
+        """Последние вопросы с вердиктом и типом (обучающая выборка классификатора)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT question, is_relevant, question_type FROM requests
+                    WHERE question IS NOT NULL AND question_type IS NOT NULL
+                      AND question_type NOT IN ('error', 'fallback', 'truncated')
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения размеченных запросов: {e}")
+            return []
+    
+    @retry_on_locked
+    def get_recent_answers(self, limit: int) -> List[Tuple[str, str]]:
+        """Последние ответы ИИ с типом вопроса (без ответов из кэша и ошибок), от новых к старым"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT question_type, answer FROM requests
+                    WHERE is_relevant = 1 AND answer IS NOT NULL
+                      AND question_type NOT IN ('cached', 'fallback', 'error', 'irrelevant')
+                    ORDER BY id DESC
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения последних ответов: {e}")
+            return []
+    
+    @retry_on_locked
     def cache_faq_answer(self, question_hash: str, question: str, answer: str):
         """Кэширование ответа FAQ"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT OR REPLACE INTO faq_cache (question_hash, question, answer, usage_count, last_used)
-                    VALUES (?, ?, ?, COALESCE((SELECT usage_count FROM faq_cache WHERE question_hash = ?), 0) + 1, CURRENT_TIMESTAMP)
-                ''', (question_hash, question, answer, question_hash))
+                    INSERT OR REPLACE INTO faq_cache (question_hash, question, answer, fingerprint, usage_count, last_used)
+                    VALUES (?, ?, ?, ?, COALESCE((SELECT usage_count FROM faq_cache WHERE question_hash = ?), 0) + 1, CURRENT_TIMESTAMP)
+                ''', (question_hash, question, answer, question_fingerprint(question), question_hash))
                 conn.commit()
         except Exception as e:
             logger.error(f"Ошибка кэширования FAQ: {e}")
     
-    def get_cached_faq(self, question_hash: str) -> Optional[str]:
-        """Получение кэшированного ответа FAQ"""
+    @retry_on_locked
+    def get_cached_faq(self, question_hash: str, touch: bool = True) -> Optional[str]:
+        """Получение кэшированного ответа FAQ (touch=False - без обновления last_used)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT answer FROM faq_cache WHERE question_hash = ?
                 ''', (question_hash,))
                 
                 result = cursor.fetchone()
-                if result:
+                if result and touch:
                     # Обновляем время последнего использования
                     cursor.execute('''
                         UPDATE faq_cache SET last_used = CURRENT_TIMESTAMP WHERE question_hash = ?
                     ''', (question_hash,))
                     conn.commit()
-                    return result[0]
-                return None
+                return result[0] if result else None
                 
         except Exception as e:
             logger.error(f"Ошибка получения кэшированного FAQ: {e}")
             return None
     
+    @retry_on_locked
+    def record_faq_usage(self, usage: Dict[str, Tuple[int, str]]):
+        """Пакетное обновление usage_count и last_used: {question_hash: (обращений, время последнего)}"""
+        try:
+            with self.connection() as conn:
+                conn.executemany('''
+                    UPDATE faq_cache SET usage_count = usage_count + ?, last_used = ?
+                    WHERE question_hash = ?
+                ''', [(count, last_used, question_hash) for question_hash, (count, last_used) in usage.items()])
+        except Exception as e:
+            logger.error(f"Ошибка обновления статистики FAQ: {e}")
+    
+    @retry_on_locked
+    def get_hot_faq(self, limit: int) -> List[Tuple[str, str]]:
+        """Самые востребованные ответы FAQ (для прогрева кэша в памяти)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT question_hash, answer FROM faq_cache
+                    ORDER BY usage_count DESC
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки популярных FAQ: {e}")
+            return []
+    
+    @retry_on_locked
+    def get_prewarm_questions(self, days: int, limit: int, include_cached: bool = False) -> List[Tuple[str, int]]:
+        """
+        Самые частые релевантные вопросы за days дней: (вопрос, запросов).
+        Вопросы, отличающиеся только регистром и пунктуацией, считаются
+        вместе (по ключу faq_cache); вопросы, ответ на которые уже есть
+        в faq_cache, пропускаются (кроме include_cached).
+        """
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT MIN(question), COUNT(*) as count
+                    FROM (
+                        SELECT question, question_key(question) as question_hash
+                        FROM requests
+                        WHERE created_at >= datetime('now', '-{} days') AND is_relevant = 1
+                          AND question IS NOT NULL AND question_type NOT IN ('error', 'fallback', 'truncated')
+                    ) r
+                    WHERE ? OR NOT EXISTS (SELECT 1 FROM faq_cache f WHERE f.question_hash = r.question_hash)
+                    GROUP BY r.question_hash
+                    ORDER BY count DESC
+                    LIMIT ?
+                '''.format(days), (include_cached, limit))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка получения популярных вопросов для прогрева: {e}")
+            return []
+    
+    @retry_on_locked
+    def get_relevance_verdict(self, question_key: str, max_age: float) -> Optional[bool]:
+        """Сохраненный вердикт релевантности, если он моложе max_age секунд"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT is_relevant FROM relevance_cache
+                    WHERE question_key = ? AND checked_at >= datetime('now', ?)
+                ''', (question_key, f'-{int(max_age)} seconds'))
+                result = cursor.fetchone()
+                return bool(result[0]) if result else None
+        except Exception as e:
+            logger.error(f"Ошибка получения вердикта релевантности: {e}")
+            return None
+    
+    @retry_on_locked
+    def save_relevance_verdict(self, question_key: str, is_relevant: bool):
+        """Сохранение вердикта релевантности"""
+        try:
+            with self.connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO relevance_cache (question_key, is_relevant, checked_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', (question_key, is_relevant))
+        except Exception as e:
+            logger.error(f"Ошибка сохранения вердикта релевантности: {e}")
+    
+    @retry_on_locked
+    def purge_relevance_verdicts(self, max_age: float) -> int:
+        """Удаление устаревших вердиктов релевантности"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.execute('''
+                    DELETE FROM relevance_cache WHERE checked_at < datetime('now', ?)
+                ''', (f'-{int(max_age)} seconds',))
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка очистки вердиктов релевантности: {e}")
+            return 0
+    
+    @retry_on_locked
+    def get_faq_entries(self, limit: int) -> List[Tuple[str, str, str]]:
+        """Самые востребованные вопросы и ответы FAQ (для семантического кэша)"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT question_hash, question, answer FROM faq_cache
+                    WHERE question IS NOT NULL
+                    ORDER BY usage_count DESC
+                    LIMIT ?
+                ''', (limit,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки вопросов FAQ: {e}")
+            return []
+    
+    @retry_on_locked
     def schedule_auto_message(self, user_id: int, message_type: str, delay_hours: int):
         """Планирование автосообщения"""
         try:
             from datetime import datetime, timedelta
             scheduled_time = datetime.now() + timedelta(hours=delay_hours)
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO auto_messages (user_id, message_type, scheduled_time)
@@ -313,10 +983,11 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка планирования автосообщения: {e}")
     
+    @retry_on_locked
     def get_pending_auto_messages(self) -> List[Tuple]:
         """Получение запланированных автосообщений, которые нужно отправить"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT id, user_id, message_type, scheduled_time
@@ -329,10 +1000,11 @@ class DatabaseManager:
             logger.error(f"Ошибка получения запланированных автосообщений: {e}")
             return []
     
+    @retry_on_locked
     def mark_auto_message_sent(self, message_id: int):
         """Отметка автосообщения как отправленного"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE auto_messages 
@@ -343,10 +1015,11 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка отметки автосообщения как отправленного: {e}")
     
+    @retry_on_locked
     def has_auto_message_scheduled(self, user_id: int, message_type: str) -> bool:
         """Проверка, запланировано ли уже автосообщение данного типа для пользователя"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT COUNT(*) FROM auto_messages 
@@ -357,10 +1030,11 @@ class DatabaseManager:
             logger.error(f"Ошибка проверки запланированных автосообщений: {e}")
             return False
     
+    @retry_on_locked
     def has_recent_auto_messages(self, user_id: int, days: int = 14) -> bool:
         """Проверка, отправлялись ли автосообщения пользователю в последние N дней"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT COUNT(*) FROM auto_messages 
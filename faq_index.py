@@ -0,0 +1,132 @@
+"""
+Поиск по вопросам FAQ: инвертированный индекс с ранжированием BM25
+"""
+
+import heapq
+import logging
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import FAQ_INDEX_SIZE, FAQ_MIN_SCORE
+from text_normalizer import content_words, stem
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def faq_terms(text: str) -> List[str]:
+    """Основы значимых слов (термы индекса)"""
+    return [stem(word) for word in content_words(text)]
+
+class FaqIndex:
+    """
+    Инвертированный индекс основа -> {документ: частота} по вопросам FAQ.
+
+    Поиск проходит только по документам, в которых есть основы слов
+    вопроса, и ранжирует их по BM25. Оценка нормируется на максимально
+    возможную для вопроса (сумму IDF его термов), поэтому min_score - доля
+    "веса" вопроса, которая должна совпасть: совпадение одного частого слова
+    ответа не дает. Документы добавляются и заменяются инкрементально,
+    при превышении max_size вытесняются давно не выдававшиеся (LRU).
+    Закрепленные документы (pinned - статические вопросы FAQ) не вытесняются.
+    """
+
+    def __init__(self, max_size: int = FAQ_INDEX_SIZE, min_score: float = FAQ_MIN_SCORE):
+        self.max_size = max_size
+        self.min_score = min_score
+
+        # id документа -> (вопрос, ответ, частоты термов)
+        self._documents: "OrderedDict[str, Tuple[str, str, Counter]]" = OrderedDict()
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._pinned = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def pinned(self) -> int:
+        """Число закрепленных документов"""
+        return len(self._pinned)
+
+    def add(self, doc_id: str, question: str, answer: str, pinned: bool = False):
+        """Добавление или замена документа (pinned - никогда не вытесняется)"""
+        terms = Counter(faq_terms(question))
+        if not terms:
+            return
+        with self._lock:
+            if doc_id in self._documents:
+                self._remove(doc_id)
+            length = sum(terms.values())
+            self._documents[doc_id] = (question, answer, terms)
+            self._lengths[doc_id] = length
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            if pinned:
+                self._pinned.add(doc_id)
+            while len(self._documents) > self.max_size:
+                oldest = next((doc_id for doc_id in self._documents if doc_id not in self._pinned), None)
+                if oldest is None:
+                    break
+                self._remove(oldest)
+
+    def _remove(self, doc_id: str):
+        """Удаление документа из индекса (вызывается под блокировкой)"""
+        _, _, terms = self._documents.pop(doc_id)
+        self._pinned.discard(doc_id)
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def _idf(self, term: str) -> float:
+        """IDF в варианте BM25 (всегда положительный)"""
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self._documents) - df + 0.5) / (df + 0.5))
+
+    def search(self, question: str, k: int = 3) -> List[Tuple[float, str, str]]:
+        """k лучших документов: (нормированная оценка, вопрос, ответ)"""
+        terms = Counter(faq_terms(question))
+        with self._lock:
+            return [(score, self._documents[doc_id][0], self._documents[doc_id][1])
+                    for score, doc_id in self._search(terms, k)]
+
+    def _search(self, terms: Counter, k: int) -> List[Tuple[float, str]]:
+        """k лучших документов: (нормированная оценка, id) (вызывается под блокировкой)"""
+        if not terms or not self._documents:
+            return []
+        # Знаменатель BM25: tf + k1 * (1 - b + b * длина / средняя длина)
+        length_base = BM25_K1 * (1 - BM25_B)
+        length_scale = BM25_K1 * BM25_B * len(self._documents) / self._total_length
+        lengths = self._lengths
+        scores: Dict[str, float] = {}
+        max_score = 0.0
+        for term in terms:
+            idf = self._idf(term)
+            max_score += idf
+            numerator = idf * (BM25_K1 + 1)
+            for doc_id, tf in self._postings.get(term, {}).items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + numerator * tf / (
+                    tf + length_base + length_scale * lengths[doc_id])
+        if not max_score:
+            return []
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score / max_score, doc_id) for doc_id, score in top]
+
+    def best(self, question: str) -> Optional[str]:
+        """Ответ лучшего документа, если его оценка не ниже min_score"""
+        terms = Counter(faq_terms(question))
+        with self._lock:
+            found = self._search(terms, 1)
+            if found and found[0][0] >= self.min_score:
+                doc_id = found[0][1]
+                self._documents.move_to_end(doc_id)
+                return self._documents[doc_id][1]
+            return None
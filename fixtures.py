@@ -0,0 +1,57 @@
+"""
+Общие заготовки для тестов: временная БД и AIService с подмененным Mistral API
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from database import DatabaseManager
+from ai_service import AIService, ApiKeyPool
+
+Handler = Callable[[httpx.Request], Any]
+
+@contextmanager
+def temp_database() -> Iterator[DatabaseManager]:
+    """DatabaseManager на файле во временной директории"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseManager(os.path.join(tmp_dir, 'test.db'))
+        try:
+            yield db
+        finally:
+            db.close()
+
+def sse_body(chunks: Sequence[str]) -> str:
+    """Тело потокового ответа Mistral API"""
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n" for chunk in chunks]
+    return ''.join(lines) + "data: [DONE]\n\n"
+
+def completion(content: str, usage: Optional[Dict[str, int]] = None) -> httpx.Response:
+    """Обычный (не потоковый) ответ Mistral API"""
+    body: Dict[str, Any] = {'choices': [{'message': {'content': content}}]}
+    if usage:
+        body['usage'] = usage
+    return httpx.Response(200, json=body)
+
+def attach_handlers(ai_service: AIService, handlers: Union[Handler, Dict[str, Handler]],
+                    api_keys: Sequence[str] = ('test-key',)):
+    """Ключи API, запросы которых обрабатывает handler (один на все ключи или свой у каждого)"""
+    ai_service.api_keys = list(api_keys)
+    ai_service.key_pool = ApiKeyPool(ai_service.api_keys)
+    for api_key in ai_service.api_keys:
+        handler = handlers[api_key] if isinstance(handlers, dict) else handlers
+        ai_service._http_clients[api_key] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+@contextmanager
+def mock_ai_service(handlers: Union[Handler, Dict[str, Handler], None] = None,
+                    api_keys: Sequence[str] = ('test-key',)) -> Iterator[Tuple[DatabaseManager, AIService]]:
+    """AIService на временной БД; без handlers - без ключей API"""
+    with temp_database() as db:
+        ai_service = AIService(db)
+        if handlers is not None:
+            attach_handlers(ai_service, handlers, api_keys)
+        yield db, ai_service
@@ -0,0 +1,94 @@
+"""
+Дублирующие (hedged) запросы к Mistral API для борьбы с долгим хвостом задержек
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from config import (
+    HEDGE_REQUESTS,
+    HEDGE_PERCENTILE,
+    HEDGE_MAX_RATIO,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_LATENCY_WINDOW
+)
+
+class HedgePolicy:
+    """
+    Когда и сколько запросов дублировать.
+
+    Для каждого вида запроса (тип вопроса, проверка релевантности)
+    хранятся последние задержки. Если запрос не получил ответа за
+    перцентиль percentile этих задержек (но не раньше min_delay), его копия
+    уходит на другой ключ. Пока замеров меньше min_samples, запросы
+    не дублируются. Доля дублированных среди последних запросов
+    ограничена max_ratio, чтобы не удваивать расход квоты ключей.
+    """
+
+    def __init__(self, enabled: bool = HEDGE_REQUESTS, percentile: float = HEDGE_PERCENTILE,
+                 max_ratio: float = HEDGE_MAX_RATIO, min_delay: float = HEDGE_MIN_DELAY,
+                 min_samples: int = HEDGE_MIN_SAMPLES, window: int = HEDGE_LATENCY_WINDOW):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._recent: Deque[bool] = deque(maxlen=window)  # был ли запрос продублирован
+        self._active_hedges = 0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def delay(self, kind: str) -> Optional[float]:
+        """Через сколько секунд дублировать запрос (None - не дублировать)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(kind)
+            if not latencies or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+            index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+            return max(ordered[index], self.min_delay)
+
+    def try_hedge(self) -> bool:
+        """Разрешение на копию запроса в пределах max_ratio"""
+        with self._lock:
+            hedged = sum(self._recent) + self._active_hedges
+            if hedged >= self.max_ratio * max(len(self._recent), 1):
+                self.skipped += 1
+                return False
+            self._active_hedges += 1
+            self.hedged += 1
+            return True
+
+    def record(self, kind: str, latency: Optional[float], hedged: bool = False, hedge_won: bool = False):
+        """Учет завершенного запроса (latency None - ответа не было)"""
+        with self._lock:
+            self.requests += 1
+            self._recent.append(hedged)
+            if hedged:
+                self._active_hedges = max(self._active_hedges - 1, 0)
+            if hedge_won:
+                self.hedge_wins += 1
+            if latency is not None:
+                self._latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики дублирования"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'skipped': self.skipped,
+                'hedge_rate': round(self.hedged / self.requests, 3) if self.requests else 0.0
+            }
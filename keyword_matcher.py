@@ -0,0 +1,90 @@
+"""
+Поиск ключевых слов всех категорий за один проход по тексту
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List
+from prompts import POLITE_PHRASES, TRADE_KEYWORDS, QUESTION_TYPE_KEYWORDS, SPECIALIST_KEYWORDS
+
+def build_trie_pattern(keywords: List[str]) -> str:
+    """
+    Регулярное выражение-префиксное дерево для набора слов.
+
+    Вместо плоской альтернативы "слово1|слово2|..." (движок re перебирает
+    все варианты на каждой позиции) слова с общим префиксом сворачиваются
+    в одну ветку, поэтому на большинстве позиций проверка обрывается
+    на первом символе. Более длинные продолжения стоят раньше, так что
+    на каждой позиции находится самое длинное слово.
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}  # признак конца слова
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Слово может закончиться здесь - продолжение необязательно (жадно)
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """
+    Многошаблонный поиск подстрок одним скомпилированным регулярным выражением.
+
+    Все ключевые слова собираются в префиксное дерево внутри опережающей
+    проверки (?=(...)), поэтому регулярное выражение проверяет каждую позицию
+    текста и находит в том числе перекрывающиеся вхождения. На каждой позиции
+    берется самое длинное ключевое слово, а его категории заранее объединены
+    с категориями всех ключевых слов, которые в нем содержатся. Результат
+    совпадает с проверкой any(keyword in text) по каждой категории.
+    """
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        keyword_categories: Dict[str, set] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                keyword_categories.setdefault(keyword.lower(), set()).add(category)
+
+        # Категории ключевого слова + категории всех вложенных в него слов
+        self._categories: Dict[str, FrozenSet[str]] = {}
+        for keyword in keyword_categories:
+            found = set()
+            for other, other_categories in keyword_categories.items():
+                if other in keyword:
+                    found |= other_categories
+            self._categories[keyword] = frozenset(found)
+
+        self._pattern = re.compile(f'(?=({build_trie_pattern(list(keyword_categories))}))')
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Все категории, ключевые слова которых встречаются в тексте"""
+        found = set()
+        for keyword in self._pattern.findall(text.lower()):
+            found |= self._categories[keyword]
+        return frozenset(found)
+
+KEYWORD_MATCHER = KeywordMatcher({
+    'polite': POLITE_PHRASES,
+    'trade': TRADE_KEYWORDS,
+    'specialist': SPECIALIST_KEYWORDS,
+    **QUESTION_TYPE_KEYWORDS
+})
+
+@lru_cache(maxsize=1024)
+def match_keywords(text: str) -> FrozenSet[str]:
+    """Категории ключевых слов в тексте (повторные вызовы для того же текста - из кэша)"""
+    return KEYWORD_MATCHER.match(text)
+
+def classify_question_type(categories: FrozenSet[str]) -> str:
+    """Тип вопроса по найденным категориям с учетом приоритета типов"""
+    for question_type in QUESTION_TYPE_KEYWORDS:
+        if question_type in categories:
+            return question_type
+    return 'general'
@@ -0,0 +1,163 @@
+"""
+Локальный классификатор вопросов (наивный Байес по символьным n-граммам)
+"""
+
+import json
+import logging
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from text_normalizer import normalize_question
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (3, 4, 5)
+
+def char_ngrams(text: str) -> Counter:
+    """
+    Символьные n-граммы нормализованного текста.
+
+    Слова обрамляются пробелами, поэтому n-граммы с краев слова отличаются
+    от внутренних, а разные окончания одного слова ("торги", "торгах")
+    дают общие n-граммы основы.
+    """
+    features = Counter()
+    for word in normalize_question(text).split():
+        padded = f' {word} '
+        for size in NGRAM_SIZES:
+            for start in range(len(padded) - size + 1):
+                features[padded[start:start + size]] += 1
+    return features
+
+class NaiveBayesClassifier:
+    """
+    Мультиномиальный наивный Байес со сглаживанием Лапласа.
+
+    Модель хранит логарифмы априорных вероятностей классов и вероятностей
+    n-грамм в каждом классе; редкие n-граммы отбрасываются при обучении,
+    поэтому модель занимает сотни килобайт и сериализуется в JSON.
+    Предсказание - сумма логарифмов по n-граммам вопроса, десятки микросекунд.
+    """
+
+    def __init__(self, classes: List[str], log_priors: Dict[str, float],
+                 log_probs: Dict[str, Dict[str, float]], log_unknown: Dict[str, float]):
+        self.classes = classes
+        self.log_priors = log_priors
+        self.log_probs = log_probs
+        self.log_unknown = log_unknown
+
+    @classmethod
+    def fit(cls, texts: Iterable[str], labels: Iterable[str], min_count: int = 2,
+            max_features: int = 20000, alpha: float = 1.0) -> 'NaiveBayesClassifier':
+        """Обучение на размеченных вопросах"""
+        class_counts = Counter()
+        class_features: Dict[str, Counter] = {}
+        total_features = Counter()
+        for text, label in zip(texts, labels):
+            features = char_ngrams(text)
+            class_counts[label] += 1
+            class_features.setdefault(label, Counter()).update(features)
+            total_features.update(features)
+
+        vocabulary = [feature for feature, count in total_features.most_common(max_features) if count >= min_count]
+        samples = sum(class_counts.values())
+        classes = sorted(class_counts)
+
+        log_priors = {}
+        log_probs = {}
+        log_unknown = {}
+        for label in classes:
+            counts = class_features[label]
+            denominator = sum(counts[feature] for feature in vocabulary) + alpha * (len(vocabulary) + 1)
+            log_priors[label] = math.log(class_counts[label] / samples)
+            log_probs[label] = {feature: math.log((counts[feature] + alpha) / denominator) for feature in vocabulary}
+            log_unknown[label] = math.log(alpha / denominator)
+        return cls(classes, log_priors, log_probs, log_unknown)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Наиболее вероятный класс и его вероятность"""
+        features = char_ngrams(text)
+        scores = {}
+        for label in self.classes:
+            probs = self.log_probs[label]
+            unknown = self.log_unknown[label]
+            score = self.log_priors[label]
+            for feature, count in features.items():
+                score += count * probs.get(feature, unknown)
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        # Нормировка через softmax от логарифмов (со сдвигом на максимум)
+        total = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1 / total
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Параметры модели для сохранения"""
+        return {
+            'classes': self.classes,
+            'log_priors': self.log_priors,
+            'log_probs': self.log_probs,
+            'log_unknown': self.log_unknown
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'NaiveBayesClassifier':
+        """Восстановление модели из сохраненных параметров"""
+        return cls(data['classes'], data['log_priors'], data['log_probs'], data['log_unknown'])
+
+class QuestionClassifier:
+    """
+    Модели релевантности и типа вопроса, обученные на таблице requests.
+
+    Любая из моделей может отсутствовать (мало данных или один класс);
+    тогда соответствующий метод возвращает None и решение принимается
+    прежним способом.
+    """
+
+    def __init__(self, relevance: Optional[NaiveBayesClassifier] = None,
+                 question_type: Optional[NaiveBayesClassifier] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.relevance = relevance
+        self.question_type = question_type
+        self.metadata = metadata or {}
+
+    def predict_relevance(self, question: str) -> Optional[Tuple[bool, float]]:
+        """Вердикт релевантности и уверенность модели"""
+        if self.relevance is None:
+            return None
+        label, confidence = self.relevance.predict(question)
+        return label == 'relevant', confidence
+
+    def predict_question_type(self, question: str) -> Optional[Tuple[str, float]]:
+        """Тип вопроса и уверенность модели"""
+        if self.question_type is None:
+            return None
+        return self.question_type.predict(question)
+
+    def save(self, path: str):
+        """Сохранение моделей в JSON"""
+        data = {
+            'metadata': self.metadata,
+            'relevance': self.relevance.to_dict() if self.relevance else None,
+            'question_type': self.question_type.to_dict() if self.question_type else None
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['QuestionClassifier']:
+        """Загрузка моделей из JSON (None, если файла нет или он поврежден)"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(
+                NaiveBayesClassifier.from_dict(data['relevance']) if data.get('relevance') else None,
+                NaiveBayesClassifier.from_dict(data['question_type']) if data.get('question_type') else None,
+                data.get('metadata')
+            )
+        except Exception as e:
+            logger.error(f"Ошибка загрузки локального классификатора {path}: {e}")
+            return None
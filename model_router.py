@@ -0,0 +1,99 @@
+"""
+Выбор модели Mistral (уровня) для ответа по типу вопроса и уверенности в нем
+"""
+
+import threading
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, NamedTuple
+from config import (
+    MODEL_ROUTING,
+    MODEL_TIERS,
+    MODEL_DEFAULT_TIER,
+    MODEL_LARGE_TYPES,
+    MODEL_FAST_MAX_QUESTION_TOKENS,
+    MODEL_ROUTING_CONFIDENCE,
+    KEY_LATENCY_WINDOW
+)
+
+class ModelRoute(NamedTuple):
+    """Параметры запроса ответа: уровень, модель, лимит токенов и температура"""
+    tier: str
+    model: str
+    max_tokens: int
+    temperature: float
+
+class ModelRouter:
+    """
+    Маршрутизация вопросов по уровням моделей из MODEL_TIERS.
+
+    - типы из large_types (юридические вопросы, стратегии) при уверенности
+      в типе не ниже min_confidence - в уровень 'large'
+    - короткие вопросы общего типа (определения терминов) - в уровень 'fast'
+    - остальные - в уровень по умолчанию
+
+    max_tokens ответа - меньшее из лимита по истории ответов этого типа
+    и потолка уровня, но не ниже min_tokens (нижней границы типа после
+    обрезанных ответов). Уровень 'fast' пропускается, если его потолок
+    ниже этой границы: иначе ответы типа оставались бы обрезанными.
+    Если маршрутизация выключена, все вопросы идут
+    в уровень по умолчанию. Для настройки политики учитываются решения
+    и задержки ответов каждого уровня.
+    """
+
+    def __init__(self, enabled: bool = MODEL_ROUTING, tiers: Dict[str, Dict[str, Any]] = MODEL_TIERS,
+                 default_tier: str = MODEL_DEFAULT_TIER, large_types: Iterable[str] = MODEL_LARGE_TYPES,
+                 fast_max_question_tokens: int = MODEL_FAST_MAX_QUESTION_TOKENS,
+                 min_confidence: float = MODEL_ROUTING_CONFIDENCE):
+        self.enabled = enabled
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.large_types = frozenset(large_types)
+        self.fast_max_question_tokens = fast_max_question_tokens
+        self.min_confidence = min_confidence
+
+        self._decisions = Counter()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def route(self, question_type: str, confidence: float, question_tokens: int, max_tokens: int,
+              min_tokens: int = 0) -> ModelRoute:
+        """Уровень модели и параметры запроса для вопроса"""
+        tier = self.default_tier
+        if self.enabled:
+            if question_type in self.large_types and confidence >= self.min_confidence:
+                tier = 'large'
+            elif (question_type == 'general' and question_tokens <= self.fast_max_question_tokens
+                  and self.tiers.get('fast', {}).get('max_tokens', 0) >= min_tokens):
+                tier = 'fast'
+            if tier not in self.tiers:
+                tier = self.default_tier
+
+        settings = self.tiers[tier]
+        with self._lock:
+            self._decisions[(tier, question_type)] += 1
+        # Нижняя граница после обрезанных ответов применяется после потолка уровня
+        max_tokens = max(min(max_tokens, settings['max_tokens']), min_tokens)
+        return ModelRoute(tier, settings['model'], max_tokens, settings['temperature'])
+
+    def record(self, tier: str, latency: float):
+        """Учет задержки ответа уровня"""
+        with self._lock:
+            self._latencies.setdefault(tier, deque(maxlen=KEY_LATENCY_WINDOW)).append(latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Решения по уровням и типам вопросов, задержки уровней (p50/p95)"""
+        with self._lock:
+            tiers = {}
+            for tier, latencies in self._latencies.items():
+                ordered = sorted(latencies)
+                tiers[tier] = {
+                    'responses': len(ordered),
+                    'latency_p50': round(ordered[len(ordered) // 2], 3),
+                    'latency_p95': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3)
+                }
+            return {
+                'enabled': self.enabled,
+                'decisions': {f'{tier}/{question_type}': count
+                              for (tier, question_type), count in self._decisions.most_common()},
+                'tiers': tiers
+            }
@@ -0,0 +1,157 @@
+"""
+Предварительная генерация ответов на популярные вопросы (прогрев faq_cache)
+
+Берет самые частые релевантные вопросы из таблицы requests (варианты
+написания одного вопроса считаются вместе), для которых в faq_cache еще
+нет ответа, и генерирует ответы заранее - вне пиковых часов. В часы
+нагрузки такие вопросы обслуживаются из кэша без запроса к Mistral API.
+
+Запуск: python prewarm_cache.py [число_вопросов] [путь_к_БД]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import (
+    DATABASE_PATH,
+    PREWARM_CONCURRENCY,
+    PREWARM_DAYS,
+    PREWARM_KEY_RPM,
+    PREWARM_TOKEN_BUDGET,
+    PREWARM_TOP_N
+)
+from database import DatabaseManager
+from ai_service import AIService
+from token_budget import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class CachePrewarmer:
+    """
+    Генерация ответов на список вопросов с сохранением в кэши AIService.
+
+    Одновременно выполняется не больше concurrency запросов, и не чаще
+    key_rpm в минуту на каждый API ключ: ключ выбирает пул AIService,
+    поэтому общий темп - key_rpm, умноженный на число ключей. Перед
+    запросом из бюджета резервируется его худшая стоимость (оценка промпта
+    и потолок max_tokens маршрута), после ответа резерв заменяется оценкой
+    фактического расхода. Вопросы, не помещающиеся в остаток бюджета,
+    пропускаются.
+    """
+
+    def __init__(self, ai_service: AIService, token_budget: int = PREWARM_TOKEN_BUDGET,
+                 key_rpm: float = PREWARM_KEY_RPM, concurrency: int = PREWARM_CONCURRENCY):
+        self.ai_service = ai_service
+        self.token_budget = token_budget
+        self.concurrency = concurrency
+        self.interval = 60 / (key_rpm * max(len(ai_service.api_keys), 1))
+
+        self._next_slot = 0.0
+        self._spent = 0
+        self._reserved = 0
+
+        self.answered = 0
+        self.failed = 0
+        self.skipped = 0
+
+    async def run(self, questions: List[str]) -> Dict[str, Any]:
+        """Генерация ответов на вопросы (от самых популярных)"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._prewarm(question, semaphore) for question in questions))
+        return self.get_stats()
+
+    async def _prewarm(self, question: str, semaphore: asyncio.Semaphore):
+        """Ответ на один вопрос в пределах бюджета токенов и темпа запросов"""
+        async with semaphore:
+            question_type, confidence = self.ai_service._classify_question(question)
+            route = self.ai_service._route_answer(question, question_type, confidence)
+            prompt_tokens = sum(estimate_tokens(message['content'])
+                                for message in self.ai_service._build_answer_messages(question, question_type))
+            reserved = prompt_tokens + route.max_tokens
+            if self._spent + self._reserved + reserved > self.token_budget:
+                self.skipped += 1
+                return
+
+            self._reserved += reserved
+            try:
+                await self._wait_rate_slot()
+                answer = await self.ai_service._request_answer_async(question, question_type, route, None)
+            except Exception as e:
+                logger.error(f"Ошибка прогрева ответа на \"{question[:50]}\": {e}")
+                answer = None
+            finally:
+                self._reserved -= reserved
+
+            # Промпт мог быть оплачен и при ошибке - учитываем его в любом случае
+            self._spent += prompt_tokens
+            if not answer:
+                self.failed += 1
+                return
+            self._spent += estimate_tokens(answer)
+            self.ai_service._remember_answer(question, answer)
+            self.answered += 1
+
+    async def _wait_rate_slot(self):
+        """Ожидание очередного слота запроса (равномерный темп key_rpm на ключ)"""
+        now = time.monotonic()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Итоги прогрева"""
+        return {
+            'answered': self.answered,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'spent_tokens': self._spent,
+            'budget_left': max(self.token_budget - self._spent, 0)
+        }
+
+async def prewarm(db: DatabaseManager, top_n: int) -> Optional[Dict[str, Any]]:
+    """Прогрев faq_cache ответами на top_n популярных вопросов без ответа в кэше"""
+    questions = [question for question, _ in db.get_prewarm_questions(PREWARM_DAYS, top_n)]
+    print(f"📋 Вопросов без ответа в кэше: {len(questions)} (топ-{top_n} за {PREWARM_DAYS} дней)")
+
+    ai_service = AIService(db)
+    if not ai_service.api_keys:
+        print("❌ Нет API ключей Mistral, прогрев невозможен")
+        return None
+
+    prewarmer = CachePrewarmer(ai_service)
+    try:
+        return await prewarmer.run(questions)
+    finally:
+        await ai_service.aclose()
+
+def main():
+    """Главная функция прогрева"""
+    top_n = int(sys.argv[1]) if len(sys.argv) > 1 else PREWARM_TOP_N
+    db_path = sys.argv[2] if len(sys.argv) > 2 else DATABASE_PATH
+
+    print(f"🔥 Прогрев кэша ответов: {db_path}")
+    db = DatabaseManager(db_path)
+    try:
+        stats = asyncio.run(prewarm(db, top_n))
+    finally:
+        db.close()
+
+    if stats is None:
+        return False
+    print(f"   - Сгенерировано ответов: {stats['answered']}")
+    print(f"   - Ошибок: {stats['failed']}")
+    print(f"   - Пропущено (бюджет токенов): {stats['skipped']}")
+    print(f"   - Израсходовано токенов (оценка): {stats['spent_tokens']}, осталось {stats['budget_left']}")
+    return stats['failed'] == 0
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -76,6 +76,21 @@ MAIN_SYSTEM_PROMPT = """
 Отвечай профессионально, но живым языком.
 """
 
+# Сокращенный системный промпт для коротких вопросов (приветствия, определения терминов)
+MAIN_SYSTEM_PROMPT_COMPACT = """
+Ты - дружелюбный эксперт по торгам по банкротству в России (ФЗ-127, залоговое имущество,
+финансовые управляющие, документы и стратегии торгов, недвижимость и инвестиции в нее).
+
+Отвечай кратко, естественно и простыми словами, объясняй сложные термины.
+Различай: ЗАЛОГ - имущество в обеспечение обязательства, ЗАДАТОК - денежный взнос для участия в торгах.
+НЕ давай ссылки на торговые площадки, агрегаторы лотов и сайты недвижимости - только на законы
+и официальные госсайты; вместо ссылок направляй к нашим специалистам.
+Если уместно, упомяни: "Наши специалисты помогут..." или "Обратитесь к нашим экспертам...".
+
+Если вопрос СОВСЕМ НЕ по теме, вежливо ответь: "Извините, я специализируюсь только на вопросах,
+связанных с торгами по банкротству. Задайте, пожалуйста, вопрос по этой теме."
+"""
+
 # Промпт для определения релевантности вопроса
 RELEVANCE_CHECK_PROMPT = """
 Определи, относится ли следующий вопрос к торгам по банкротству, недвижимости или смежным темам:
@@ -100,6 +115,20 @@ RELEVANCE_CHECK_PROMPT = """
 Если есть МАЛЕЙШЕЕ сомнение - отвечай "ДА".
 """
 
+# Промпт для пакетной проверки релевантности
+RELEVANCE_BATCH_PROMPT = """
+Определи для каждого из вопросов ниже, относится ли он к торгам по банкротству, недвижимости или смежным темам:
+
+{questions}
+
+Будь МАКСИМАЛЬНО ВЕЛИКОДУШНЫМ в оценке релевантности: торги по банкротству, недвижимость и имущество,
+залоговое имущество, финансовые управляющие, ФЗ-127, документы и стратегии торгов, юридические аспекты
+имущества, покупка недвижимости, инвестиции в недвижимость, экономические вопросы.
+Если есть МАЛЕЙШЕЕ сомнение - отвечай "ДА".
+
+Ответь строго по одной строке на вопрос, в формате "номер. ДА" или "номер. НЕТ", без пояснений.
+"""
+
 # Промпт для продаж услуг
 SALES_PROMPT = """
 В конце ответа, если это уместно, естественно упомяни о наших услугах:
@@ -142,6 +171,42 @@ QUESTION_TYPE_PROMPTS = {
     """
 }
 
+# Ключевые слова для классификации вопросов (поиск подстрок в тексте в нижнем регистре)
+
+# Вежливые фразы - всегда релевантны, отвечаем из кэша
+POLITE_PHRASES = ['спасибо', 'благодарю', 'привет', 'здравствуйте', 'до свидания', 'пока']
+
+# Расширенный список ключевых слов для торгов по банкротству
+TRADE_KEYWORDS = [
+    # Основные термины
+    'торг', 'банкрот', 'несостоятельность', 'конкурс',
+    # Имущество и недвижимость
+    'залог', 'имуществ', 'недвижим', 'квартир', 'дом', 'участок', 'земл',
+    # Процедуры и документы
+    'документ', 'участие', 'лот', 'ставка', 'аукцион', 'продаж',
+    # Финансы
+    'долг', 'кредит', 'обязательств', 'требовани', 'денег', 'стоимость',
+    # Юридические аспекты
+    'суд', 'закон', 'право', 'статья', 'фз', 'кодекс',
+    # Участники
+    'управляющ', 'кредитор', 'должник', 'участник',
+    # Общие экономические термины
+    'собственность', 'приобретение', 'покупка', 'инвестиц',
+    # Документы и процедуры
+    'акт', 'хранен', 'ответственн', 'передач', 'приемк'
+]
+
+# Типы вопросов в порядке приоритета (первый найденный тип побеждает)
+QUESTION_TYPE_KEYWORDS = {
+    'documents': ['документ', 'справка', 'пакет', 'заявка'],
+    'strategy': ['стратегия', 'выбор', 'лота', 'ставка'],
+    'legal': ['закон', 'статья', 'фз', 'право', 'суд'],
+    'property': ['недвижимость', 'имущество', 'квартира', 'дом'],
+}
+
+# Упоминания специалистов в ответе - показываем кнопку связи
+SPECIALIST_KEYWORDS = ['специалист', 'эксперт', 'консультац', 'помощь', 'анализ', 'наши специалисты', 'наши эксперты']
+
 # Базовые ответы для fallback (только самые критичные)
 FAQ_CACHE = {
     # Только базовые приветствия и простые ответы
@@ -186,6 +251,12 @@ FAQ_CACHE = {
     """
 }
 
+# Приписка к ответу, поток которого оборвался
+STREAM_INTERRUPTED_NOTICE = """
+
+⚠️ Ответ прервался из-за сбоя связи. Повторите вопрос, чтобы получить его полностью.
+"""
+
 # Промпт для обработки ошибок
 ERROR_PROMPT = """
 Произошла ошибка при обработке запроса. Попробуйте переформулировать вопрос или обратитесь к специалисту.
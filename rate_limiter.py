@@ -0,0 +1,170 @@
+"""
+Ограничение частоты запросов пользователей (скользящее окно)
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from config import (
+    MAX_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_MAX_USERS,
+    RATE_LIMIT_SHARED,
+    RATE_LIMIT_WINDOW
+)
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+def sliding_window_consume(state: List, now: float, max_requests: int, window: float) -> bool:
+    """
+    Проверка и списание запроса по счетчику скользящего окна.
+
+    state - [номер окна, запросов в текущем окне, запросов в предыдущем окне].
+    Число запросов за последние window секунд оценивается как
+    previous * (доля предыдущего окна, попадающая в интервал) + current,
+    что требует O(1) памяти на пользователя вместо списка отметок времени.
+    """
+    window_id = int(now // window)
+    if window_id != state[0]:
+        # Сдвигаем окно: текущее становится предыдущим, если оно было вплотную
+        state[2] = state[1] if window_id == state[0] + 1 else 0
+        state[1] = 0
+        state[0] = window_id
+
+    elapsed = (now - window_id * window) / window
+    estimate = state[2] * (1 - elapsed) + state[1]
+    if estimate >= max_requests:
+        return False
+
+    state[1] += 1
+    return True
+
+class RateLimiter:
+    """
+    Лимитер запросов в памяти процесса.
+
+    Проверка и списание выполняются за O(1) под одной блокировкой, поэтому
+    нет гонки между чтением счетчика и его увеличением. Пользователи хранятся в порядке последнего
+    обращения: неактивные дольше двух окон вытесняются, общее число записей
+    ограничено RATE_LIMIT_MAX_USERS.
+
+    В режиме shared=True квота общая для всех процессов бота и хранится
+    в таблице user_limits, а списание идет в транзакции BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, db_manager: Optional[DatabaseManager] = None,
+                 max_requests: int = MAX_REQUESTS_PER_MINUTE,
+                 window: float = RATE_LIMIT_WINDOW,
+                 max_users: int = RATE_LIMIT_MAX_USERS,
+                 shared: bool = RATE_LIMIT_SHARED):
+        self.db_manager = db_manager
+        self.max_requests = max_requests
+        self.window = window
+        self.max_users = max_users
+        self.shared = shared and db_manager is not None
+
+        # user_id -> [номер окна, текущее окно, предыдущее окно, последнее обращение]
+        self._users: "OrderedDict[int, List]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, user_id: int, now: Optional[float] = None) -> bool:
+        """Проверка лимита и списание запроса в памяти процесса"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = [int(now // self.window), 0, 0, now]
+                self._users[user_id] = state
+            else:
+                self._users.move_to_end(user_id)
+            state[3] = now
+            allowed = sliding_window_consume(state, now, self.max_requests, self.window)
+            self._evict(now)
+            return allowed
+
+    def _evict(self, now: float):
+        """Вытеснение неактивных пользователей (самые старые - в начале словаря)"""
+        idle_before = now - 2 * self.window
+        while self._users:
+            user_id, state = next(iter(self._users.items()))
+            if state[3] >= idle_before and len(self._users) <= self.max_users:
+                break
+            del self._users[user_id]
+
+    async def acquire(self, user_id: int) -> bool:
+        """Проверка лимита для обработчиков Telegram"""
+        if self.shared:
+            return await asyncio.to_thread(self._acquire_shared, user_id)
+        return self.try_acquire(user_id)
+
+    def _acquire_shared(self, user_id: int) -> bool:
+        """Проверка общего для всех процессов лимита через таблицу user_limits"""
+        now = time.time()
+        try:
+            with self.db_manager.connection() as conn:
+                # Блокировка записи сразу: процессы не прочитают одно и то же состояние
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('''
+                    SELECT window_id, requests_count, previous_count FROM user_limits WHERE user_id = ?
+                ''', (user_id,)).fetchone()
+                state = list(row) if row else [int(now // self.window), 0, 0]
+                allowed = sliding_window_consume(state, now, self.max_requests, self.window)
+                conn.execute('''
+                    INSERT OR REPLACE INTO user_limits (user_id, window_id, requests_count, previous_count, last_reset)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (user_id, state[0], state[1], state[2]))
+                return allowed
+        except Exception as e:
+            logger.error(f"Ошибка проверки общего лимита пользователя {user_id}: {e}")
+            return self.try_acquire(user_id, now)  # деградируем до лимита процесса
+
+    def save_snapshot(self):
+        """Сохранение состояния лимитов в user_limits (переживает перезапуск)"""
+        if self.db_manager is None or self.shared:
+            return
+        with self._lock:
+            rows = [(user_id, state[0], state[1], state[2]) for user_id, state in self._users.items()]
+        if not rows:
+            return
+        try:
+            with self.db_manager.connection() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO user_limits (user_id, window_id, requests_count, previous_count, last_reset)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', rows)
+            logger.info(f"Снимок лимитов сохранен: {len(rows)} пользователей")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимка лимитов: {e}")
+
+    def load_snapshot(self):
+        """Восстановление состояния лимитов из user_limits (только актуальные окна)"""
+        if self.db_manager is None or self.shared:
+            return
+        now = time.time()
+        current_window = int(now // self.window)
+        try:
+            with self.db_manager.connection() as conn:
+                rows = conn.execute('''
+                    SELECT user_id, window_id, requests_count, previous_count FROM user_limits
+                    WHERE window_id >= ?
+                    ORDER BY window_id
+                    LIMIT ?
+                ''', (current_window - 1, self.max_users)).fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки снимка лимитов: {e}")
+            return
+
+        with self._lock:
+            for user_id, window_id, requests_count, previous_count in rows:
+                self._users[user_id] = [window_id, requests_count, previous_count, now]
+        if rows:
+            logger.info(f"Снимок лимитов загружен: {len(rows)} пользователей")
+
+    async def run_snapshots(self, interval: float):
+        """Периодическое сохранение снимка лимитов"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.save_snapshot)
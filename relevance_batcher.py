@@ -0,0 +1,137 @@
+"""
+Пакетная проверка релевантности: несколько вопросов в одном запросе к ИИ
+"""
+
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from config import RELEVANCE_BATCH_WINDOW, RELEVANCE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_VERDICT_LINE_RE = re.compile(r'^\s*(\d+)\s*[.):\-]?\s*(ДА|НЕТ)\b', re.IGNORECASE)
+
+class BatchRequestFailed(Exception):
+    """Пакетный запрос к ИИ не выполнен (API недоступен) - в отличие от неразобранного ответа"""
+
+def parse_batch_verdicts(response: Optional[str], count: int) -> Optional[List[bool]]:
+    """
+    Разбор ответа на пронумерованный список вопросов ("1. ДА", "2) нет"...).
+
+    Возвращает вердикты по порядку или None, если хотя бы для одного
+    вопроса вердикт не найден или номер встречается дважды.
+    """
+    if not response:
+        return None
+    verdicts: Dict[int, bool] = {}
+    for line in response.splitlines():
+        match = _VERDICT_LINE_RE.match(line)
+        if not match:
+            continue
+        number = int(match.group(1))
+        if number in verdicts or not 1 <= number <= count:
+            return None
+        verdicts[number] = match.group(2).upper() == 'ДА'
+    if len(verdicts) != count:
+        return None
+    return [verdicts[number] for number in range(1, count + 1)]
+
+class RelevanceBatcher:
+    """
+    Сборщик проверок релевантности в пакеты.
+
+    Вопросы, пришедшие в течение window секунд (или до max_batch штук),
+    отправляются одним запросом check_batch. Одиночный вопрос сразу идет
+    в check_one. Если ответ на пакет не разобрался (check_batch вернул
+    None), каждый вопрос проверяется отдельным запросом check_one. Если же
+    сам запрос не выполнен (check_batch вызвал BatchRequestFailed), вердикты
+    дает fallback без обращения к ИИ: когда API недоступен, N отдельных
+    запросов вместо одного только усилили бы нагрузку.
+    """
+
+    def __init__(self, check_batch: Callable[[List[str]], Awaitable[Optional[List[bool]]]],
+                 check_one: Callable[[str], Awaitable[bool]], fallback: Callable[[str], bool],
+                 window: float = RELEVANCE_BATCH_WINDOW, max_batch: int = RELEVANCE_BATCH_SIZE):
+        self.check_batch = check_batch
+        self.check_one = check_one
+        self.fallback = fallback
+        self.window = window
+        self.max_batch = max_batch
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.batched_questions = 0
+        self.single = 0
+        self.fallbacks = 0
+        self.local_fallbacks = 0
+
+    async def check(self, question: str) -> bool:
+        """Вердикт релевантности вопроса (ждет сборки пакета)"""
+        if self.window <= 0 or self.max_batch <= 1:
+            self.single += 1
+            return await self.check_one(question)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Отправка накопленного пакета"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        batch = [(question, future) for question, future in batch if not future.done()]
+        if batch:
+            task = asyncio.ensure_future(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Получение вердиктов для пакета и передача их ожидающим"""
+        questions = [question for question, _ in batch]
+        try:
+            if len(questions) == 1:
+                self.single += 1
+                verdicts = [await self.check_one(questions[0])]
+            else:
+                verdicts = await self.check_batch(questions)
+                if verdicts is None:
+                    self.fallbacks += 1
+                    logger.warning(f"Не удалось разобрать пакетный ответ ({len(questions)} вопросов), "
+                                   f"проверяем по одному")
+                    verdicts = await asyncio.gather(*(self.check_one(question) for question in questions))
+                else:
+                    self.batches += 1
+                    self.batched_questions += len(questions)
+        except BatchRequestFailed:
+            self.local_fallbacks += 1
+            logger.warning(f"Пакетный запрос не выполнен ({len(questions)} вопросов), "
+                           f"используем локальные вердикты")
+            verdicts = [self.fallback(question) for question in questions]
+        except Exception as e:
+            logger.error(f"Ошибка пакетной проверки релевантности: {e}")
+            verdicts = [True] * len(questions)  # В случае ошибки считаем релевантным
+
+        for (_, future), verdict in zip(batch, verdicts):
+            if not future.done():
+                future.set_result(verdict)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Счетчики пакетов"""
+        return {
+            'batches': self.batches,
+            'batched_questions': self.batched_questions,
+            'single': self.single,
+            'fallbacks': self.fallbacks,
+            'local_fallbacks': self.local_fallbacks
+        }
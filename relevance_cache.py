@@ -0,0 +1,127 @@
+"""
+Кэш вердиктов проверки релевантности (память + таблица relevance_cache)
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+from config import RELEVANCE_CACHE_SIZE, RELEVANCE_CACHE_TTL
+from database import DatabaseManager
+from telemetry import TelemetryBuffer
+from text_normalizer import normalize_question
+
+logger = logging.getLogger(__name__)
+
+class RelevanceCache:
+    """
+    Двухуровневый кэш вердиктов релевантности: LRU в памяти процесса
+    и таблица relevance_cache в SQLite.
+
+    Запоминаются и положительные, и отрицательные вердикты, полученные
+    от Mistral API, поэтому повторный вопрос не требует отдельного запроса
+    перед основным ответом. Ключ - нормализованный текст вопроса
+    (normalize_question): регистр и пунктуация не важны, а отрицания
+    и порядок слов сохраняются. Вердикт живет ttl секунд в обоих уровнях.
+    Асинхронный код читает таблицу в потоке (get_async), а новые вердикты
+    записываются через writer - буфер телеметрии (write-behind) или сам
+    DatabaseManager.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_size: int = RELEVANCE_CACHE_SIZE,
+                 ttl: float = RELEVANCE_CACHE_TTL, writer: Optional[Union[DatabaseManager, TelemetryBuffer]] = None):
+        self.db_manager = db_manager
+        self.writer = writer or db_manager
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # ключ вопроса -> (вердикт, время истечения)
+        self._entries: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, question: str) -> Optional[bool]:
+        """Вердикт для вопроса: сначала из памяти, затем из relevance_cache"""
+        key = normalize_question(question)
+        if not key:
+            return None
+        verdict = self._get_memory(key)
+        if verdict is None:
+            verdict = self._found_in_db(key, self.db_manager.get_relevance_verdict(key, self.ttl))
+        return verdict
+
+    async def get_async(self, question: str) -> Optional[bool]:
+        """Вердикт для вопроса без блокировки event loop: таблица читается в потоке"""
+        key = normalize_question(question)
+        if not key:
+            return None
+        verdict = self._get_memory(key)
+        if verdict is None:
+            verdict = self._found_in_db(key, await asyncio.to_thread(
+                self.db_manager.get_relevance_verdict, key, self.ttl))
+        return verdict
+
+    def _get_memory(self, key: str) -> Optional[bool]:
+        """Вердикт из памяти (устаревшая запись удаляется)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _found_in_db(self, key: str, verdict: Optional[bool]) -> Optional[bool]:
+        """Учет результата чтения relevance_cache и сохранение вердикта в памяти"""
+        with self._lock:
+            if verdict is None:
+                self.misses += 1
+            else:
+                self.db_hits += 1
+                self._store(key, verdict)
+        return verdict
+
+    def put(self, question: str, is_relevant: bool):
+        """Сохранение вердикта в память и в relevance_cache (через writer)"""
+        key = normalize_question(question)
+        if not key:
+            return
+        with self._lock:
+            self._store(key, is_relevant)
+        self.writer.save_relevance_verdict(key, is_relevant)
+
+    def _store(self, key: str, is_relevant: bool):
+        """Добавление записи в LRU (вызывается под блокировкой)"""
+        self._entries[key] = (is_relevant, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def purge(self) -> int:
+        """Удаление устаревших вердиктов из relevance_cache"""
+        removed = self.db_manager.purge_relevance_verdicts(self.ttl)
+        if removed:
+            logger.info(f"Удалено устаревших вердиктов релевантности: {removed}")
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.db_hits) / lookups, 3) if lookups else 0.0
+            }
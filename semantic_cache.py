@@ -0,0 +1,235 @@
+"""
+Семантический кэш ответов: поиск похожего уже отвеченного вопроса
+"""
+
+import heapq
+import logging
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from config import SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TOP_K
+from database import DatabaseManager
+from text_normalizer import NEGATION_WORDS, content_words, is_verb, normalize_question, stem
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZES = (3, 4, 5)
+# Общий префикс, при котором основы считаются одним словом ("участвовать" - "участие")
+MIN_SHARED_PREFIX = 5
+
+def term_frequencies(text: str) -> Dict[str, float]:
+    """
+    Сублинейные частоты символьных n-грамм значимых слов вопроса.
+
+    N-граммы основы совпадают у разных форм слова ("торги", "торгах"),
+    поэтому близкие по смыслу формулировки получают похожие векторы
+    без морфологического словаря и внешней модели.
+    """
+    counts = Counter()
+    for word in content_words(text):
+        padded = f' {word} '
+        for size in NGRAM_SIZES:
+            for start in range(len(padded) - size + 1):
+                counts[padded[start:start + size]] += 1
+    return {feature: 1 + math.log(count) for feature, count in counts.items()}
+
+def question_terms(text: str) -> Tuple[FrozenSet[Tuple[str, bool]], FrozenSet[str]]:
+    """Значимые слова вопроса (основа, глагол ли) и отрицания"""
+    negations = frozenset(word for word in normalize_question(text).split() if word in NEGATION_WORDS)
+    return frozenset((stem(word), is_verb(word)) for word in content_words(text)), negations
+
+def same_word(first: str, second: str) -> bool:
+    """Одно ли слово две основы: совпадают или имеют длинный общий префикс"""
+    if first == second:
+        return True
+    shared = 0
+    for first_char, second_char in zip(first, second):
+        if first_char != second_char:
+            break
+        shared += 1
+    return shared >= MIN_SHARED_PREFIX
+
+def unmatched_terms(terms: FrozenSet[Tuple[str, bool]], other: FrozenSet[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """Слова terms, которым нет пары в other"""
+    return [(word, verb) for word, verb in terms if not any(same_word(word, other_word) for other_word, _ in other)]
+
+class SemanticEntry:
+    """Отвеченный вопрос в семантическом кэше"""
+
+    __slots__ = ('question_hash', 'question', 'answer', 'weights', 'norm', 'terms', 'negations')
+
+    def __init__(self, question_hash: str, question: str, answer: str, weights: Dict[str, float]):
+        self.question_hash = question_hash
+        self.question = question
+        self.answer = answer
+        self.weights = weights
+        self.norm = 1.0
+        self.terms, self.negations = question_terms(question)
+
+    def agrees_with(self, terms: FrozenSet[Tuple[str, bool]], negations: FrozenSet[str]) -> bool:
+        """
+        Смысл не расходится с новым вопросом: отрицания совпадают, а слова
+        без пары не противоречат друг другу. Лишние уточнения с одной стороны
+        допустимы ("по банкротству", "после торгов"), но глагол без пары
+        с обеих сторон ("купить" - "продать") или имя без пары с обеих
+        сторон ("дом" - "квартиру") означает другой вопрос. Близкие n-граммы
+        этого не различают.
+        """
+        if negations != self.negations:
+            return False
+        own = {verb for _, verb in unmatched_terms(self.terms, terms)}
+        other = {verb for _, verb in unmatched_terms(terms, self.terms)}
+        return not own & other
+
+class SemanticCache:
+    """
+    Поиск ответа на похожий вопрос по косинусной близости TF-IDF векторов.
+
+    Векторы разреженные и хранятся в инвертированном индексе
+    n-грамма -> {запись: вес}, поэтому поиск проходит только по записям,
+    у которых есть общие с вопросом n-граммы, а добавление и вытеснение
+    записи обновляют индекс инкрементально. IDF считается по записям кэша;
+    нормы векторов пересчитываются, когда размер кэша заметно изменился.
+    Размер ограничен max_size, вытесняются давно не использованные записи.
+
+    Близость лишь отбирает кандидатов (порог невысокий - перефразировки
+    вроде "участвовать" и "принять участие" близки слабо), а ответ из кэша
+    выдается, только если кандидат согласуется с вопросом по значимым
+    словам и отрицаниям (SemanticEntry.agrees_with).
+    """
+
+    def __init__(self, db_manager: DatabaseManager, max_size: int = SEMANTIC_CACHE_SIZE,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, top_k: int = SEMANTIC_CACHE_TOP_K):
+        self.db_manager = db_manager
+        self.max_size = max_size
+        self.threshold = threshold
+        self.top_k = top_k
+
+        self._entries: "OrderedDict[int, SemanticEntry]" = OrderedDict()
+        self._by_hash: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._next_id = 0
+        self._norms_size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def preload(self) -> int:
+        """Загрузка самых востребованных ответов из faq_cache"""
+        rows = self.db_manager.get_faq_entries(self.max_size)
+        # От менее популярных к более популярным: последние - самые свежие в LRU
+        for question_hash, question, answer in reversed(rows):
+            self.add(question_hash, question, answer)
+        if rows:
+            logger.info(f"Семантический кэш загружен: {len(rows)} записей")
+        return len(rows)
+
+    def add(self, question_hash: str, question: str, answer: str):
+        """Добавление отвеченного вопроса"""
+        weights = term_frequencies(question)
+        if not weights:
+            return
+        with self._lock:
+            if question_hash in self._by_hash:
+                self._remove(self._by_hash[question_hash])
+
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = SemanticEntry(question_hash, question, answer, weights)
+            self._entries[entry_id] = entry
+            self._by_hash[question_hash] = entry_id
+            for feature, weight in weights.items():
+                self._postings.setdefault(feature, {})[entry_id] = weight
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            if abs(len(self._entries) - self._norms_size) > self._norms_size // 10:
+                self._refresh_norms()
+            else:
+                entry.norm = self._norm(weights)
+
+    def _remove(self, entry_id: int):
+        """Удаление записи из индекса (вызывается под блокировкой)"""
+        entry = self._entries.pop(entry_id)
+        del self._by_hash[entry.question_hash]
+        for feature in entry.weights:
+            postings = self._postings[feature]
+            del postings[entry_id]
+            if not postings:
+                del self._postings[feature]
+
+    def _idf(self, feature: str) -> float:
+        """Обратная частота n-граммы среди записей кэша"""
+        return math.log((len(self._entries) + 1) / (len(self._postings.get(feature, ())) + 1)) + 1
+
+    def _norm(self, weights: Dict[str, float]) -> float:
+        """Норма TF-IDF вектора"""
+        return math.sqrt(sum((weight * self._idf(feature)) ** 2 for feature, weight in weights.items())) or 1.0
+
+    def _refresh_norms(self):
+        """Пересчет норм всех записей под текущие IDF (вызывается под блокировкой)"""
+        for entry in self._entries.values():
+            entry.norm = self._norm(entry.weights)
+        self._norms_size = len(self._entries)
+
+    def search(self, question: str, k: Optional[int] = None) -> List[Tuple[float, str, str]]:
+        """k самых похожих вопросов: (близость, вопрос, ответ)"""
+        weights = term_frequencies(question)
+        if not weights:
+            return []
+        with self._lock:
+            return [(score, entry.question, entry.answer)
+                    for score, _, entry in self._search(weights, k or self.top_k)]
+
+    def _search(self, weights: Dict[str, float], k: int) -> List[Tuple[float, int, SemanticEntry]]:
+        """Косинусная близость по инвертированному индексу (вызывается под блокировкой)"""
+        scores: Dict[int, float] = {}
+        query_norm = 0.0
+        for feature, weight in weights.items():
+            idf = self._idf(feature)
+            query_weight = weight * idf
+            query_norm += query_weight ** 2
+            for entry_id, entry_weight in self._postings.get(feature, {}).items():
+                scores[entry_id] = scores.get(entry_id, 0.0) + query_weight * entry_weight * idf
+        query_norm = math.sqrt(query_norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1] / self._entries[item[0]].norm)
+        return [(min(score / (query_norm * self._entries[entry_id].norm), 1.0), entry_id, self._entries[entry_id])
+                for entry_id, score in top]
+
+    def get(self, question: str) -> Optional[str]:
+        """Ответ на достаточно похожий вопрос или None"""
+        weights = term_frequencies(question)
+        if not weights:
+            return None
+        terms, negations = question_terms(question)
+        with self._lock:
+            for score, entry_id, entry in self._search(weights, self.top_k):
+                if score < self.threshold:
+                    break
+                if entry.agrees_with(terms, negations):
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    logger.info(f"Семантический кэш: \"{question[:50]}\" ~ \"{entry.question[:50]}\" ({score:.2f})")
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'features': len(self._postings),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,86 @@
+"""
+Объединение одинаковых одновременных запросов в один (single-flight)
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[Any], Awaitable[None]]
+
+class Flight:
+    """Выполняющийся вызов и все, кто ждет его результата"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[Listener] = []
+        self.last_progress = None
+
+    async def emit(self, progress: Any):
+        """Передача промежуточного результата всем ожидающим"""
+        self.last_progress = progress
+        for listener in list(self.listeners):
+            try:
+                await listener(progress)
+            except Exception as e:
+                logger.warning(f"Ошибка передачи промежуточного результата: {e}")
+
+class SingleFlight:
+    """
+    Пока вызов с данным ключом выполняется, повторные вызовы с тем же ключом
+    не запускают новый, а ждут результата первого.
+
+    Вызов выполняется в отдельной задаче: отмена одного из ожидающих
+    не прерывает его для остальных, а отмена последнего ожидающего - прерывает.
+    Промежуточные результаты (например, накопленный текст потокового ответа)
+    получают все ожидающие, присоединившиеся - начиная с последнего.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, Flight] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, func: Callable[[Callable[[Any], Awaitable[None]]], Awaitable[Any]],
+                  on_progress: Optional[Listener] = None) -> Any:
+        """Выполнение func(emit) или ожидание уже идущего вызова с тем же ключом"""
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(func(flight.emit))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.shared += 1
+            if on_progress is not None and flight.last_progress is not None:
+                await on_progress(flight.last_progress)
+
+        if on_progress is not None:
+            flight.listeners.append(on_progress)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_progress is not None:
+                flight.listeners.remove(on_progress)
+            if flight.waiters == 0 and not flight.task.done():
+                # Результат больше никому не нужен
+                flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: Flight):
+        """Удаление завершенного вызова"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Счетчики вызовов"""
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'in_flight': len(self._flights)
+        }
@@ -0,0 +1,71 @@
+"""
+Учет спекулятивной генерации ответов (параллельно с проверкой релевантности)
+"""
+
+import threading
+import time
+from typing import Any, Dict
+from config import SPECULATIVE_ANSWERS, SPECULATIVE_TOKEN_BUDGET, SPECULATIVE_BUDGET_WINDOW
+
+class SpeculationBudget:
+    """
+    Бюджет токенов на отброшенные спекулятивные ответы.
+
+    Если вопрос оказался нерелевантным, уже начатая генерация ответа
+    отменяется, а ее оценочная стоимость (промпт и полученная часть ответа)
+    списывается с бюджета. Когда бюджет окна исчерпан, вопросы до начала
+    следующего окна проверяются по-старому - последовательно.
+    """
+
+    def __init__(self, enabled: bool = SPECULATIVE_ANSWERS, budget: int = SPECULATIVE_TOKEN_BUDGET,
+                 window: float = SPECULATIVE_BUDGET_WINDOW):
+        self.enabled = enabled
+        self.budget = budget
+        self.window = window
+
+        self._window_start = time.time()
+        self._spent = 0
+        self._lock = threading.Lock()
+
+        self.wins = 0
+        self.losses = 0
+        self.skipped = 0
+        self.wasted_tokens = 0
+
+    def allow(self) -> bool:
+        """Можно ли начать спекулятивную генерацию"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._spent = 0
+            if self._spent >= self.budget:
+                self.skipped += 1
+                return False
+            return True
+
+    def record_win(self):
+        """Вопрос релевантен - ответ уже генерируется"""
+        with self._lock:
+            self.wins += 1
+
+    def record_loss(self, tokens: int):
+        """Вопрос нерелевантен - генерация отброшена"""
+        with self._lock:
+            self.losses += 1
+            self.wasted_tokens += tokens
+            self._spent += tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики спекуляции"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'wins': self.wins,
+                'losses': self.losses,
+                'skipped': self.skipped,
+                'wasted_tokens': self.wasted_tokens,
+                'budget_left': max(self.budget - self._spent, 0)
+            }
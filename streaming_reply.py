@@ -0,0 +1,97 @@
+"""
+Ответ в Telegram, который дописывается по мере генерации
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+from config import MAX_MESSAGE_LENGTH, STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter (int или timedelta в зависимости от версии библиотеки)"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class StreamingReply:
+    """
+    Прогрессивный показ ответа вместо сообщения "Думаю над ответом...".
+
+    Первый фрагмент сразу заменяет текст сообщения-заглушки, дальше правки
+    идут не чаще раза в edit_interval секунд, чтобы не упираться в лимит
+    Telegram на редактирование сообщений; промежуточные фрагменты между
+    правками просто накапливаются. Текст длиннее max_length продолжается
+    в новом сообщении, а заполненные сообщения больше не редактируются.
+    """
+
+    def __init__(self, placeholder: Message, send: Callable[[str], Awaitable[Message]],
+                 max_length: int = MAX_MESSAGE_LENGTH, edit_interval: float = STREAM_EDIT_INTERVAL):
+        self.send = send
+        self.max_length = max_length
+        self.edit_interval = edit_interval
+
+        self.messages: List[Message] = [placeholder]
+        # Текст, который сейчас показан в каждом сообщении
+        self._shown: List[str] = [placeholder.text or '']
+        self._text = ''
+        self._next_edit = 0.0
+        self._lock = asyncio.Lock()
+
+    async def update(self, text: str):
+        """Новый текст ответа (показывается, если подошло время следующей правки)"""
+        self._text = text
+        if time.monotonic() < self._next_edit or self._lock.locked():
+            return
+        async with self._lock:
+            try:
+                await self._render(final=False)
+            except Exception as e:
+                # Промежуточная правка не должна прерывать генерацию ответа
+                logger.warning(f"Ошибка обновления ответа в Telegram: {e}")
+
+    async def finish(self, text: str):
+        """Показ окончательного текста ответа"""
+        self._text = text
+        async with self._lock:
+            await self._render(final=True)
+
+    async def _render(self, final: bool):
+        """Приведение сообщений к текущему тексту"""
+        text = self._text
+        if not text:
+            return
+        chunks = [text[i:i + self.max_length] for i in range(0, len(text), self.max_length)]
+        for index, chunk in enumerate(chunks):
+            if index == len(self.messages):
+                self.messages.append(await self.send(chunk))
+                self._shown.append(chunk)
+            elif self._shown[index] != chunk:
+                if not await self._edit(index, chunk, final):
+                    return
+        self._next_edit = time.monotonic() + self.edit_interval
+
+    async def _edit(self, index: int, text: str, final: bool) -> bool:
+        """Правка сообщения; при превышении лимита Telegram промежуточная правка пропускается"""
+        while True:
+            try:
+                await self.messages[index].edit_text(text)
+                self._shown[index] = text
+                return True
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                if not final:
+                    self._next_edit = time.monotonic() + delay
+                    return False
+                await asyncio.sleep(delay)
+            except BadRequest as e:
+                if 'not modified' in str(e).lower():
+                    self._shown[index] = text
+                    return True
+                raise
@@ -0,0 +1,201 @@
+"""
+Буферизованная запись телеметрии (запросы, переходы в канал, расход токенов, кэши ответов и вердиктов)
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Tuple
+from config import TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL_MS, TELEMETRY_MAX_BUFFER
+from database import DatabaseManager
+from text_normalizer import question_fingerprint
+
+logger = logging.getLogger(__name__)
+
+def _utc_timestamp() -> str:
+    """Время события в формате CURRENT_TIMESTAMP SQLite"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class TelemetryBuffer:
+    """
+    Write-behind буфер телеметрии.
+
+    Вызовы log_request, log_channel_visit, log_token_usage, cache_faq_answer,
+    record_faq_usage и save_relevance_verdict только кладут строку в очередь
+    в памяти и сразу возвращаются. Фоновый поток сбрасывает очередь одной
+    транзакцией через executemany, когда набирается TELEMETRY_BATCH_SIZE
+    строк или проходит TELEMETRY_FLUSH_INTERVAL_MS.
+    При аварийном завершении теряется не больше одного такого окна.
+    """
+
+    def __init__(self, db_manager: DatabaseManager,
+                 batch_size: int = TELEMETRY_BATCH_SIZE,
+                 flush_interval_ms: int = TELEMETRY_FLUSH_INTERVAL_MS,
+                 max_buffer: int = TELEMETRY_MAX_BUFFER):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffer = max_buffer
+
+        self._queue: Deque[Tuple[str, tuple]] = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self.dropped_rows = 0
+
+        self._thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _put(self, kind: str, row: tuple):
+        """Добавление строки в очередь"""
+        with self._condition:
+            if len(self._queue) >= self.max_buffer:
+                # БД недоступна слишком долго - жертвуем самыми старыми строками
+                self._queue.popleft()
+                self.dropped_rows += 1
+            self._queue.append((kind, row))
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def log_request(self, user_id: int, question: str, answer: str, is_relevant: bool,
+                    question_type: str = None, response_time: float = None):
+        """Логирование запроса и ответа"""
+        self._put('request', (user_id, question, answer, is_relevant, question_type,
+                              response_time, question_fingerprint(question), _utc_timestamp()))
+
+    def log_token_usage(self, user_id: int, api_key: str, question_type: str,
+                        prompt_tokens: int, completion_tokens: int, latency: float, model: str = ''):
+        """Логирование расхода токенов одного вызова API"""
+        self._put('token_usage', (api_key, question_type or '', user_id or 0, prompt_tokens, completion_tokens,
+                                  int(latency * 1000), model, _utc_timestamp()))
+
+    def log_channel_visit(self, user_id: int):
+        """Логирование перехода в канал"""
+        self._put('channel_visit', (user_id, _utc_timestamp()))
+
+    def cache_faq_answer(self, question_hash: str, question: str, answer: str):
+        """Сохранение ответа в faq_cache"""
+        self._put('faq_answer', (question_hash, question, answer, question_fingerprint(question),
+                                 question_hash, _utc_timestamp()))
+
+    def record_faq_usage(self, usage: Dict[str, Tuple[int, str]]):
+        """Обращения к ответам faq_cache: {question_hash: (обращений, время последнего)}"""
+        for question_hash, (count, last_used) in usage.items():
+            self._put('faq_usage', (count, last_used, question_hash))
+
+    def save_relevance_verdict(self, question_key: str, is_relevant: bool):
+        """Сохранение вердикта релевантности"""
+        self._put('relevance_verdict', (question_key, is_relevant, _utc_timestamp()))
+
+    def _run(self):
+        """Цикл фонового сброса очереди"""
+        while True:
+            with self._condition:
+                if not self._stopped and len(self._queue) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self):
+        """Запись накопленных строк одной транзакцией"""
+        with self._flush_lock:
+            with self._condition:
+                batch = list(self._queue)
+                self._queue.clear()
+            if not batch:
+                return
+
+            requests_rows = []
+            visit_rows = []
+            usage_rows = []
+            faq_rows = []
+            faq_usage_rows = []
+            verdict_rows = []
+            for kind, row in batch:
+                if kind == 'request':
+                    requests_rows.append(row)
+                elif kind == 'channel_visit':
+                    visit_rows.append(row)
+                elif kind == 'token_usage':
+                    usage_rows.append(row)
+                elif kind == 'faq_answer':
+                    faq_rows.append(row)
+                elif kind == 'faq_usage':
+                    faq_usage_rows.append(row)
+                elif kind == 'relevance_verdict':
+                    verdict_rows.append(row)
+
+            # Счетчик total_requests обновляется одним UPDATE на пользователя
+            request_totals = Counter(row[0] for row in requests_rows)
+            request_last_activity = {row[0]: row[7] for row in requests_rows}
+
+            start = time.perf_counter()
+            try:
+                with self.db_manager.connection() as conn:
+                    cursor = conn.cursor()
+                    if requests_rows:
+                        cursor.executemany('''
+                            INSERT INTO requests (user_id, question, answer, is_relevant, question_type, response_time,
+                                                  fingerprint, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', requests_rows)
+                        cursor.executemany('''
+                            UPDATE users SET total_requests = total_requests + ?, last_activity = ?
+                            WHERE user_id = ?
+                        ''', [(count, request_last_activity[user_id], user_id)
+                              for user_id, count in request_totals.items()])
+                    if visit_rows:
+                        cursor.executemany('''
+                            INSERT INTO channel_visits (user_id, visited_at) VALUES (?, ?)
+                        ''', visit_rows)
+                    if usage_rows:
+                        cursor.executemany('''
+                            INSERT INTO token_usage (api_key, question_type, user_id, prompt_tokens,
+                                                     completion_tokens, latency_ms, model, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', usage_rows)
+                    if faq_rows:
+                        cursor.executemany('''
+                            INSERT OR REPLACE INTO faq_cache (question_hash, question, answer, fingerprint,
+                                                              usage_count, last_used)
+                            VALUES (?, ?, ?, ?, COALESCE((SELECT usage_count FROM faq_cache WHERE question_hash = ?), 0) + 1, ?)
+                        ''', faq_rows)
+                    if faq_usage_rows:
+                        cursor.executemany('''
+                            UPDATE faq_cache SET usage_count = usage_count + ?, last_used = ?
+                            WHERE question_hash = ?
+                        ''', faq_usage_rows)
+                    if verdict_rows:
+                        cursor.executemany('''
+                            INSERT OR REPLACE INTO relevance_cache (question_key, is_relevant, checked_at)
+                            VALUES (?, ?, ?)
+                        ''', verdict_rows)
+            except Exception as e:
+                logger.error(f"Ошибка записи телеметрии ({len(batch)} строк), повтор при следующем сбросе: {e}")
+                with self._condition:
+                    # Возвращаем строки в начало очереди с учетом ограничения размера
+                    self._queue.extendleft(reversed(batch))
+                    while len(self._queue) > self.max_buffer:
+                        self._queue.popleft()
+                        self.dropped_rows += 1
+                return
+
+            logger.debug(f"Телеметрия: записано {len(batch)} строк за {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    def close(self):
+        """Остановка фонового потока с финальным сбросом буфера"""
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+        if self.dropped_rows:
+            logger.warning(f"Телеметрия: потеряно {self.dropped_rows} строк из-за переполнения буфера")
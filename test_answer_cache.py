@@ -0,0 +1,131 @@
+"""
+Скрипт для тестирования кэша ответов
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from answer_cache import AnswerCache
+from config import CACHE_USAGE_FLUSH_SIZE
+from fixtures import mock_ai_service, temp_database
+from telemetry import TelemetryBuffer
+from text_normalizer import question_key
+
+def usage_counts(db):
+    """usage_count ответов faq_cache"""
+    with db.connection() as conn:
+        return dict(conn.execute('SELECT question_hash, usage_count FROM faq_cache').fetchall())
+
+def test_lru_and_ttl():
+    """Тест вытеснения давно не использованных записей и истечения TTL"""
+    print("🧪 Тестирование LRU и TTL кэша ответов...")
+
+    with temp_database() as db:
+        cache = AnswerCache(db, max_size=2, ttl=60)
+        cache.put('h1', 'вопрос 1', 'ответ 1')
+        cache.put('h2', 'вопрос 2', 'ответ 2')
+        assert cache.get('h1') == 'ответ 1'  # h1 становится самым свежим
+        cache.put('h3', 'вопрос 3', 'ответ 3')
+        assert list(cache._entries) == ['h1', 'h3'] and cache.get_stats()['evictions'] == 1
+
+        # Вытесненная из памяти запись находится в faq_cache
+        assert cache.get('h2') == 'ответ 2'
+        assert cache.get('нет такого') is None
+        stats = cache.get_stats()
+        assert (stats['hits'], stats['db_hits'], stats['misses']) == (1, 1, 1)
+
+        # Устаревшая запись удаляется из памяти и перечитывается из БД
+        cache._entries['h2'] = ('ответ 2', 0.0)
+        assert cache.get('h2') == 'ответ 2'
+        assert cache.get_stats()['expirations'] == 1 and cache.get_stats()['db_hits'] == 2
+
+    print("✅ Вытесняются давние записи, устаревшие перечитываются из faq_cache")
+
+def test_usage_flush():
+    """Тест пакетной записи usage_count: по числу обращений и при остановке"""
+    print("🧪 Тестирование пакетной записи обращений...")
+
+    with temp_database() as db:
+        cache = AnswerCache(db, max_size=10, ttl=60)
+        cache.put('h1', 'вопрос', 'ответ')
+        assert usage_counts(db) == {'h1': 1}
+
+        for _ in range(5):
+            cache.get('h1')
+        assert usage_counts(db) == {'h1': 1}  # обращения еще в памяти
+        cache.flush_usage()
+        assert usage_counts(db) == {'h1': 6}
+
+        # Сброс сам срабатывает после CACHE_USAGE_FLUSH_SIZE обращений
+        for _ in range(CACHE_USAGE_FLUSH_SIZE):
+            cache.get('h1')
+        assert usage_counts(db) == {'h1': 6 + CACHE_USAGE_FLUSH_SIZE}
+
+    print("✅ Счетчики обращений пишутся пакетом")
+
+def test_preload_and_write_behind():
+    """Тест прогрева из faq_cache, отложенной записи и чтения без блокировки"""
+    print("🧪 Тестирование прогрева и отложенной записи кэша ответов...")
+
+    with temp_database() as db:
+        for number, uses in ((1, 5), (2, 1), (3, 3)):
+            db.cache_faq_answer(f'h{number}', f'вопрос {number}', f'ответ {number}')
+            db.record_faq_usage({f'h{number}': (uses - 1, '2026-01-01 00:00:00')})
+
+        cache = AnswerCache(db, max_size=2)
+        assert cache.preload() == 2
+        assert list(cache._entries) == ['h3', 'h1']  # самый популярный - самый свежий в LRU
+
+        telemetry = TelemetryBuffer(db, batch_size=1000, flush_interval_ms=60000)
+        cache = AnswerCache(db, max_size=10, writer=telemetry)
+        cache.put('h4', 'вопрос 4', 'ответ 4')
+        assert cache.get('h4') == 'ответ 4'
+        assert db.get_cached_faq('h4') is None  # запись ждет сброса буфера
+
+        cache.flush_usage()
+        telemetry.close()
+        assert usage_counts(db)['h4'] == 2
+
+        cache.clear()
+        assert asyncio.run(cache.get_async('h4')) == 'ответ 4'
+        assert cache.get_stats()['db_hits'] == 1
+
+    print("✅ Кэш прогревается популярными ответами, запись идет через буфер")
+
+def test_faq_phrase_not_cached():
+    """Тест ответа по фразе FAQ: приветствие не закрепляется за всем вопросом"""
+    print("🧪 Тестирование ответов по фразам FAQ...")
+
+    with mock_ai_service() as (db, ai_service):
+        greeting = ai_service._check_faq_cache('Здравствуйте, как участвовать в торгах?')
+        assert greeting.startswith('Здравствуйте!')
+        assert ai_service.answer_cache.get(question_key('Как участвовать в торгах?')) is None
+        assert ai_service.answer_cache.get(question_key('Здравствуйте, как участвовать в торгах?')) is None
+        assert usage_counts(db) == {}
+
+    print("✅ Ответ на приветствие не кэшируется под ключом вопроса")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование кэша ответов")
+    print("=" * 50)
+
+    try:
+        test_lru_and_ttl()
+        test_usage_flush()
+        test_preload_and_write_behind()
+        test_faq_phrase_not_cached()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
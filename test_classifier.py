@@ -0,0 +1,71 @@
+"""
+Скрипт для тестирования локального классификатора вопросов
+"""
+
+import os
+import sys
+import tempfile
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_classifier import NaiveBayesClassifier, QuestionClassifier
+
+RELEVANT = [
+    "Как участвовать в торгах по банкротству?",
+    "Что такое задаток на аукционе?",
+    "Какие документы нужны для участия в торгах?",
+    "Как подать заявку на аукцион?",
+    "Можно ли вернуть задаток после торгов?",
+    "Как проходит публичное предложение?",
+]
+IRRELEVANT = [
+    "Какая погода завтра?",
+    "Посоветуй рецепт борща",
+    "Кто выиграл матч вчера?",
+    "Какой фильм посмотреть вечером?",
+    "Погода в Москве на выходные",
+    "Рецепт блинов на молоке",
+]
+
+def test_naive_bayes():
+    """Тест обучения, предсказания и сохранения модели"""
+    print("🧪 Тестирование наивного Байеса...")
+
+    texts = RELEVANT + IRRELEVANT
+    labels = ['relevant'] * len(RELEVANT) + ['irrelevant'] * len(IRRELEVANT)
+    model = NaiveBayesClassifier.fit(texts, labels, min_count=1)
+
+    label, confidence = model.predict("Как вернуть задаток на торгах?")
+    assert label == 'relevant' and 0.5 < confidence <= 1
+    assert model.predict("Какая погода в выходные?")[0] == 'irrelevant'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'model.json')
+        QuestionClassifier(relevance=model, metadata={'samples': len(texts)}).save(path)
+        restored = QuestionClassifier.load(path)
+        assert restored.metadata['samples'] == len(texts)
+        assert restored.predict_relevance("Как вернуть задаток на торгах?")[0] is True
+        assert restored.predict_question_type("Как вернуть задаток?") is None
+
+    assert QuestionClassifier.load('/nonexistent/model.json') is None
+
+    print("✅ Модель обучается, сохраняется и восстанавливается")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование локального классификатора")
+    print("=" * 50)
+
+    try:
+        test_naive_bayes()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
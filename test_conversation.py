@@ -0,0 +1,135 @@
+"""
+Скрипт для тестирования истории диалога и уточняющих вопросов
+"""
+
+import asyncio
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import completion, mock_ai_service
+from conversation_store import ConversationStore, is_follow_up
+from token_budget import estimate_tokens
+
+def test_conversation_store():
+    """Тест истории диалога: предел токенов, сжатие старых реплик, забывание"""
+    print("🧪 Тестирование истории диалога...")
+
+    assert is_follow_up('а какие документы для этого?')
+    assert not is_follow_up('Что такое залог?')
+    assert not is_follow_up('Какие документы нужны для участия в торгах по банкротству?')
+
+    long_answer = 'Задаток возвращается после торгов. ' + 'Подробности процедуры. ' * 40
+    store = ConversationStore(max_turns=3, max_tokens=60, idle_ttl=60, max_users=2)
+    store.add(1, 'Первый вопрос?', 'Первый ответ.')
+    store.add(1, 'Как вернуть задаток?', long_answer)
+    history = store.history(1)
+    # Длинный ответ сжат до первого предложения, старая реплика поместилась целиком
+    assert [message['content'] for message in history] == [
+        'Первый вопрос?', 'Первый ответ.', 'Как вернуть задаток?', 'Задаток возвращается после торгов.'
+    ]
+    assert store.get_stats()['summarized'] == 1
+
+    for number in range(5):
+        store.add(1, f'Вопрос {number}?', 'Ответ на вопрос без точки ' * 20)
+    history = store.history(1)
+    assert sum(estimate_tokens(message['content']) for message in history) <= 60
+    assert len(history) < 6 and store.get_stats()['dropped'] == 1
+    assert store.get_stats()['turns'] == 3
+
+    store.add(2, 'Вопрос?', 'Ответ.')
+    store.add(3, 'Вопрос?', 'Ответ.')
+    assert store.history(1) == []  # вытеснен самый давний диалог
+    store.idle_ttl = 0
+    assert store.history(3) == []  # неактивный диалог забыт
+
+    print("✅ История ограничена, старые реплики сжимаются")
+
+def test_follow_up_question():
+    """Тест уточняющего вопроса: история уходит в промпт, релевантность проверяется, ответ не кэшируется"""
+    print("🧪 Тестирование уточняющих вопросов...")
+
+    sent_messages = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        messages = json.loads(request.content)['messages']
+        if 'борщ' in messages[-1]['content']:
+            return completion('НЕТ')  # проверка релевантности
+        sent_messages.append(messages)
+        return completion(f'Ответ {len(sent_messages)}.')
+
+    with mock_ai_service(handler) as (db, ai_service):
+
+        async def run():
+            first = await ai_service.generate_answer_async('Как участвовать в торгах по банкротству?', 1)
+            follow_up = await ai_service.generate_answer_async('а какие документы для этого?', 1)
+            other_user = await ai_service.generate_answer_async('а какие документы для этого?', 2)
+            off_topic = await ai_service.generate_answer_async('а как приготовить борщ?', 1)
+            await ai_service.aclose()
+            return first, follow_up, other_user, off_topic
+
+        first, follow_up, other_user, off_topic = asyncio.run(run())
+        assert first['answer'] == 'Ответ 1.' and follow_up['answer'] == 'Ответ 2.'
+        assert [message['content'] for message in sent_messages[1][1:]] == [
+            'Как участвовать в торгах по банкротству?', 'Ответ 1.', 'а какие документы для этого?'
+        ]
+        # Без диалога тот же вопрос - обычный, ответ уточнения другому пользователю не отдается
+        assert other_user['answer'] == 'Ответ 3.' and len(sent_messages[2]) == 2
+        # Уточнение не по теме отклоняется проверкой релевантности
+        assert not off_topic['is_relevant'] and len(sent_messages) == 3
+
+    print("✅ Уточнение отвечено с учетом диалога")
+
+def test_follow_up_question_sync():
+    """Тест синхронного пути: уточнение не по теме тоже проверяется на релевантность"""
+    print("🧪 Тестирование уточняющих вопросов (синхронно)...")
+
+    sent_messages = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        messages = json.loads(request.content)['messages']
+        if 'борщ' in messages[-1]['content']:
+            return completion('НЕТ')  # проверка релевантности
+        sent_messages.append(messages)
+        return completion(f'Ответ {len(sent_messages)}.')
+
+    def post(url, headers=None, json=None, timeout=None):
+        # Синхронный путь ходит в API через requests; httpx.Response с ним совместим
+        return handler(httpx.Request('POST', url, headers=headers, json=json))
+
+    with mock_ai_service(handler) as (db, ai_service), patch('ai_service.requests.post', post):
+        first = ai_service.generate_answer('Как участвовать в торгах по банкротству?', 1)
+        follow_up = ai_service.generate_answer('а какие документы для этого?', 1)
+        off_topic = ai_service.generate_answer('а как приготовить борщ?', 1)
+
+        assert first['answer'] == 'Ответ 1.' and follow_up['answer'] == 'Ответ 2.'
+        assert len(sent_messages[1]) == 4  # системный промпт, реплики диалога и уточнение
+        assert not off_topic['is_relevant'] and len(sent_messages) == 2
+
+    print("✅ Уточнение не по теме отклонено и в синхронном пути")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование истории диалога")
+    print("=" * 50)
+
+    try:
+        test_conversation_store()
+        test_follow_up_question()
+        test_follow_up_question_sync()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
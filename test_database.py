@@ -0,0 +1,205 @@
+"""
+Скрипт для тестирования модуля базы данных
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import DatabaseManager, SCHEMA_VERSION
+from async_database import AsyncDatabaseManager
+from telemetry import TelemetryBuffer
+
+def make_db(tmp_dir: str) -> DatabaseManager:
+    """Создание базы данных во временной директории"""
+    return DatabaseManager(os.path.join(tmp_dir, 'test.db'))
+
+def test_persistent_connection():
+    """Тест переиспользования соединения и настроек WAL"""
+    print("🧪 Тестирование менеджера соединений...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = make_db(tmp_dir)
+
+        with db.connection() as first, db.connection() as second:
+            assert first is second
+            assert first.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert first.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+
+        db.add_user(1, 'user', 'Имя', 'Фамилия')
+        db.log_request(1, 'вопрос', 'ответ', True, 'general', 0.1)
+        stats = db.get_statistics()
+        assert stats['total_requests'] == 1
+        assert stats['unique_users'] == 1
+
+        db.close()
+
+    print("✅ Соединение переиспользуется, WAL включен")
+
+def test_schema_migrations():
+    """Тест миграций схемы и индексов"""
+    print("🧪 Тестирование миграций схемы...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = make_db(tmp_dir)
+        with db.connection() as conn:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            assert 'idx_requests_created_at' in indexes
+            assert 'idx_auto_messages_pending' in indexes
+            plan = conn.execute('''
+                EXPLAIN QUERY PLAN SELECT COUNT(*) FROM auto_messages
+                WHERE user_id = ? AND message_type = ? AND sent = FALSE
+            ''', (1, '1hour')).fetchall()
+            assert 'idx_auto_messages_user' in str(plan)
+        db.close()
+
+        # Повторное открытие не применяет миграции заново
+        db = make_db(tmp_dir)
+        with db.connection() as conn:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        db.close()
+
+    print("✅ Схема актуальна, индексы созданы")
+
+def test_statistics_rollup():
+    """Тест дневных агрегатов: статистика совпадает с расчетом по сырым данным"""
+    print("🧪 Тестирование дневных агрегатов статистики...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = make_db(tmp_dir)
+        with db.connection() as conn:
+            for day in range(10):
+                for i in range(5):
+                    conn.execute('''
+                        INSERT INTO requests (user_id, question, answer, is_relevant, question_type, response_time, created_at)
+                        VALUES (?, ?, 'ответ', ?, ?, 1.0, datetime('now', ?))
+                    ''', (1 + i % 3, f'вопрос {i % 2}', i % 2, 'legal' if i % 2 else 'general', f'-{day} days'))
+                conn.execute('''
+                    INSERT INTO channel_visits (user_id, visited_at) VALUES (1, datetime('now', ?))
+                ''', (f'-{day} days',))
+
+        raw_stats = db.get_statistics(7)
+        assert db.rollup_statistics() == 9
+        assert db.rollup_statistics() == 0  # повторный запуск ничего не пересчитывает
+        rolled_stats = db.get_statistics(7)
+
+        assert rolled_stats == raw_stats
+        assert rolled_stats['unique_users'] == 3
+        assert rolled_stats['question_types']['legal']['requests'] == rolled_stats['relevant_requests']
+        db.close()
+
+    print("✅ Агрегаты совпадают с расчетом по сырым данным")
+
+def test_token_usage():
+    """Тест учета токенов: группировки и совпадение агрегатов с сырыми данными"""
+    print("🧪 Тестирование учета расхода токенов...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = make_db(tmp_dir)
+        with db.connection() as conn:
+            for day in range(5):
+                conn.execute('''
+                    INSERT INTO token_usage (api_key, question_type, user_id, prompt_tokens, completion_tokens,
+                                             latency_ms, created_at)
+                    VALUES ('key1...', 'legal', 1, 900, 300, 2000, datetime('now', ?))
+                ''', (f'-{day} days',))
+        db.log_token_usage(2, 'key2...', 'relevance', 150, 2, 0.4)
+        telemetry = TelemetryBuffer(db, flush_interval_ms=10)
+        telemetry.log_token_usage(2, 'key2...', 'relevance', 150, 2, 0.6)
+        telemetry.close()
+
+        raw_usage = db.get_token_usage(7)
+        assert db.rollup_statistics() == 4
+        assert db.get_token_usage(7) == raw_usage
+
+        legal, relevance = raw_usage
+        assert legal['question_type'] == 'legal' and legal['total_tokens'] == 5 * 1200
+        assert relevance['calls'] == 2 and relevance['avg_tokens'] == 152
+        assert abs(relevance['avg_latency'] - 0.5) < 1e-9
+        assert [row['user_id'] for row in db.get_token_usage(7, 'user_id')] == [1, 2]
+        try:
+            db.get_token_usage(7, 'question')
+            assert False, "неизвестная группировка должна отклоняться"
+        except ValueError:
+            pass
+        db.close()
+
+    print("✅ Расход токенов группируется и агрегируется по дням")
+
+def test_async_facade():
+    """Тест асинхронного фасада: записи в потоке записи, чтения в пуле"""
+    print("🧪 Тестирование асинхронного фасада БД...")
+
+    async def scenario(db: AsyncDatabaseManager):
+        await db.add_user(7, 'user', 'Имя', None)
+        await asyncio.gather(*(
+            db.log_request(7, f'вопрос {i}', 'ответ', True, 'general', 0.1)
+            for i in range(20)
+        ))
+        await db.schedule_auto_message(7, '1hour', 1)
+        assert await db.has_auto_message_scheduled(7, '1hour')
+        stats = await db.get_statistics()
+        assert stats['total_requests'] == 20
+        top_users = await db.get_top_users(1)
+        assert top_users[0][0] == 7 and top_users[0][3] == 20
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = AsyncDatabaseManager(make_db(tmp_dir))
+        asyncio.run(scenario(db))
+        db.close()
+
+    print("✅ Асинхронные операции выполнены")
+
+def test_telemetry_buffer():
+    """Тест буферизованной записи телеметрии"""
+    print("🧪 Тестирование буфера телеметрии...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = make_db(tmp_dir)
+        db.add_user(5, 'user', 'Имя', None)
+        telemetry = TelemetryBuffer(db, batch_size=1000, flush_interval_ms=60000)
+
+        for i in range(30):
+            telemetry.log_request(5, f'вопрос {i}', 'ответ', i % 2 == 0, 'general', 0.2)
+        telemetry.log_channel_visit(5)
+
+        # До сброса в БД ничего не попадает
+        assert db.get_statistics()['total_requests'] == 0
+
+        telemetry.close()
+        stats = db.get_statistics()
+        assert stats['total_requests'] == 30
+        assert stats['relevant_requests'] == 15
+        assert stats['channel_visits'] == 1
+        assert db.get_top_users(1)[0][3] == 30
+        db.close()
+
+    print("✅ Телеметрия сброшена одной транзакцией при остановке")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование базы данных")
+    print("=" * 50)
+
+    try:
+        test_persistent_connection()
+        test_schema_migrations()
+        test_statistics_rollup()
+        test_token_usage()
+        test_async_facade()
+        test_telemetry_buffer()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,62 @@
+"""
+Скрипт для тестирования индекса FAQ
+"""
+
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from faq_index import FaqIndex
+
+def test_faq_index():
+    """Тест индекса FAQ: ранжирование, порог, замена, вытеснение и закрепление"""
+    print("🧪 Тестирование индекса FAQ...")
+
+    index = FaqIndex(max_size=3, min_score=0.6)
+    index.add('1', 'Что такое акт ответственного хранения', 'Акт - это...')
+    index.add('2', 'Как вернуть задаток после торгов', 'Задаток возвращается...')
+    index.add('3', 'Как купить квартиру на торгах', 'Квартиру покупают...')
+
+    assert index.best('акт хранения - что это?') == 'Акт - это...'
+    assert index.best('Задаток вернуть как') == 'Задаток возвращается...'
+    # Совпадение одного слова не дает ответа
+    assert index.best('Как получить кредит после торгов') is None
+    assert index.best('Какая погода завтра?') is None
+
+    index.add('2', 'Как вернуть задаток после торгов', 'Новый ответ')
+    assert index.best('как вернуть задаток') == 'Новый ответ'
+    # Вытесняется давно не выдававшийся документ, а не первый добавленный
+    index.add('4', 'Что такое публичное предложение', 'Публичное предложение - это...')
+    assert len(index) == 3
+    assert index.best('Как купить квартиру на торгах') is None
+    assert index.best('что такое акт ответственного хранения') == 'Акт - это...'
+
+    # Закрепленные документы не вытесняются
+    pinned = FaqIndex(max_size=3, min_score=0.6)
+    pinned.add('faq:акт', 'акт ответственного хранения', 'Акт - это...', pinned=True)
+    for number in range(5):
+        pinned.add(str(number), f'Вопрос номер {number} про торги лот{number}', f'Ответ {number}')
+    assert len(pinned) == 3 and pinned.pinned == 1
+    assert pinned.best('акт ответственного хранения') == 'Акт - это...'
+
+    print("✅ Индекс FAQ ранжирует вопросы и отсекает слабые совпадения")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование индекса FAQ")
+    print("=" * 50)
+
+    try:
+        test_faq_index()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
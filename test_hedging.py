@@ -0,0 +1,79 @@
+"""
+Скрипт для тестирования дублирования медленных запросов
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import completion, mock_ai_service
+from hedging import HedgePolicy
+
+def test_hedged_request():
+    """Тест дублирования: медленный ключ не задерживает ответ, его запрос отменяется"""
+    print("🧪 Тестирование дублирования медленных запросов...")
+
+    cancelled = []
+
+    def make_handler(api_key: str, delay: float):
+        async def handler(request: httpx.Request) -> httpx.Response:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(api_key)
+                raise
+            return completion(f'Ответ {api_key}', {'prompt_tokens': 12, 'completion_tokens': 3})
+        return handler
+
+    handlers = {'slow-key': make_handler('slow-key', 5), 'fast-key': make_handler('fast-key', 0)}
+    with mock_ai_service(handlers, api_keys=['slow-key', 'fast-key']) as (db, ai_service):
+        # Первым выбирается медленный ключ
+        ai_service.key_pool._keys['fast-key'].latency_ewma = 100.0
+        ai_service.hedging = HedgePolicy(enabled=True, max_ratio=0.5, min_delay=0.05, min_samples=5)
+        for _ in range(5):
+            ai_service.hedging.record('general', 0.01)
+
+        async def run():
+            started = time.time()
+            content = await ai_service._make_request_async([{'role': 'user', 'content': 'Вопрос'}], kind='general')
+            elapsed = time.time() - started
+            await asyncio.sleep(0)
+            await ai_service.aclose()
+            return content, elapsed
+
+        content, elapsed = asyncio.run(run())
+        assert content == 'Ответ fast-key' and elapsed < 1
+        assert cancelled == ['slow-key']
+        stats = ai_service.get_hedge_stats()
+        assert stats['hedged'] == 1 and stats['hedge_wins'] == 1
+        # Без замеров задержки для вида запроса копия не отправляется
+        assert ai_service.hedging.delay('relevance') is None
+        # Токены учтены только у ответившего ключа
+        assert [(row['api_key'], row['total_tokens']) for row in db.get_token_usage(1, 'api_key')] == \
+            [('fast-k...', 15)]
+
+    print("✅ Копия на другом ключе отвечает первой, медленный запрос отменен")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование дублирования медленных запросов")
+    print("=" * 50)
+
+    try:
+        test_hedged_request()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,98 @@
+"""
+Скрипт для тестирования пула API ключей
+"""
+
+import os
+import sys
+import time
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_service import ApiKeyPool
+from config import KEY_CIRCUIT_FAILURES
+
+def test_key_cooldown():
+    """Тест паузы ключа после 429: ключ пропускается до конца Retry-After"""
+    print("🧪 Тестирование паузы ключа после 429...")
+
+    pool = ApiKeyPool(['key-1', 'key-2'])
+    pool._keys['key-2'].latency_ewma = 100.0  # первым выбирается key-1
+    assert pool.acquire() == 'key-1'
+    pool.report_failure('key-1', 0.1, 429, retry_after=30)
+    assert pool._keys['key-1'].state(time.time()) == 'cooldown'
+    assert pool.acquire() == 'key-2'
+    pool.release('key-2')
+
+    # Пауза истекла - ключ снова выбирается, счетчик ошибок не тронут
+    pool._keys['key-1'].cooldown_until = time.time() - 1
+    assert pool.acquire() == 'key-1'
+    stats = pool.get_stats()[0]
+    assert stats['throttled'] == 1 and stats['errors'] == 0
+
+    print("✅ Ключ отдыхает после 429 и возвращается после паузы")
+
+def test_key_circuit_breaker():
+    """Тест размыкания цепи: только 5xx и сбои соединения, 4xx запроса не в счет"""
+    print("🧪 Тестирование circuit breaker ключа...")
+
+    pool = ApiKeyPool(['key-1'])
+    for _ in range(KEY_CIRCUIT_FAILURES * 2):
+        assert pool.acquire() == 'key-1'
+        pool.report_failure('key-1', 0.1, 422)
+    assert pool.get_stats()[0]['state'] == 'ok' and pool.get_stats()[0]['rejected'] == KEY_CIRCUIT_FAILURES * 2
+
+    for status_code in [500] * (KEY_CIRCUIT_FAILURES - 1) + [None]:
+        assert pool.acquire() == 'key-1'
+        pool.report_failure('key-1', 0.1, status_code)  # None - таймаут или обрыв соединения
+    assert pool.get_stats()[0]['state'] == 'open'
+    assert pool.acquire() is None
+
+    print("✅ Цепь размыкается после ошибок ключа, но не после ошибок запроса")
+
+def test_key_half_open():
+    """Тест восстановления: после паузы цепи пропускается один пробный запрос"""
+    print("🧪 Тестирование пробного запроса после размыкания цепи...")
+
+    pool = ApiKeyPool(['key-1'])
+    for _ in range(KEY_CIRCUIT_FAILURES):
+        pool.acquire()
+        pool.report_failure('key-1', 0.1, 503)
+    health = pool._keys['key-1']
+
+    # Неудачный пробный запрос снова размыкает цепь
+    health.circuit_open_until = time.time() - 1
+    assert health.state(time.time()) == 'half-open'
+    assert pool.acquire() == 'key-1'
+    assert pool.acquire() is None  # пока идет проба, ключ недоступен
+    pool.report_failure('key-1', 0.1, 502)
+    assert health.state(time.time()) == 'open'
+
+    # Удачный пробный запрос замыкает цепь
+    health.circuit_open_until = time.time() - 1
+    assert pool.acquire() == 'key-1'
+    pool.report_success('key-1', 0.2)
+    assert health.state(time.time()) == 'ok' and health.consecutive_failures == 0
+    assert pool.acquire() == 'key-1'
+
+    print("✅ Ключ возвращается после удачной пробы")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование пула API ключей")
+    print("=" * 50)
+
+    try:
+        test_key_cooldown()
+        test_key_circuit_breaker()
+        test_key_half_open()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,88 @@
+"""
+Скрипт для тестирования поиска ключевых слов
+"""
+
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from keyword_matcher import KEYWORD_MATCHER, KeywordMatcher
+from prompts import POLITE_PHRASES, TRADE_KEYWORDS, QUESTION_TYPE_KEYWORDS, SPECIALIST_KEYWORDS
+
+def legacy_match(categories, text: str):
+    """Прежняя схема: any(keyword in text) по каждой категории"""
+    text_lower = text.lower()
+    return frozenset(category for category, keywords in categories.items()
+                     if any(keyword.lower() in text_lower for keyword in keywords))
+
+def test_overlapping_keywords():
+    """Тест перекрывающихся и вложенных ключевых слов"""
+    print("🧪 Тестирование перекрывающихся ключевых слов...")
+
+    categories = {
+        'short': ['торг'],
+        'long': ['торги по банкротству'],
+        'tail': ['банкрот'],
+        'overlap': ['гибанк'],
+        'case': ['ФЗ-127', 'Задаток']
+    }
+    matcher = KeywordMatcher(categories)
+    texts = [
+        'Торги по банкротству',
+        'торгИ ПО БАНКРОТСТВУ физлиц',
+        'торгибанкрот',  # "торги" и "гибанк" перекрываются
+        'банкротство без торгов',
+        'Статья ФЗ-127 и ЗАДАТОК',
+        'фз-127',
+        ''
+    ]
+    for text in texts:
+        assert matcher.match(text) == legacy_match(categories, text), text
+
+    print("✅ Результат совпадает с any(keyword in text)")
+
+def test_keyword_matcher_categories():
+    """Тест рабочего набора категорий на типичных вопросах"""
+    print("🧪 Тестирование категорий ключевых слов...")
+
+    categories = {
+        'polite': POLITE_PHRASES,
+        'trade': TRADE_KEYWORDS,
+        'specialist': SPECIALIST_KEYWORDS,
+        **QUESTION_TYPE_KEYWORDS
+    }
+    texts = [
+        'Привет!',
+        'Какие ДОКУМЕНТЫ нужны для участия в ТОРГАХ по банкротству?',
+        'Что такое Залог и чем он отличается от Задатка?',
+        'Где посмотреть статью 110 ФЗ-127 о продаже имущества должника?',
+        'Стоит ли покупать квартиру с обременением?',
+        'Как стать финансовым управляющим?',
+        'Спасибо большое за помощь',
+        'Какая погода завтра в Москве?'
+    ]
+    for text in texts:
+        assert KEYWORD_MATCHER.match(text) == legacy_match(categories, text), text
+
+    print("✅ Категории совпадают с прежней проверкой")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование поиска ключевых слов")
+    print("=" * 50)
+
+    try:
+        test_overlapping_keywords()
+        test_keyword_matcher_categories()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,74 @@
+"""
+Скрипт для тестирования выбора модели
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import completion, mock_ai_service
+from model_router import ModelRouter
+
+def test_model_routing():
+    """Тест маршрутизации: короткие общие вопросы - быстрая модель, юридические - большая"""
+    print("🧪 Тестирование выбора модели...")
+
+    tiers = {
+        'fast': {'model': 'small-model', 'max_tokens': 300, 'temperature': 0.5},
+        'default': {'model': 'default-model', 'max_tokens': 1000, 'temperature': 0.7},
+        'large': {'model': 'large-model', 'max_tokens': 1000, 'temperature': 0.3},
+    }
+    router = ModelRouter(enabled=True, tiers=tiers, large_types=['legal'], fast_max_question_tokens=8,
+                         min_confidence=0.8)
+    assert router.route('general', 0.0, 5, 800) == ('fast', 'small-model', 300, 0.5)
+    assert router.route('legal', 1.0, 20, 800).tier == 'large'
+    assert router.route('legal', 0.5, 20, 800).tier == 'default'  # тип не уверен
+    assert router.route('general', 0.0, 20, 800).max_tokens == 800
+    # После обрезанных ответов тип уходит с уровня, чей потолок ниже нижней границы
+    assert router.route('general', 0.0, 5, 800, min_tokens=600) == ('default', 'default-model', 800, 0.7)
+    assert router.route('general', 0.0, 5, 200, min_tokens=250).max_tokens == 250
+    assert ModelRouter(enabled=False, tiers=tiers).route('general', 0.0, 5, 800).tier == 'default'
+
+    payloads = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payloads.append(json.loads(request.content))
+        return completion('Ответ.', {'prompt_tokens': 100, 'completion_tokens': 20})
+
+    with mock_ai_service(handler) as (db, ai_service):
+        ai_service.router = router
+
+        async def run():
+            await ai_service.generate_answer_async('Какая статья закона о банкротстве про торги?', 1)
+            await ai_service.aclose()
+
+        asyncio.run(run())
+        assert (payloads[-1]['model'], payloads[-1]['temperature']) == ('large-model', 0.3)
+        assert router.get_stats()['tiers']['large']['responses'] == 1
+        assert [row['model'] for row in db.get_token_usage(1, 'model')] == ['large-model']
+
+    print("✅ Модель выбирается по типу вопроса, решения учитываются")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование выбора модели")
+    print("=" * 50)
+
+    try:
+        test_model_routing()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,78 @@
+"""
+Скрипт для тестирования прогрева кэша ответов
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import completion, mock_ai_service
+from prewarm_cache import CachePrewarmer
+from text_normalizer import question_key
+
+def test_cache_prewarm():
+    """Тест прогрева: популярные вопросы без ответа в кэше получают ответы в faq_cache"""
+    print("🧪 Тестирование прогрева кэша ответов...")
+
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(json.loads(request.content)['messages'][-1]['content'])
+        return completion('Готовый ответ.', {'prompt_tokens': 100, 'completion_tokens': 20})
+
+    with mock_ai_service(handler) as (db, ai_service):
+        for question in ('Как вернуть задаток?', 'как вернуть задаток', 'КАК ВЕРНУТЬ ЗАДАТОК!'):
+            db.log_request(1, question, 'Ответ', True, 'general', 1.0)
+        for question in ('Что такое торги?', 'что такое торги'):
+            db.log_request(2, question, 'Ответ', True, 'general', 1.0)
+        db.log_request(3, 'Какая погода?', 'Не по теме', False, 'irrelevant', 0.1)
+        db.log_request(3, 'Где найти лоты?', 'Ответ', True, 'general', 1.0)
+        db.cache_faq_answer(question_key('Где найти лоты?'), 'Где найти лоты?', 'Ответ из кэша')
+
+        # Нерелевантные и уже закэшированные вопросы не прогреваются
+        questions = [question for question, _ in db.get_prewarm_questions(7, 10)]
+        assert len(questions) == 2 and questions[0] in ('Как вернуть задаток?', 'как вернуть задаток', 'КАК ВЕРНУТЬ ЗАДАТОК!')
+
+        async def run(prewarmer):
+            started = time.time()
+            stats = await prewarmer.run(questions)
+            return stats, time.time() - started
+
+        # Бюджет не вмещает ни одного запроса - вопросы пропускаются
+        stats, _ = asyncio.run(run(CachePrewarmer(ai_service, token_budget=100)))
+        assert stats['skipped'] == 2 and not requested
+
+        # 600 запросов в минуту на ключ - не чаще раза в 0.1 секунды
+        stats, elapsed = asyncio.run(run(CachePrewarmer(ai_service, token_budget=100000, key_rpm=600, concurrency=2)))
+        asyncio.run(ai_service.aclose())
+        assert stats['answered'] == 2 and stats['failed'] == 0 and stats['spent_tokens'] > 0
+        assert sorted(requested) == sorted(questions) and elapsed >= 0.1
+        assert db.get_cached_faq(question_key('как вернуть, задаток?')) == 'Готовый ответ.'
+        assert db.get_prewarm_questions(7, 10) == []
+
+    print("✅ Ответы на популярные вопросы записаны в faq_cache в пределах бюджета")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование прогрева кэша ответов")
+    print("=" * 50)
+
+    try:
+        test_cache_prewarm()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
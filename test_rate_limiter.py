@@ -0,0 +1,58 @@
+"""
+Скрипт для тестирования лимитера запросов
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import temp_database
+from rate_limiter import RateLimiter
+
+def test_rate_limiter():
+    """Тест скользящего окна, снимка лимитов и общего режима"""
+    print("🧪 Тестирование лимитера запросов...")
+
+    limiter = RateLimiter(max_requests=3, window=60)
+    assert [limiter.try_acquire(1, now=600.0) for _ in range(4)] == [True, True, True, False]
+    # Середина следующего окна: половина прошлых запросов еще учитывается
+    assert [limiter.try_acquire(1, now=690.0) for _ in range(3)] == [True, True, False]
+    # Неактивные пользователи вытесняются
+    limiter.try_acquire(2, now=1000.0)
+    assert list(limiter._users) == [2]
+
+    with temp_database() as db:
+        limiter = RateLimiter(db, max_requests=2)
+        assert limiter.try_acquire(9) and limiter.try_acquire(9)
+        limiter.save_snapshot()
+        restored = RateLimiter(db, max_requests=2)
+        restored.load_snapshot()
+        assert not restored.try_acquire(9)
+
+        first = RateLimiter(db, max_requests=2, shared=True)
+        second = RateLimiter(db, max_requests=2, shared=True)
+        results = [asyncio.run(limiter.acquire(42)) for limiter in (first, second, first)]
+        assert results == [True, True, False]
+
+    print("✅ Лимиты соблюдаются в памяти, после перезапуска и между процессами")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование лимитера запросов")
+    print("=" * 50)
+
+    try:
+        test_rate_limiter()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,97 @@
+"""
+Скрипт для тестирования пакетной проверки релевантности
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from relevance_batcher import BatchRequestFailed, RelevanceBatcher, parse_batch_verdicts
+
+RELEVANT = [
+    "Как участвовать в торгах по банкротству?",
+    "Что такое задаток на аукционе?",
+]
+IRRELEVANT = [
+    "Какая погода завтра?",
+    "Посоветуй рецепт борща",
+]
+
+def test_relevance_batcher():
+    """Тест пакетной проверки релевантности и откатов при неудаче пакета"""
+    print("🧪 Тестирование пакетной проверки релевантности...")
+
+    assert parse_batch_verdicts("1. ДА\n2) нет\n3 - Да", 3) == [True, False, True]
+    assert parse_batch_verdicts("1. ДА\n3. НЕТ", 3) is None
+    assert parse_batch_verdicts("1. ДА\n1. НЕТ", 2) is None
+    assert parse_batch_verdicts("ДА", 1) is None
+
+    batches, singles, fallbacks = [], [], []
+    broken = {'value': None}
+
+    async def check_batch(questions):
+        batches.append(questions)
+        if broken['value'] == 'unparsed':
+            return None
+        if broken['value'] == 'down':
+            raise BatchRequestFailed()
+        return [question in RELEVANT for question in questions]
+
+    async def check_one(question):
+        singles.append(question)
+        return question in RELEVANT
+
+    def fallback(question):
+        fallbacks.append(question)
+        return True
+
+    async def run(questions):
+        batcher = RelevanceBatcher(check_batch, check_one, fallback, window=0.01, max_batch=3)
+        verdicts = await asyncio.gather(*(batcher.check(question) for question in questions))
+        return verdicts, batcher.get_stats()
+
+    questions = [RELEVANT[0], IRRELEVANT[0], RELEVANT[1], IRRELEVANT[1]]
+    verdicts, stats = asyncio.run(run(questions))
+    assert verdicts == [True, False, True, False]
+    # Пакет закрывается по размеру, остаток - по таймеру и идет одиночным запросом
+    assert batches == [questions[:3]] and singles == [questions[3]]
+    assert stats == {'batches': 1, 'batched_questions': 3, 'single': 1, 'fallbacks': 0, 'local_fallbacks': 0}
+
+    batches.clear()
+    singles.clear()
+    broken['value'] = 'unparsed'
+    verdicts, stats = asyncio.run(run(questions[:2]))
+    # Неразобранный ответ - каждый вопрос проверяется отдельным запросом
+    assert verdicts == [True, False]
+    assert singles == questions[:2] and not fallbacks and stats['fallbacks'] == 1
+
+    batches.clear()
+    singles.clear()
+    broken['value'] = 'down'
+    verdicts, stats = asyncio.run(run(questions[:2]))
+    # API недоступен - локальные вердикты без отдельных запросов к ИИ
+    assert verdicts == [True, True]
+    assert not singles and fallbacks == questions[:2] and stats['local_fallbacks'] == 1
+
+    print("✅ Вопросы проверяются пакетами, неразобранный пакет - по одному, без API - локально")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование пакетной проверки релевантности")
+    print("=" * 50)
+
+    try:
+        test_relevance_batcher()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
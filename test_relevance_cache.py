@@ -0,0 +1,83 @@
+"""
+Скрипт для тестирования кэша вердиктов релевантности
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import temp_database
+from relevance_cache import RelevanceCache
+from telemetry import TelemetryBuffer
+
+def test_relevance_cache():
+    """Тест кэша вердиктов релевантности"""
+    print("🧪 Тестирование кэша релевантности...")
+
+    with temp_database() as db:
+        cache = RelevanceCache(db, max_size=1)
+        assert cache.get('Какая погода завтра?') is None
+        cache.put('Какая погода завтра?', False)
+        cache.put('Что такое задаток?', True)
+        # Вариант написания дает тот же ключ
+        assert cache.get('какая  ПОГОДА завтра!!') is False
+        assert cache.get('Что такое задаток 🤔') is True
+        # Другой порядок слов или предлог - другой вопрос
+        assert cache.get('завтра какая погода') is None
+        assert cache.get('Что такое задаток без торгов?') is None
+
+        # Новый процесс находит вердикты в БД
+        restored = RelevanceCache(db)
+        assert restored.get('какая погода завтра') is False
+        assert restored.get_stats()['db_hits'] == 1
+
+        # Устаревшие вердикты не возвращаются и удаляются
+        with db.connection() as conn:
+            conn.execute("UPDATE relevance_cache SET checked_at = datetime('now', '-2 hours')")
+        expired = RelevanceCache(db, ttl=3600)
+        assert expired.get('что такое задаток') is None
+        assert expired.purge() == 2
+
+    print("✅ Вердикты переживают перезапуск, варианты написания попадают в кэш")
+
+def test_relevance_cache_write_behind():
+    """Тест отложенной записи вердиктов и чтения без блокировки event loop"""
+    print("🧪 Тестирование отложенной записи вердиктов...")
+
+    with temp_database() as db:
+        telemetry = TelemetryBuffer(db, batch_size=1000, flush_interval_ms=60000)
+        cache = RelevanceCache(db, writer=telemetry)
+        cache.put('Как вернуть задаток?', True)
+        assert cache.get('как вернуть задаток') is True
+        with db.connection() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM relevance_cache').fetchone()[0] == 0  # ждет сброса буфера
+        telemetry.close()
+
+        restored = RelevanceCache(db)
+        assert asyncio.run(restored.get_async('Как вернуть задаток?')) is True
+        assert asyncio.run(restored.get_async('Какая погода завтра?')) is None
+        assert restored.get_stats()['db_hits'] == 1 and restored.get_stats()['misses'] == 1
+
+    print("✅ Вердикты пишутся через буфер и читаются вне event loop")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование кэша релевантности")
+    print("=" * 50)
+
+    try:
+        test_relevance_cache()
+        test_relevance_cache_write_behind()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
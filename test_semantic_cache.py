@@ -0,0 +1,94 @@
+"""
+Скрипт для тестирования семантического кэша
+"""
+
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import temp_database
+from semantic_cache import SemanticCache
+
+def test_semantic_cache():
+    """Тест семантического кэша: похожие вопросы, вытеснение, загрузка из faq_cache"""
+    print("🧪 Тестирование семантического кэша...")
+
+    with temp_database() as db:
+        cache = SemanticCache(db, max_size=3)
+        cache.add('h1', 'Что такое задаток?', 'Задаток - это...')
+        cache.add('h2', 'Как купить квартиру на торгах?', 'Квартиру покупают...')
+        cache.add('h3', 'Как стать арбитражным управляющим?', 'Управляющим становятся...')
+        assert cache.get('что такое задаток на торгах') == 'Задаток - это...'
+        assert cache.get('Как купить квартиру с торгов') == 'Квартиру покупают...'
+        assert cache.get('Какая погода завтра?') is None
+        assert [question for _, question, _ in cache.search('купить квартиру', k=1)] == ['Как купить квартиру на торгах?']
+
+        # Вытесняется давно не использованная запись
+        cache.add('h4', 'Что такое публичное предложение?', 'Публичное предложение - это...')
+        assert cache.get_stats()['size'] == 3
+        assert cache.get('Как стать арбитражным управляющим') is None
+
+        db.cache_faq_answer('h1', 'Что такое задаток?', 'Задаток - это...')
+        restored = SemanticCache(db)
+        assert restored.preload() == 1
+        assert restored.get('что такое задаток???') == 'Задаток - это...'
+
+    print("✅ Похожие вопросы находят готовый ответ")
+
+def test_semantic_paraphrase():
+    """Тест перефразировок: другие слова с тем же смыслом и лишние уточнения"""
+    print("🧪 Тестирование перефразированных вопросов...")
+
+    with temp_database() as db:
+        cache = SemanticCache(db)
+        cache.add('h1', 'как участвовать в торгах', 'Для участия нужно...')
+        cache.add('h2', 'Как вернуть задаток после торгов', 'Задаток возвращается...')
+        cache.add('h3', 'Что такое публичное предложение?', 'Публичное предложение - это...')
+
+        assert cache.get('как принять участие в торгах по банкротству') == 'Для участия нужно...'
+        assert cache.get('Как участвовать в торгах по банкротству?') == 'Для участия нужно...'
+        assert cache.get('как вернуть задаток') == 'Задаток возвращается...'
+        assert cache.get('как внести задаток для торгов') is None
+
+    print("✅ Перефразированный вопрос находит готовый ответ")
+
+def test_semantic_near_miss():
+    """Тест близких по написанию, но разных по смыслу вопросов: ответ из кэша не выдается"""
+    print("🧪 Тестирование похожих вопросов с другим смыслом...")
+
+    with temp_database() as db:
+        cache = SemanticCache(db)
+        cache.add('h1', 'Как купить квартиру на торгах?', 'Квартиру покупают...')
+        cache.add('h2', 'Какие документы нужны для участия в торгах?', 'Нужны документы...')
+        cache.add('h3', 'Можно ли купить квартиру с залогом?', 'Можно...')
+
+        assert cache.get('Как продать квартиру на торгах?') is None
+        assert cache.get('Как купить дом на торгах?') is None
+        assert cache.get('Какие документы не нужны для участия в торгах?') is None
+        assert cache.get('Можно ли купить квартиру без залога?') is None
+        assert cache.get('какие документы нужны для участия в торгах') == 'Нужны документы...'
+        assert cache.get_stats()['hits'] == 1
+
+    print("✅ Вопросы с другим глаголом, предметом или отрицанием не получают чужой ответ")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование семантического кэша")
+    print("=" * 50)
+
+    try:
+        test_semantic_cache()
+        test_semantic_paraphrase()
+        test_semantic_near_miss()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
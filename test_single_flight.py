@@ -0,0 +1,68 @@
+"""
+Скрипт для тестирования объединения одинаковых вопросов
+"""
+
+import asyncio
+import os
+import sys
+from functools import partial
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import mock_ai_service, sse_body
+
+def test_single_flight():
+    """Тест объединения одинаковых вопросов: один запрос к ИИ, лог у каждого пользователя"""
+    print("🧪 Тестирование объединения одинаковых вопросов...")
+
+    requests_made = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests_made.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, text=sse_body(['Задаток ', 'возвращается.']))
+
+    with mock_ai_service(handler) as (db, ai_service):
+
+        deltas = {1: [], 2: []}
+
+        async def collect(user_id: int, text: str):
+            deltas[user_id].append(text)
+
+        async def run():
+            results = await asyncio.gather(
+                ai_service.generate_answer_async('Как вернуть задаток после торгов?', 1, on_delta=partial(collect, 1)),
+                ai_service.generate_answer_async('как вернуть задаток после торгов', 2, on_delta=partial(collect, 2))
+            )
+            await ai_service.aclose()
+            return results
+
+        results = asyncio.run(run())
+        assert len(requests_made) == 1
+        assert [result['answer'] for result in results] == ['Задаток возвращается.'] * 2
+        assert deltas[1][-1] == deltas[2][-1] == 'Задаток возвращается.'
+        assert ai_service.get_single_flight_stats() == {'calls': 1, 'shared': 1, 'in_flight': 0}
+        assert db.get_statistics()['total_requests'] == 2
+
+    print("✅ Одинаковые вопросы обслужены одним запросом")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование объединения одинаковых вопросов")
+    print("=" * 50)
+
+    try:
+        test_single_flight()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
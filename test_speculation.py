@@ -0,0 +1,78 @@
+"""
+Скрипт для тестирования спекулятивной генерации ответов
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import completion, mock_ai_service, sse_body
+
+def test_speculative_answer():
+    """Тест спекуляции: ответ генерируется параллельно с проверкой релевантности"""
+    print("🧪 Тестирование спекулятивной генерации ответа...")
+
+    verdicts = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        if not payload.get('stream'):
+            await asyncio.sleep(0.05)
+            content = payload['messages'][0]['content']
+            verdict = next(answer for question, answer in verdicts.items() if question in content)
+            return completion(verdict)
+        return httpx.Response(200, text=sse_body(['Погоду ', 'не знаю.']))
+
+    with mock_ai_service(handler) as (db, ai_service):
+        ai_service.speculation.enabled = True
+        ai_service.classifier = None
+        verdicts.update({'Какая погода завтра?': 'НЕТ', 'Что будет с погодой на выходных?': 'ДА'})
+
+        deltas = []
+
+        async def on_delta(text: str):
+            deltas.append(text)
+
+        async def run():
+            rejected = await ai_service.generate_answer_async('Какая погода завтра?', 1, on_delta=on_delta)
+            rejected_deltas = list(deltas)
+            accepted = await ai_service.generate_answer_async('Что будет с погодой на выходных?', 2, on_delta=on_delta)
+            await ai_service.aclose()
+            return rejected, rejected_deltas, accepted
+
+        rejected, rejected_deltas, accepted = asyncio.run(run())
+        assert not rejected['is_relevant']
+        assert rejected_deltas == []  # отброшенный ответ пользователю не показан
+        assert accepted['is_relevant'] and accepted['answer'] == 'Погоду не знаю.'
+        assert deltas[-1] == 'Погоду не знаю.'
+
+        stats = ai_service.get_speculation_stats()
+        assert stats['wins'] == 1 and stats['losses'] == 1
+        assert stats['wasted_tokens'] > 0
+        assert stats['budget_left'] == ai_service.speculation.budget - stats['wasted_tokens']
+
+    print("✅ Нерелевантный ответ отменен и учтен, релевантный показан")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование спекулятивной генерации ответов")
+    print("=" * 50)
+
+    try:
+        test_speculative_answer()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,129 @@
+"""
+Скрипт для тестирования потоковых ответов
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import mock_ai_service, sse_body
+from streaming_reply import StreamingReply
+from text_normalizer import question_key
+
+class FakeMessage:
+    """Сообщение Telegram, запоминающее правки"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.edits = []
+
+    async def edit_text(self, text: str):
+        self.text = text
+        self.edits.append(text)
+
+def test_stream_answer():
+    """Тест потоковой генерации: фрагменты приходят по порядку, ответ логируется целиком"""
+    print("🧪 Тестирование потоковой генерации...")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)['stream'] is True
+        return httpx.Response(200, text=sse_body(['Задаток ', 'возвращается ', 'проигравшим.']))
+
+    with mock_ai_service(handler) as (db, ai_service):
+
+        deltas = []
+
+        async def on_delta(text: str):
+            deltas.append(text)
+
+        async def run():
+            result = await ai_service.generate_answer_async('Как вернуть задаток после торгов?', 1, on_delta=on_delta)
+            await ai_service.aclose()
+            return result
+
+        result = asyncio.run(run())
+        assert deltas == ['Задаток ', 'Задаток возвращается ', 'Задаток возвращается проигравшим.']
+        assert result['answer'] == deltas[-1]
+        assert ai_service.get_key_stats()[0]['requests'] == 1
+
+    print("✅ Ответ приходит по частям")
+
+def test_stream_interrupted():
+    """Тест обрыва потока: неполный ответ помечается и не попадает в кэши"""
+    print("🧪 Тестирование обрыва потока...")
+
+    class BrokenStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield sse_body(['Задаток ']).split('data: [DONE]')[0].encode()
+            raise httpx.ReadError('соединение разорвано')
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=BrokenStream())
+
+    with mock_ai_service(handler) as (db, ai_service):
+
+        async def on_delta(text: str):
+            pass
+
+        async def run():
+            result = await ai_service.generate_answer_async('Как вернуть задаток после торгов?', 1, on_delta=on_delta)
+            await ai_service.aclose()
+            return result
+
+        result = asyncio.run(run())
+        assert result['question_type'] == 'truncated'
+        assert result['answer'].startswith('Задаток ') and 'прервался' in result['answer']
+        assert db.get_cached_faq(question_key('Как вернуть задаток после торгов?')) is None
+        assert ai_service.semantic_cache.get('Как вернуть задаток после торгов?') is None
+
+    print("✅ Оборванный ответ показан с предупреждением и не закэширован")
+
+def test_streaming_reply():
+    """Тест правок сообщения: первая сразу, дальше не чаще интервала, перенос длинного текста"""
+    print("🧪 Тестирование прогрессивного ответа...")
+
+    placeholder = FakeMessage("🤔 Думаю над ответом...")
+    sent = []
+
+    async def send(text: str):
+        message = FakeMessage(text)
+        sent.append(message)
+        return message
+
+    async def run():
+        reply = StreamingReply(placeholder, send, max_length=10, edit_interval=60)
+        await reply.update('Первый')
+        await reply.update('Первый фрагмент')  # слишком рано для правки
+        await reply.finish('Первый фрагмент ответа')
+
+    asyncio.run(run())
+    assert placeholder.edits == ['Первый', 'Первый фра']
+    assert [message.text for message in sent] == ['гмент отве', 'та']
+
+    print("✅ Правки ограничены по частоте, длинный ответ переносится")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование потоковых ответов")
+    print("=" * 50)
+
+    try:
+        test_stream_answer()
+        test_stream_interrupted()
+        test_streaming_reply()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,62 @@
+"""
+Скрипт для тестирования нормализации вопросов
+"""
+
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import temp_database
+from text_normalizer import question_fingerprint, question_key
+
+def test_question_fingerprint():
+    """Тест отпечатков вопросов: варианты написания совпадают, статистика группируется"""
+    print("🧪 Тестирование отпечатков вопросов...")
+
+    variants = ['Как вернуть задаток?', 'задаток как вернуть, подскажите 🙏', 'КАК ВЕРНУТЬ ЗАДАТОК!!!']
+    assert len({question_fingerprint(question) for question in variants}) == 1
+    assert question_fingerprint('Где купить квартиру?') != question_fingerprint('Как купить квартиру?')
+    assert question_fingerprint('Что такое торги?') == question_fingerprint('что такое торгов')
+
+    with temp_database() as db:
+        for question in variants:
+            db.log_request(1, question, 'ответ', True, 'general', 0.1)
+        db.log_request(1, 'Где купить квартиру?', 'ответ', True, 'property', 0.1)
+        popular = db.get_statistics()['popular_questions']
+        assert [count for _, count in popular] == [3, 1]
+
+    print("✅ Варианты одного вопроса дают один отпечаток")
+
+def test_question_key():
+    """Тест ключа точных совпадений: различаются отрицания, предлоги и порядок слов"""
+    print("🧪 Тестирование ключей вопросов...")
+
+    assert question_key('Как вернуть задаток?') == question_key('  КАК вернуть, задаток!!! ')
+    assert question_key('Ёлка на торгах') == question_key('елка на торгах')
+    assert question_key('можно ли купить квартиру с залогом') != question_key('можно ли купить квартиру без залога')
+    assert question_key('нужно ли платить задаток') != question_key('не нужно платить задаток?')
+    assert question_key('кредитор может оспорить сделку должника') != question_key('должник может оспорить сделку кредитора')
+    assert question_key('Здравствуйте, как участвовать в торгах?') != question_key('Как участвовать в торгах?')
+
+    print("✅ Вопросы с разным смыслом получают разные ключи")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование нормализации вопросов")
+    print("=" * 50)
+
+    try:
+        test_question_fingerprint()
+        test_question_key()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,59 @@
+"""
+Скрипт для тестирования бюджета токенов ответа
+"""
+
+import os
+import sys
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import mock_ai_service
+from token_budget import AnswerTokenBudget, estimate_tokens
+
+def test_answer_token_budget():
+    """Тест бюджета токенов: оценка длины, лимит по истории ответов, рост после обрезки"""
+    print("🧪 Тестирование бюджета токенов ответа...")
+
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('Что такое залог?') < estimate_tokens('Как вернуть задаток после торгов по банкротству?')
+    assert estimate_tokens('ФЗ-127') == 3
+
+    budget = AnswerTokenBudget(max_tokens=1000, min_tokens=100, percentile=90, headroom=1.25, min_samples=10)
+    for tokens in range(100, 300, 20):
+        budget.record('general', tokens, 1000)
+    # 90-й перцентиль 280 токенов с запасом 25%, вверх до 50
+    assert budget.max_tokens('general') == 350
+    assert budget.max_tokens('legal') == 1000  # истории нет - прежний лимит
+
+    budget.record('general', 350, 350)
+    assert budget.get_stats()['truncated'] == 1
+    assert budget.max_tokens('general') == 700
+    assert budget.min_tokens_for('general') == 700 and budget.min_tokens_for('legal') == 0
+
+    with mock_ai_service() as (_, ai_service):
+        short_prompt = ai_service._build_answer_messages('Что такое залог?', 'legal')[0]['content']
+        full_prompt = ai_service._build_answer_messages('Как вернуть задаток, если торги признаны несостоявшимися?',
+                                                        'legal')[0]['content']
+        assert estimate_tokens(short_prompt) * 2 < estimate_tokens(full_prompt)
+        assert short_prompt.endswith('нормативные акты.') and full_prompt.endswith('нормативные акты.')
+
+    print("✅ Лимит подстраивается под длину ответов, короткие вопросы - с коротким промптом")
+
+def main():
+    """Главная функция тестирования"""
+    print("🚀 Тестирование бюджета токенов ответа")
+    print("=" * 50)
+
+    try:
+        test_answer_token_budget()
+        print("\n✅ Все тесты пройдены успешно!")
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,88 @@
+"""
+Нормализация русскоязычных вопросов для ключей кэшей и статистики
+"""
+
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+# Служебные слова и вежливые обращения, не меняющие смысл вопроса.
+# Вопросительные слова (как, где, когда, сколько...) не входят:
+# "как купить" и "где купить" - разные вопросы.
+STOP_WORDS = frozenset('''
+    а без бы был была были было быть в вам вас ведь во вот все всё вы да даже
+    для до его ее её ей ему же за и из или им их к ко ли либо мне мной мы на
+    над не нее неё ней нет ни нибудь но ну о об один от по под при про с со
+    так также то тоже у уже хотя чтобы это этот эта эти я
+    пожалуйста подскажите скажите расскажите объясните здравствуйте добрый день
+'''.split())
+
+# Отрицания: входят в STOP_WORDS, но меняют смысл вопроса на противоположный
+NEGATION_WORDS = frozenset(('не', 'нет', 'ни', 'без'))
+
+# Окончания, отбрасываемые легким стеммером (длинные проверяются первыми)
+_ENDINGS = sorted('''
+    иями ями ами ого его ому ему ыми ими ией ешь ишь ать ять ить еть уть ость
+    ия ие ий ый ой ая яя ое ее ые ых их ую юю ом ем ам ям ах ях ов ев ей ью
+    ть ти ет ут ют ит ат ят им ал ил ла ли ло
+    а я о е ы и у ю ь й
+'''.split(), key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+
+# Окончания инфинитива: в вопросах глагол почти всегда в этой форме
+# ("как купить", "можно ли оспорить"), остальные значимые слова
+# считаются существительными и прочими именами
+_VERB_ENDINGS = ('ться', 'тись', 'чься', 'ть', 'ти', 'чь')
+
+def normalize_question(question: str) -> str:
+    """
+    Текст вопроса без различий в написании: Unicode NFKC, нижний регистр,
+    ё -> е, без знаков ударения, знаков препинания, эмодзи и лишних пробелов.
+    """
+    text = unicodedata.normalize('NFKC', question).lower().replace('ё', 'е')
+    # Отдельные знаки ударения разбили бы слово на части
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+    return ' '.join(_NON_WORD_RE.sub(' ', text).split())
+
+def stem(word: str) -> str:
+    """Легкий стемминг: отбрасывание типичного окончания, если остается основа"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+def is_verb(word: str) -> bool:
+    """Похоже ли слово на глагол (по окончанию инфинитива)"""
+    return len(word) > 3 and word.endswith(_VERB_ENDINGS)
+
+def content_words(question: str) -> List[str]:
+    """Значимые слова вопроса (без служебных)"""
+    return [word for word in normalize_question(question).split() if word not in STOP_WORDS]
+
+@lru_cache(maxsize=4096)
+def question_fingerprint(question: Optional[str]) -> Optional[str]:
+    """
+    Канонический отпечаток вопроса: отсортированные уникальные основы
+    значимых слов. Не зависит от регистра, пунктуации, эмодзи, порядка
+    слов, служебных слов и окончаний, поэтому "Как вернуть задаток?" и
+    "задаток как вернуть, подскажите" дают один отпечаток. Отпечаток
+    теряет отрицания и предлоги и годится только для группировки
+    статистики, но не для ключей кэшей ответов.
+    """
+    if question is None:
+        return None
+    stems = sorted({stem(word) for word in content_words(question)})
+    return ' '.join(stems) if stems else normalize_question(question)
+
+def question_key(question: str) -> str:
+    """
+    Ключ вопроса фиксированной длины (question_hash в faq_cache) для точных
+    совпадений. Строится по normalize_question, а не по отпечатку: отрицания,
+    предлоги и порядок слов сохраняются, поэтому "купить с залогом" и
+    "купить без залога" не делят один готовый ответ.
+    """
+    return hashlib.md5(normalize_question(question).encode()).hexdigest()
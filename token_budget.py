@@ -0,0 +1,132 @@
+"""
+Оценка числа токенов и подбор max_tokens для ответов по типам вопросов
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+from config import (
+    ANSWER_MAX_TOKENS,
+    ANSWER_MIN_TOKENS,
+    ANSWER_TOKENS_PERCENTILE,
+    ANSWER_TOKENS_HEADROOM,
+    ANSWER_TOKENS_MIN_SAMPLES,
+    ANSWER_TOKENS_WINDOW
+)
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+_PIECE_RE = re.compile(r'[а-яё]+|[a-z]+|\d+|[^\w\s]', re.IGNORECASE)
+_CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Оценка числа токенов Mistral для русскоязычного текста без токенизатора.
+
+    Кириллические слова делятся на токены примерно по 3 символа, латинские -
+    по 4, числа - по 3 цифры, каждый знак препинания - отдельный токен.
+    Пробелы отдельных токенов не дают.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif _CYRILLIC_RE.match(piece):
+            tokens += max(round(len(piece) / 3), 1)
+        elif piece.isalpha():
+            tokens += max(round(len(piece) / 4), 1)
+        else:
+            tokens += 1
+    return tokens
+
+class AnswerTokenBudget:
+    """
+    max_tokens для ответа по распределению длины прошлых ответов того же типа.
+
+    Для каждого типа вопроса хранятся последние window длин ответов
+    в токенах. Лимит - перцентиль percentile этих длин с запасом headroom,
+    округленный вверх до 50 и ограниченный [min_tokens, max_tokens]. Пока
+    замеров меньше min_samples, используется max_tokens. Ответ, уперевшийся
+    в лимит (обрезанный), поднимает нижнюю границу лимита этого типа
+    до удвоенного значения - одна обрезка почти не сдвигает перцентиль.
+    """
+
+    def __init__(self, max_tokens: int = ANSWER_MAX_TOKENS, min_tokens: int = ANSWER_MIN_TOKENS,
+                 percentile: float = ANSWER_TOKENS_PERCENTILE, headroom: float = ANSWER_TOKENS_HEADROOM,
+                 min_samples: int = ANSWER_TOKENS_MIN_SAMPLES, window: int = ANSWER_TOKENS_WINDOW):
+        self.max_tokens_limit = max_tokens
+        self.min_tokens = min_tokens
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+
+        self._lengths: Dict[str, Deque[int]] = {}
+        self._limits: Dict[str, int] = {}
+        self._floors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.truncated = 0
+
+    def preload(self, db_manager: DatabaseManager, question_types: Iterable[str]) -> int:
+        """Загрузка длин недавних ответов ИИ из таблицы requests"""
+        question_types = set(question_types)
+        samples = [(question_type, estimate_tokens(answer))
+                   for question_type, answer in db_manager.get_recent_answers(self.window * len(question_types))
+                   if question_type in question_types]
+        # Строки идут от новых к старым, в окно - в хронологическом порядке
+        for question_type, tokens in reversed(samples):
+            self._add(question_type, tokens)
+        if samples:
+            logger.info(f"Лимиты токенов ответов: {self.get_stats()['limits']}")
+        return len(samples)
+
+    def record(self, question_type: str, completion_tokens: int, max_tokens: int):
+        """Учет длины ответа; ответ длиной в лимит считается обрезанным"""
+        if completion_tokens >= max_tokens:
+            with self._lock:
+                self.truncated += 1
+                floor = min(max_tokens * 2, self.max_tokens_limit)
+                self._floors[question_type] = max(self._floors.get(question_type, 0), floor)
+                if question_type in self._limits:
+                    self._limits[question_type] = max(self._limits[question_type], floor)
+            logger.warning(f"Ответ типа {question_type} обрезан на {max_tokens} токенах")
+        self._add(question_type, completion_tokens)
+
+    def _add(self, question_type: str, tokens: int):
+        """Добавление замера и пересчет лимита типа"""
+        with self._lock:
+            lengths = self._lengths.setdefault(question_type, deque(maxlen=self.window))
+            lengths.append(tokens)
+            if len(lengths) < self.min_samples:
+                return
+            ordered = sorted(lengths)
+            index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+            limit = math.ceil(ordered[index] * self.headroom / 50) * 50
+            limit = max(limit, self.min_tokens, self._floors.get(question_type, 0))
+            self._limits[question_type] = min(limit, self.max_tokens_limit)
+
+    def min_tokens_for(self, question_type: str) -> int:
+        """Нижняя граница лимита типа после обрезанных ответов (0 - обрезок не было)"""
+        with self._lock:
+            return self._floors.get(question_type, 0)
+
+    def max_tokens(self, question_type: str) -> int:
+        """Лимит токенов для ответа на вопрос данного типа"""
+        with self._lock:
+            return self._limits.get(question_type, self.max_tokens_limit)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Текущие лимиты и число обрезанных ответов"""
+        with self._lock:
+            return {
+                'limits': dict(self._limits),
+                'samples': {question_type: len(lengths) for question_type, lengths in self._lengths.items()},
+                'truncated': self.truncated
+            }
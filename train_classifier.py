@@ -0,0 +1,109 @@
+"""
+Обучение локального классификатора вопросов на таблице requests
+
+Строит модели релевантности и типа вопроса, оценивает их на отложенной
+части выборки (точность, доля уверенных ответов, задержка предсказания),
+затем обучает на всех данных и сохраняет модель в CLASSIFIER_MODEL_PATH.
+Бот подхватывает модель при следующем запуске.
+
+Запуск: python train_classifier.py [путь_к_БД] [путь_к_модели]
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# Добавляем текущую директорию в путь
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import (
+    CLASSIFIER_MODEL_PATH,
+    CLASSIFIER_RELEVANCE_CONFIDENCE,
+    CLASSIFIER_TYPE_CONFIDENCE,
+    DATABASE_PATH
+)
+from database import DatabaseManager
+from local_classifier import NaiveBayesClassifier, QuestionClassifier
+from prompts import QUESTION_TYPE_KEYWORDS
+
+MIN_SAMPLES = 50  # Минимум примеров для обучения модели
+HOLDOUT_SHARE = 0.2  # Доля выборки для оценки
+QUESTION_TYPES = set(QUESTION_TYPE_KEYWORDS) | {'general'}
+
+def evaluate(model: NaiveBayesClassifier, texts, labels, threshold: float):
+    """Точность на всех примерах, на уверенных примерах и средняя задержка"""
+    correct = confident = confident_correct = 0
+    start = time.perf_counter()
+    predictions = [model.predict(text) for text in texts]
+    latency_us = (time.perf_counter() - start) * 1_000_000 / len(texts)
+
+    for (label, confidence), expected in zip(predictions, labels):
+        correct += label == expected
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += label == expected
+    return {
+        'accuracy': correct / len(labels),
+        'coverage': confident / len(labels),
+        'confident_accuracy': confident_correct / confident if confident else 0.0,
+        'latency_us': latency_us
+    }
+
+def train(name: str, samples, threshold: float):
+    """Оценка на отложенной части и обучение на всей выборке"""
+    classes = {label for _, label in samples}
+    if len(samples) < MIN_SAMPLES or len(classes) < 2:
+        print(f"⚠️ {name}: недостаточно данных ({len(samples)} примеров, классов: {len(classes)}), модель не обучена")
+        return None, None
+
+    random.Random(42).shuffle(samples)
+    split = int(len(samples) * (1 - HOLDOUT_SHARE))
+    train_part, holdout = samples[:split], samples[split:]
+
+    model = NaiveBayesClassifier.fit([q for q, _ in train_part], [label for _, label in train_part])
+    report = evaluate(model, [q for q, _ in holdout], [label for _, label in holdout], threshold)
+
+    print(f"📊 {name}: {len(train_part)} для обучения, {len(holdout)} для оценки")
+    print(f"   - Точность: {report['accuracy']:.1%}")
+    print(f"   - Уверенных ответов (>= {threshold}): {report['coverage']:.1%}, точность на них: {report['confident_accuracy']:.1%}")
+    print(f"   - Задержка предсказания: {report['latency_us']:.1f} мкс")
+
+    return NaiveBayesClassifier.fit([q for q, _ in samples], [label for _, label in samples]), report
+
+def main():
+    """Главная функция обучения"""
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DATABASE_PATH
+    model_path = sys.argv[2] if len(sys.argv) > 2 else CLASSIFIER_MODEL_PATH
+
+    db = DatabaseManager(db_path)
+    rows = db.get_labeled_requests()
+    db.close()
+    print(f"🚀 Обучение классификатора: {len(rows)} размеченных запросов из {db_path}")
+
+    relevance_samples = [(question, 'relevant' if is_relevant else 'irrelevant')
+                         for question, is_relevant, _ in rows]
+    type_samples = [(question, question_type) for question, is_relevant, question_type in rows
+                    if is_relevant and question_type in QUESTION_TYPES]
+
+    relevance, relevance_report = train('Релевантность', relevance_samples, CLASSIFIER_RELEVANCE_CONFIDENCE)
+    question_type, type_report = train('Тип вопроса', type_samples, CLASSIFIER_TYPE_CONFIDENCE)
+
+    if relevance is None and question_type is None:
+        print("❌ Модель не сохранена")
+        return False
+
+    classifier = QuestionClassifier(relevance, question_type, {
+        'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'samples': len(rows),
+        'relevance': relevance_report,
+        'question_type': type_report
+    })
+    classifier.save(model_path)
+    print(f"✅ Модель сохранена в {model_path} ({os.path.getsize(model_path) // 1024} КБ)")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)